@@ -90,6 +90,9 @@ DMOJ_STATS_SUBMISSION_RESULT_COLORS = {
     'ERR': '#ffa71c',
 }
 DMOJ_API_PAGE_SIZE = 1000
+# Contest scoreboards are cached, and updated as results change. This bounds how long changes to the users shown,
+# such as their rating colours and organizations, take to appear.
+DMOJ_SCOREBOARD_CACHE_TTL = 600
 
 MARKDOWN_STYLES = {}
 MARKDOWN_DEFAULT_STYLE = {}
@@ -490,6 +493,45 @@ BRIDGED_JUDGE_ADDRESS = [('localhost', 9999)]
 BRIDGED_JUDGE_PROXIES = None
 BRIDGED_DJANGO_ADDRESS = [('localhost', 9998)]
 BRIDGED_DJANGO_CONNECT = None
+# Number of idle persistent connections to the bridge each site process keeps around. 0 disables pooling,
+# opening a new connection for every request.
+BRIDGED_DJANGO_POOL_SIZE = 4
+# Seconds the site waits on the bridge to connect or reply before giving up on a request, or None to wait forever.
+BRIDGED_DJANGO_TIMEOUT = 30
+
+# Serve judges and the site from a single asyncio event loop instead of a thread per connection.
+# Packet handlers still run on a thread pool of BRIDGED_ASYNCIO_WORKERS threads (None for the Python default).
+BRIDGED_USE_ASYNCIO = False
+BRIDGED_ASYNCIO_WORKERS = None
+
+# The bridge buffers test case results in memory, writing them out once this many are pending or this many seconds
+# have passed, whenever a live update is sent to the submission's viewers, and always before the final result is
+# saved. If the bridge dies, buffered results of submissions still being graded are lost, but those submissions
+# are marked as internal errors on restart anyway. Set the size to 1 to write every test case immediately.
+BRIDGED_TEST_CASE_FLUSH_SIZE = 50
+BRIDGED_TEST_CASE_FLUSH_INTERVAL = 1.0
+
+# User points, problem statistics and contest results are updated after grading on this many worker threads.
+# Submissions by the same user to the same problem (and contest participation) within the window are handled
+# together, so that they trigger a single rescore.
+BRIDGED_POST_GRADING_WORKERS = 4
+BRIDGED_POST_GRADING_WINDOW = 1.0
+
+# Seconds the bridge caches problem limits for. The site tells the bridge when a problem is saved, so this only
+# bounds how long changes made directly in the database take to apply.
+BRIDGED_PROBLEM_CACHE_TTL = 600
+
+# How the bridge matches submissions with judges: 'least-load', 'problem-affinity' or 'weighted-fair'.
+# See judge/bridge/scheduling.py for the options each policy takes, and judge/bridge/scheduling_simulator.py to
+# compare them on a submission trace.
+BRIDGED_SCHEDULING_POLICY = 'least-load'
+BRIDGED_SCHEDULING_OPTIONS = {}
+
+# Path of a file in which the bridge journals the submissions it has not finished grading, which it then queues
+# again when restarted, instead of marking them as internal errors. With BRIDGED_QUEUE_JOURNAL_FSYNC, the journal
+# also survives the machine going down, at the cost of a disk flush for every submission accepted or graded.
+BRIDGED_QUEUE_JOURNAL = None
+BRIDGED_QUEUE_JOURNAL_FSYNC = False
 
 # Event Server configuration
 EVENT_DAEMON_USE = False
@@ -498,6 +540,17 @@ EVENT_DAEMON_GET = 'ws://localhost:9996/'
 EVENT_DAEMON_POLL = '/channels/'
 EVENT_DAEMON_KEY = None
 EVENT_DAEMON_AMQP_EXCHANGE = 'dmoj-events'
+# Post events from a background thread in batches, instead of waiting on the event daemon for each. At most
+# EVENT_DAEMON_QUEUE_SIZE events wait to be sent in each process, beyond which the oldest are dropped, so enabling
+# this trades losing events under load for never holding up requests.
+EVENT_DAEMON_ASYNC = False
+EVENT_DAEMON_QUEUE_SIZE = 10000
+EVENT_DAEMON_BATCH_SIZE = 100
+# Messages to these channels are held for EVENT_DAEMON_COALESCE_WINDOW seconds, and posted as one "batch" message
+# keeping only the last update of each submission, so that the submission list is not flooded at peak times. They
+# are always posted from the background thread, as with EVENT_DAEMON_ASYNC, even when it is disabled for the rest.
+EVENT_DAEMON_COALESCE_CHANNELS = ('submissions',)
+EVENT_DAEMON_COALESCE_WINDOW = 0.5
 EVENT_DAEMON_SUBMISSION_KEY = '6Sdmkx^%pk@GsifDfXcwX*Y7LRF%RGT8vmFpSxFBT$fwS7trc8raWfN#CSfQuKApx&$B#Gh2L7p%W!Ww'
 
 # Internationalization
@@ -208,6 +208,9 @@ urlpatterns = [
         url(r'^/clone$', contests.ContestClone.as_view(), name='contest_clone'),
         url(r'^/ranking/$', contests.ContestRanking.as_view(), name='contest_ranking'),
         url(r'^/ranking/ajax$', contests.contest_ranking_ajax, name='contest_ranking_ajax'),
+        url(r'^/ranking/json$', contests.contest_ranking_json, name='contest_ranking_json'),
+        url(r'^/ranking/export\.(?P<format>csv|ndjson)$', contests.contest_ranking_export,
+            name='contest_ranking_export'),
         url(r'^/join$', contests.ContestJoin.as_view(), name='contest_join'),
         url(r'^/leave$', contests.ContestLeave.as_view(), name='contest_leave'),
         url(r'^/stats$', contests.ContestStats.as_view(), name='contest_stats'),
@@ -292,6 +295,7 @@ urlpatterns = [
     url(r'^widgets/', include([
         url(r'^rejudge$', widgets.rejudge_submission, name='submission_rejudge'),
         url(r'^single_submission$', submission.single_submission, name='submission_single_query'),
+        url(r'^multiple_submissions$', submission.multiple_submissions, name='submission_multiple_query'),
         url(r'^submission_testcases$', submission.SubmissionTestCaseQuery.as_view(), name='submission_testcases_query'),
         url(r'^detect_timezone$', widgets.DetectTimezone.as_view(), name='detect_timezone'),
         url(r'^status-table$', status.status_table, name='status_table'),
@@ -12,8 +12,10 @@ from django.utils.translation import gettext_lazy as _, ungettext
 from reversion.admin import VersionAdmin
 
 from django_ace import AceWidget
+from judge.judgeapi import judge_submissions
 from judge.models import Contest, ContestProblem, ContestSubmission, Profile, Rating, Submission
 from judge.ratings import rate_contest
+from judge.utils.celery import redirect_to_task_status
 from judge.utils.views import NoBatchDeleteMixin
 from judge.widgets import AdminHeavySelect2MultipleWidget, AdminHeavySelect2Widget, AdminMartorWidget, \
     AdminSelect2MultipleWidget, AdminSelect2Widget
@@ -111,7 +113,7 @@ class ContestAdmin(NoBatchDeleteMixin, VersionAdmin):
     fieldsets = (
         (None, {'fields': ('key', 'name', 'organizers')}),
         (_('Settings'), {'fields': ('is_visible', 'use_clarifications', 'hide_problem_tags', 'hide_scoreboard',
-                                    'run_pretests_only', 'is_locked')}),
+                                    'frozen_last_minutes', 'run_pretests_only', 'is_locked')}),
         (_('Scheduling'), {'fields': ('start_time', 'end_time', 'time_limit')}),
         (_('Details'), {'fields': ('description', 'og_image', 'logo_override_image', 'tags', 'summary')}),
         (_('Format'), {'fields': ('format_name', 'format_config', 'problem_label_script')}),
@@ -254,13 +256,12 @@ class ContestAdmin(NoBatchDeleteMixin, VersionAdmin):
         ] + super(ContestAdmin, self).get_urls()
 
     def rejudge_view(self, request, contest_id, problem_id):
-        queryset = ContestSubmission.objects.filter(problem_id=problem_id).select_related('submission')
-        for model in queryset:
-            model.submission.judge(rejudge=True)
+        judged = judge_submissions(ContestSubmission.objects.filter(problem_id=problem_id)
+                                   .values_list('submission_id', flat=True), rejudge=True)
 
         self.message_user(request, ungettext('%d submission was successfully scheduled for rejudging.',
                                              '%d submissions were successfully scheduled for rejudging.',
-                                             len(queryset)) % len(queryset))
+                                             judged) % judged)
         return HttpResponseRedirect(reverse('admin:judge_contest_change', args=(contest_id,)))
 
     def rate_all_view(self, request):
@@ -280,9 +281,12 @@ class ContestAdmin(NoBatchDeleteMixin, VersionAdmin):
         contest = get_object_or_404(Contest, id=id)
         if not contest.is_rated:
             raise Http404()
-        with transaction.atomic():
-            contest.rate()
-        return HttpResponseRedirect(request.META.get('HTTP_REFERER', reverse('admin:judge_contest_changelist')))
+        from judge.tasks import rate_contests
+        status = rate_contests.delay(contest.key)
+        return redirect_to_task_status(
+            status, message=_('Rating %s and the contests after it...') % (contest.name,),
+            redirect=request.META.get('HTTP_REFERER', reverse('admin:judge_contest_changelist')),
+        )
 
     def get_form(self, request, obj=None, **kwargs):
         form = super(ContestAdmin, self).get_form(request, obj, **kwargs)
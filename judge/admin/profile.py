@@ -6,7 +6,7 @@ from django.utils.translation import gettext, gettext_lazy as _, ungettext
 from reversion.admin import VersionAdmin
 
 from django_ace import AceWidget
-from judge.models import Profile
+from judge.models import Profile, UserProblemPoints
 from judge.utils.views import NoBatchDeleteMixin
 from judge.widgets import AdminMartorWidget, AdminSelect2Widget
 
@@ -105,6 +105,7 @@ class ProfileAdmin(NoBatchDeleteMixin, VersionAdmin):
     def recalculate_points(self, request, queryset):
         count = 0
         for profile in queryset:
+            UserProblemPoints.rebuild(user_id=profile.id)
             profile.calculate_points()
             count += 1
         self.message_user(request, ungettext('%d user have scores recalculated.',
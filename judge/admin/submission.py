@@ -13,8 +13,9 @@ from django.utils.html import format_html
 from django.utils.translation import gettext, gettext_lazy as _, pgettext, ungettext
 
 from django_ace import AceWidget
+from judge.judgeapi import judge_submissions
 from judge.models import ContestParticipation, ContestProblem, ContestSubmission, Profile, Submission, \
-    SubmissionSource, SubmissionTestCase
+    SubmissionSource, SubmissionTestCase, UserProblemPoints
 from judge.utils.raw_sql import use_straight_join
 
 
@@ -164,9 +165,7 @@ class SubmissionAdmin(admin.ModelAdmin):
         if not request.user.has_perm('judge.edit_all_problem'):
             id = request.profile.id
             queryset = queryset.filter(Q(problem__authors__id=id) | Q(problem__curators__id=id))
-        judged = len(queryset)
-        for model in queryset:
-            model.judge(rejudge=True, batch_rejudge=True)
+        judged = judge_submissions(queryset.values_list('id', flat=True).distinct(), rejudge=True, batch_rejudge=True)
         self.message_user(request, ungettext('%d submission was successfully scheduled for rejudging.',
                                              '%d submissions were successfully scheduled for rejudging.',
                                              judged) % judged)
@@ -178,7 +177,7 @@ class SubmissionAdmin(admin.ModelAdmin):
                               level=messages.ERROR)
             return
         submissions = list(queryset.defer(None).select_related(None).select_related('problem')
-                           .only('points', 'case_points', 'case_total', 'problem__partial', 'problem__points'))
+                           .only('points', 'case_points', 'case_total', 'user', 'problem__partial', 'problem__points'))
         for submission in submissions:
             submission.points = round(submission.case_points / submission.case_total * submission.problem.points
                                       if submission.case_total else 0, 1)
@@ -187,6 +186,9 @@ class SubmissionAdmin(admin.ModelAdmin):
             submission.save()
             submission.update_contest()
 
+        for user_id, problem_id in {(submission.user_id, submission.problem_id) for submission in submissions}:
+            UserProblemPoints.rebuild(user_id=user_id, problem_id=problem_id)
+
         for profile in Profile.objects.filter(id__in=queryset.values_list('user_id', flat=True).distinct()):
             profile.calculate_points()
             cache.delete('user_complete:%d' % profile.id)
@@ -0,0 +1,182 @@
+import asyncio
+import concurrent.futures
+import logging
+import socket
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from judge.bridge.base_handler import Disconnect, size_pack
+
+logger = logging.getLogger('judge.bridge')
+
+# The PROXY protocol header is at most 107 bytes, including the CRLF.
+MAX_PROXY_HEADER_SIZE = 107
+
+
+class LoopTimer:
+    """A callback scheduled on the event loop, cancellable from any thread like threading.Timer."""
+
+    def __init__(self, server, delay, callback):
+        self._server = server
+        self._callback = callback
+        self._cancelled = False
+        server.loop.call_soon_threadsafe(server.loop.call_later, delay, self._fire)
+
+    def _fire(self):
+        if not self._cancelled:
+            self._server.run_in_executor(self._run)
+
+    def _run(self):
+        if not self._cancelled:
+            try:
+                self._callback()
+            except Exception:
+                logger.exception('Error in scheduled callback')
+
+    def cancel(self):
+        self._cancelled = True
+
+
+class AsyncRequest:
+    """Socket-like wrapper around an asyncio stream, for the parts of the socket API handlers use."""
+
+    def __init__(self, loop, writer):
+        self._loop = loop
+        self._writer = writer
+        self._timeout = None
+
+    def gettimeout(self):
+        return self._timeout
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def sendall(self, data):
+        # Like a blocking socket, wait until the peer takes the data, so that a slow peer slows the sender down
+        # rather than having its output pile up in memory. Handlers run on the thread pool, never on the loop.
+        future = asyncio.run_coroutine_threadsafe(self._write(data), self._loop)
+        try:
+            future.result(self._timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise socket.timeout('timed out')
+
+    async def _write(self, data):
+        self._writer.write(data)
+        await self._writer.drain()
+
+    def shutdown(self, how):
+        self._loop.call_soon_threadsafe(self._writer.close)
+
+
+class AsyncListener:
+    """Passed to handlers as their `server`, in place of a socketserver.TCPServer."""
+    drives_handlers = True
+
+    def __init__(self, server, address):
+        self.server = server
+        self.server_address = address
+
+    def call_later(self, delay, callback):
+        return LoopTimer(self.server, delay, callback)
+
+
+class AsyncServer:
+    """
+    Drop-in replacement for Server that multiplexes all connections on one asyncio event loop.
+
+    Packet framing, timeouts and timers run on the loop, while packet handlers, which do blocking database work,
+    run on a bounded thread pool. Packets from a single connection are still handled one at a time and in order.
+    """
+
+    def __init__(self, addresses, handler, max_workers=None):
+        self.addresses = addresses
+        self.handler = handler
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bridge')
+        self._servers = []
+        self._writers = set()
+        self._stopped = threading.Event()
+
+    def run_in_executor(self, func, *args):
+        return self.loop.run_in_executor(self.executor, partial(func, *args))
+
+    def serve_forever(self):
+        asyncio.set_event_loop(self.loop)
+        for address in self.addresses:
+            listener = AsyncListener(self, address)
+            self._servers.append(self.loop.run_until_complete(asyncio.start_server(
+                partial(self._serve_client, listener), address[0], address[1], reuse_address=True,
+            )))
+
+        try:
+            self.loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for server in self._servers:
+                server.close()
+                self.loop.run_until_complete(server.wait_closed())
+            # Closing the connections lets every client coroutine run its handler's on_disconnect and finish.
+            for writer in self._writers:
+                writer.close()
+            self.loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(self.loop), return_exceptions=True))
+            self.executor.shutdown()
+            self.loop.close()
+            self._stopped.set()
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._stopped.wait()
+
+    async def _serve_client(self, listener, reader, writer):
+        self._writers.add(writer)
+        handler = self.handler(AsyncRequest(self.loop, writer), writer.get_extra_info('peername'), listener)
+        await self.run_in_executor(handler.on_connect)
+        try:
+            await self._handle(handler, reader)
+        except Exception:
+            logger.exception('Error in base packet handling')
+        finally:
+            await self.run_in_executor(handler.on_disconnect)
+            writer.close()
+            self._writers.discard(writer)
+
+    async def _read(self, handler, reader, size):
+        try:
+            return await asyncio.wait_for(reader.readexactly(size), handler.timeout)
+        except asyncio.IncompleteReadError:
+            raise Disconnect()
+
+    async def _read_size(self, handler, reader):
+        return size_pack.unpack(await self._read(handler, reader, size_pack.size))[0]
+
+    async def _read_sized_packet(self, handler, reader, size):
+        handler.check_packet_size(size)
+        await self.run_in_executor(handler._on_packet, await self._read(handler, reader, size))
+
+    async def _handle(self, handler, reader):
+        try:
+            tag = await self._read_size(handler, reader)
+            handler._initial_tag = size_pack.pack(tag)
+            if handler.client_address[0] in handler.proxies and handler._initial_tag == b'PROX':
+                try:
+                    line = await asyncio.wait_for(reader.readuntil(b'\r\n'), handler.timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    raise Disconnect()
+                if len(line) + size_pack.size > MAX_PROXY_HEADER_SIZE:
+                    raise Disconnect()
+                handler.parse_proxy_protocol(handler._initial_tag + line[:-2])
+            else:
+                await self._read_sized_packet(handler, reader, tag)
+
+            while True:
+                await self._read_sized_packet(handler, reader, await self._read_size(handler, reader))
+        except Disconnect:
+            return
+        except zlib.error:
+            handler.handle_zlib_error()
+        except asyncio.TimeoutError:
+            handler.handle_timeout()
@@ -39,6 +39,9 @@ class Disconnect(Exception):
 class RequestHandlerMeta(type):
     def __call__(cls, *args, **kwargs):
         handler = super().__call__(*args, **kwargs)
+        if getattr(handler.server, 'drives_handlers', False):
+            # The server reads from the connection itself and feeds packets to the handler, see async_server.
+            return handler
         handler.on_connect()
         try:
             handler.handle()
@@ -68,12 +71,15 @@ class ZlibPacketHandler(metaclass=RequestHandlerMeta):
     def timeout(self, timeout):
         self.request.settimeout(timeout or None)
 
-    def read_sized_packet(self, size, initial=None):
+    def check_packet_size(self, size):
         if size > MAX_ALLOWED_PACKET_SIZE:
             logger.log(logging.WARNING if self._got_packet else logging.INFO,
                        'Disconnecting client due to too-large message size (%d bytes): %s', size, self.client_address)
             raise Disconnect()
 
+    def read_sized_packet(self, size, initial=None):
+        self.check_packet_size(size)
+
         buffer = []
         remainder = size
 
@@ -170,24 +176,30 @@ class ZlibPacketHandler(metaclass=RequestHandlerMeta):
         except Disconnect:
             return
         except zlib.error:
-            if self._got_packet:
-                logger.warning('Encountered zlib error during packet handling, disconnecting client: %s',
-                               self.client_address, exc_info=True)
-            else:
-                logger.info('Potentially wrong protocol (zlib error): %s: %r', self.client_address, self._initial_tag,
-                            exc_info=True)
+            self.handle_zlib_error()
         except socket.timeout:
-            if self._got_packet:
-                logger.info('Socket timed out: %s', self.client_address)
-                self.on_timeout()
-            else:
-                logger.info('Potentially wrong protocol: %s: %r', self.client_address, self._initial_tag)
+            self.handle_timeout()
         except socket.error as e:
             # When a gevent socket is shutdown, gevent cancels all waits, causing recv to raise cancel_wait_ex.
             if e.__class__.__name__ == 'cancel_wait_ex':
                 return
             raise
 
+    def handle_zlib_error(self):
+        if self._got_packet:
+            logger.warning('Encountered zlib error during packet handling, disconnecting client: %s',
+                           self.client_address, exc_info=True)
+        else:
+            logger.info('Potentially wrong protocol (zlib error): %s: %r', self.client_address, self._initial_tag,
+                        exc_info=True)
+
+    def handle_timeout(self):
+        if self._got_packet:
+            logger.info('Socket timed out: %s', self.client_address)
+            self.on_timeout()
+        else:
+            logger.info('Potentially wrong protocol: %s: %r', self.client_address, self._initial_tag)
+
     def send(self, data):
         compressed = zlib.compress(data.encode('utf-8'))
         self.request.sendall(size_pack.pack(len(compressed)) + compressed)
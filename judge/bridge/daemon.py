@@ -5,9 +5,14 @@ from functools import partial
 
 from django.conf import settings
 
+from judge.bridge.async_server import AsyncServer
 from judge.bridge.django_handler import DjangoHandler
+from judge.bridge.journal import QueueJournal
 from judge.bridge.judge_handler import JudgeHandler
 from judge.bridge.judge_list import JudgeList
+from judge.bridge.post_grading import PostGradingQueue
+from judge.bridge.problem_cache import ProblemCache
+from judge.bridge.scheduling import make_policy
 from judge.bridge.server import Server
 from judge.models import Judge, Submission
 
@@ -18,14 +23,65 @@ def reset_judges():
     Judge.objects.update(online=False, ping=None, load=None)
 
 
+# Number of submissions updated by each query when recovering the queue.
+RECOVERY_CHUNK_SIZE = 500
+
+
+def recover_queue(journal):
+    """
+    Return the submissions a previous bridge accepted but did not finish grading, in the order to queue them again,
+    and fail every other submission the database believes is being graded.
+
+    The journal is rewritten with only the submissions returned.
+    """
+    if journal is None:
+        Submission.objects.filter(status__in=Submission.IN_PROGRESS_GRADING_STATUS) \
+            .update(status='IE', result='IE', error=None)
+        return []
+
+    in_progress = set(Submission.objects.filter(status__in=Submission.IN_PROGRESS_GRADING_STATUS)
+                      .values_list('id', flat=True))
+    # Submissions graded after they were journaled, or aborted by the site, are not for this bridge anymore. The rest
+    # keep the order they were accepted in within each priority.
+    pending = sorted((submission for submission in journal.load() if submission[0] in in_progress),
+                     key=lambda submission: submission[5])
+    journal.rewrite(pending)
+
+    recovered = [submission[0] for submission in pending]
+    lost = sorted(in_progress.difference(recovered))
+    for start in range(0, len(recovered), RECOVERY_CHUNK_SIZE):
+        Submission.objects.filter(id__in=recovered[start:start + RECOVERY_CHUNK_SIZE]).update(status='QU')
+    for start in range(0, len(lost), RECOVERY_CHUNK_SIZE):
+        Submission.objects.filter(id__in=lost[start:start + RECOVERY_CHUNK_SIZE],
+                                  status__in=Submission.IN_PROGRESS_GRADING_STATUS) \
+            .update(status='IE', result='IE', error=None)
+    logger.info('Recovered %d submissions from the queue journal, failed %d', len(recovered), len(lost))
+    return pending
+
+
 def judge_daemon():
     reset_judges()
-    Submission.objects.filter(status__in=Submission.IN_PROGRESS_GRADING_STATUS) \
-        .update(status='IE', result='IE', error=None)
-    judges = JudgeList()
+    journal = None
+    if settings.BRIDGED_QUEUE_JOURNAL:
+        journal = QueueJournal(settings.BRIDGED_QUEUE_JOURNAL, fsync=settings.BRIDGED_QUEUE_JOURNAL_FSYNC)
+    pending = recover_queue(journal)
+    judges = JudgeList(make_policy(settings.BRIDGED_SCHEDULING_POLICY, **settings.BRIDGED_SCHEDULING_OPTIONS),
+                       journal=journal)
+    # No judge is connected yet, so these are all queued, and dispatched as judges connect.
+    judges.restore(pending)
+    post_grading = PostGradingQueue(settings.BRIDGED_POST_GRADING_WORKERS, settings.BRIDGED_POST_GRADING_WINDOW)
+    problem_cache = ProblemCache(settings.BRIDGED_PROBLEM_CACHE_TTL)
+
+    if settings.BRIDGED_USE_ASYNCIO:
+        make_server = partial(AsyncServer, max_workers=settings.BRIDGED_ASYNCIO_WORKERS)
+    else:
+        make_server = Server
 
-    judge_server = Server(settings.BRIDGED_JUDGE_ADDRESS, partial(JudgeHandler, judges=judges))
-    django_server = Server(settings.BRIDGED_DJANGO_ADDRESS, partial(DjangoHandler, judges=judges))
+    judge_server = make_server(settings.BRIDGED_JUDGE_ADDRESS, partial(JudgeHandler, judges=judges,
+                                                                       post_grading=post_grading,
+                                                                       problem_cache=problem_cache))
+    django_server = make_server(settings.BRIDGED_DJANGO_ADDRESS, partial(DjangoHandler, judges=judges,
+                                                                         problem_cache=problem_cache))
 
     threading.Thread(target=django_server.serve_forever).start()
     threading.Thread(target=judge_server.serve_forever).start()
@@ -45,3 +101,6 @@ def judge_daemon():
     finally:
         django_server.shutdown()
         judge_server.shutdown()
+        post_grading.shutdown()
+        if journal is not None:
+            journal.close()
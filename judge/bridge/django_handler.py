@@ -9,15 +9,19 @@ size_pack = struct.Struct('!I')
 
 
 class DjangoHandler(ZlibPacketHandler):
-    def __init__(self, request, client_address, server, judges):
+    def __init__(self, request, client_address, server, judges, problem_cache=None):
         super().__init__(request, client_address, server)
 
         self.handlers = {
             'submission-request': self.on_submission,
+            'submission-batch-request': self.on_submission_batch,
             'terminate-submission': self.on_termination,
             'disconnect-judge': self.on_disconnect_request,
+            'problem-update': self.on_problem_update,
+            'queue-stats': self.on_queue_stats,
         }
         self.judges = judges
+        self.problem_cache = problem_cache
 
     def send(self, data):
         super().send(json.dumps(data, separators=(',', ':')))
@@ -29,6 +33,13 @@ class DjangoHandler(ZlibPacketHandler):
         except Exception:
             logger.exception('Error in packet handling (Django-facing)')
             result = {'name': 'bad-request'}
+
+        if 'request-id' in packet:
+            # Pooled connections tag every request, and expect the connection to stay open for the next one.
+            result = dict(result or {}, **{'request-id': packet['request-id']})
+            self.send(result)
+            return
+
         self.send(result)
         raise Disconnect()
 
@@ -41,9 +52,20 @@ class DjangoHandler(ZlibPacketHandler):
         priority = data['priority']
         if not self.judges.check_priority(priority):
             return {'name': 'bad-request'}
-        self.judges.judge(id, problem, language, source, judge_id, priority)
+        self.judges.judge(id, problem, language, source, judge_id, priority, data.get('meta'))
         return {'name': 'submission-received', 'submission-id': id}
 
+    def on_submission_batch(self, data):
+        submissions = [
+            (item['submission-id'], item['problem-id'], item['language'], item['source'], item['judge-id'],
+             item['priority'], item.get('meta'))
+            for item in data['submissions']
+        ]
+        if not all(self.judges.check_priority(item[5]) for item in submissions):
+            return {'name': 'bad-request'}
+        self.judges.judge_many(submissions)
+        return {'name': 'submission-batch-received', 'submission-ids': [item[0] for item in submissions]}
+
     def on_termination(self, data):
         return {'name': 'submission-received', 'judge-aborted': self.judges.abort(data['submission-id'])}
 
@@ -52,6 +74,16 @@ class DjangoHandler(ZlibPacketHandler):
         force = data['force']
         self.judges.disconnect(judge_id, force=force)
 
+    def on_problem_update(self, data):
+        if self.problem_cache is not None:
+            self.problem_cache.invalidate(data['problem-id'])
+
+    def on_queue_stats(self, data):
+        size, users = self.judges.queue_stats()
+        # JSON keys are strings; submissions without a known user are reported under an empty key.
+        return {'name': 'queue-stats', 'size': size,
+                'users': {'' if user is None else str(user): depth for user, depth in users.items()}}
+
     def on_malformed(self, packet):
         logger.error('Malformed packet: %s', packet)
 
@@ -1,3 +1,5 @@
+import asyncio
+import json
 import os
 import socket
 import struct
@@ -23,15 +25,59 @@ def dezlibify(data, skip_head=True):
     return zlib.decompress(data).decode('utf-8')
 
 
+async def simulate_judge(name, rounds, interval, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def round_trip(packet):
+        data = json.dumps(packet, separators=(',', ':'))
+        start = time.monotonic()
+        writer.write(zlibify(data))
+        size = size_pack.unpack(await reader.readexactly(size_pack.size))[0]
+        assert dezlibify(await reader.readexactly(size), False) == data
+        latencies.append(time.monotonic() - start)
+
+    # Judges open with a large handshake listing every problem they have.
+    await round_trip({'name': 'handshake', 'id': name, 'key': 'x' * 64,
+                      'problems': [['problem%d' % i, 0] for i in range(2000)], 'executors': {}})
+    for _ in range(rounds):
+        await asyncio.sleep(interval)
+        await round_trip({'name': 'ping-response', 'when': time.time(), 'time': time.time(), 'load': 0.5})
+    writer.close()
+
+
+async def simulate_judges(judges, rounds, interval, latencies):
+    await asyncio.gather(*[simulate_judge('judge%d' % i, rounds, interval, latencies) for i in range(judges)])
+
+
+def load_test(judges, rounds, interval):
+    latencies = []
+    start = time.monotonic()
+    asyncio.run(simulate_judges(judges, rounds, interval, latencies))
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    print('%d judges, %d round trips in %.2fs' % (judges, len(latencies), elapsed))
+    for percentile in (50, 90, 99, 100):
+        index = min(len(latencies) - 1, len(latencies) * percentile // 100)
+        print('p%d latency: %.2fms' % (percentile, latencies[index] * 1000))
+
+
 def main():
     global host, port
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('-l', '--host', default='localhost')
     parser.add_argument('-p', '--port', default=9999, type=int)
+    parser.add_argument('-j', '--judges', type=int, help='simulate this many concurrent judges instead')
+    parser.add_argument('-r', '--rounds', type=int, default=10, help='ping round trips per simulated judge')
+    parser.add_argument('-i', '--interval', type=float, default=0.5, help='seconds between simulated pings')
     args = parser.parse_args()
     host, port = args.host, args.port
 
+    if args.judges:
+        load_test(args.judges, args.rounds, args.interval)
+        return
+
     print('Opening idle connection:', end=' ')
     s1 = open_connection()
     print('Success')
@@ -20,18 +20,20 @@ class EchoPacketHandler(ZlibPacketHandler):
 
 def main():
     import argparse
+    from judge.bridge.async_server import AsyncServer
     from judge.bridge.server import Server
 
     parser = argparse.ArgumentParser()
     parser.add_argument('-l', '--host', action='append')
     parser.add_argument('-p', '--port', type=int, action='append')
     parser.add_argument('-P', '--proxy', action='append')
+    parser.add_argument('-a', '--asyncio', action='store_true', help='use the asyncio server')
     args = parser.parse_args()
 
     class Handler(EchoPacketHandler):
         proxies = args.proxy or []
 
-    server = Server(list(zip(args.host, args.port)), Handler)
+    server = (AsyncServer if args.asyncio else Server)(list(zip(args.host, args.port)), Handler)
     server.serve_forever()
 
 
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger('judge.bridge')
+
+
+class QueueJournal(object):
+    """
+    Append-only file of the submissions the bridge has accepted but not finished grading, so that a restarted
+    bridge can queue them again instead of failing them.
+
+    Every line is a JSON array: ["queue", id, problem, language, source, judge_id, priority, meta] when a submission
+    is accepted, and ["done", id] once it is graded or dropped. Lines are written with a single write each, batches
+    included, so a crash can only tear the last line, which is ignored on load. Lines reach the operating system
+    before the bridge carries on, which survives the bridge being killed. Pass `fsync` to also survive the machine
+    going down, at the cost of a disk flush for every write.
+
+    On startup, the bridge loads the journal and rewrites it with the submissions it queues again, which also drops
+    any torn line. The file is rewritten the same way whenever finished submissions dominate it.
+    """
+
+    # Finished submissions tolerated in the file before it is compacted, unless unfinished ones outnumber them.
+    COMPACT_SIZE = 10000
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        # submission id -> queue record, in the order submissions were accepted
+        self._pending = {}
+        self._finished = 0
+        self._file = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def load(self):
+        """Read the journal, and return the unfinished submissions as judge arguments, in the order accepted."""
+        self._pending = {}
+        self._finished = 0
+        try:
+            with open(self.path, 'rb') as file:
+                for number, line in enumerate(file, 1):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.warning('Ignoring malformed line %d of queue journal %s', number, self.path)
+                        continue
+                    if record[0] == 'queue':
+                        # Queued again, as by a rejudge once graded: it now counts from this point.
+                        self._pending.pop(record[1], None)
+                        self._pending[record[1]] = record
+                    elif record[0] == 'done':
+                        self._pending.pop(record[1], None)
+        except FileNotFoundError:
+            pass
+        return [tuple(record[1:]) for record in self._pending.values()]
+
+    def rewrite(self, submissions):
+        """Replace the journal with only `submissions`, atomically."""
+        self._pending = {submission[0]: ['queue'] + list(submission) for submission in submissions}
+        self._compact()
+
+    def record(self, submissions):
+        """Record accepted submissions, each as the arguments to JudgeList.judge."""
+        records = [['queue'] + list(submission) for submission in submissions]
+        for record in records:
+            self._pending.pop(record[1], None)
+            self._pending[record[1]] = record
+        self._write(records)
+
+    def finish(self, id):
+        """Record that a submission is graded, or will not be."""
+        if self._pending.pop(id, None) is None:
+            return
+        self._write([['done', id]])
+        self._finished += 1
+        if self._finished > max(self.COMPACT_SIZE, len(self._pending)):
+            self._compact()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'ab', buffering=0)
+        return self._file
+
+    def _write(self, records):
+        if not records:
+            return
+        file = self._open()
+        file.write(b''.join(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n' for record in records))
+        if self.fsync:
+            os.fsync(file.fileno())
+
+    def _compact(self):
+        self.close()
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as file:
+            for record in self._pending.values():
+                file.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.path)
+        self._finished = 0
@@ -4,6 +4,7 @@ import logging
 import threading
 import time
 from collections import deque, namedtuple
+from contextlib import contextmanager
 from operator import itemgetter
 
 from django import db
@@ -12,7 +13,7 @@ from django.utils import timezone
 
 from judge import event_poster as event
 from judge.bridge.base_handler import ZlibPacketHandler, proxy_list
-from judge.caching import finished_submission
+from judge.bridge.post_grading import process_finished_submissions
 from judge.models import Judge, Language, LanguageLimit, Problem, RuntimeVersion, Submission, SubmissionTestCase
 
 logger = logging.getLogger('judge.bridge')
@@ -30,13 +31,50 @@ def _ensure_connection():
         db.connection.close()
 
 
+class TestCaseBuffer(object):
+    """
+    Write buffer for the test case results of the submission a judge is grading.
+
+    Test cases and the submission's current_testcase are written out once BRIDGED_TEST_CASE_FLUSH_SIZE cases are
+    pending or BRIDGED_TEST_CASE_FLUSH_INTERVAL seconds have passed since the last write, and always before the
+    submission's final result is saved. All cases stay in memory until then, so that the final result can be
+    computed without reading them back.
+    """
+
+    def __init__(self, submission):
+        self.submission = submission
+        self.cases = []
+        self._pending = []
+        self._current_testcase = None
+        self._last_flush = time.monotonic()
+
+    def add(self, cases, current_testcase):
+        self.cases += cases
+        self._pending += cases
+        self._current_testcase = current_testcase
+        if len(self._pending) >= settings.BRIDGED_TEST_CASE_FLUSH_SIZE or \
+                time.monotonic() - self._last_flush >= settings.BRIDGED_TEST_CASE_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self._current_testcase is not None:
+            Submission.objects.filter(id=self.submission).update(current_testcase=self._current_testcase)
+            self._current_testcase = None
+        if self._pending:
+            SubmissionTestCase.objects.bulk_create(self._pending)
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+
 class JudgeHandler(ZlibPacketHandler):
     proxies = proxy_list(settings.BRIDGED_JUDGE_PROXIES or [])
 
-    def __init__(self, request, client_address, server, judges):
+    def __init__(self, request, client_address, server, judges, post_grading=None, problem_cache=None):
         super().__init__(request, client_address, server)
 
         self.judges = judges
+        self.post_grading = post_grading
+        self.problem_cache = problem_cache
         self.handlers = {
             'grading-begin': self.on_grading_begin,
             'grading-end': self.on_grading_end,
@@ -54,6 +92,7 @@ class JudgeHandler(ZlibPacketHandler):
         }
         self._working = False
         self._no_response_job = None
+        self._ping_job = None
         self._problems = []
         self.executors = {}
         self.problems = {}
@@ -74,6 +113,7 @@ class JudgeHandler(ZlibPacketHandler):
 
         self._submission_cache_id = None
         self._submission_cache = {}
+        self._test_cases = None
 
     def on_connect(self):
         self.timeout = 15
@@ -82,6 +122,10 @@ class JudgeHandler(ZlibPacketHandler):
 
     def on_disconnect(self):
         self._stop_ping.set()
+        if self._ping_job:
+            self._ping_job.cancel()
+        if self._no_response_job:
+            self._no_response_job.cancel()
         if self._working:
             logger.error('Judge %s disconnected while handling submission %s', self.name, self._working)
         self.judges.remove(self)
@@ -91,6 +135,7 @@ class JudgeHandler(ZlibPacketHandler):
 
         json_log.info(self._make_json_log(action='disconnect', info='judge disconnected'))
         if self._working:
+            self._flush_test_cases(self._working)
             Submission.objects.filter(id=self._working).update(status='IE', result='IE', error='')
             json_log.error(self._make_json_log(sub=self._working, action='close', info='IE due to shutdown on grading'))
 
@@ -163,7 +208,7 @@ class JudgeHandler(ZlibPacketHandler):
         self.send({'name': 'handshake-success'})
         logger.info('Judge authenticated: %s (%s)', self.client_address, packet['id'])
         self.judges.register(self)
-        threading.Thread(target=self._ping_thread).start()
+        self._ping_job = self.server.call_later(0, self._ping_periodically)
         self._connected()
 
     def can_judge(self, problem, executor, judge_id=None):
@@ -173,6 +218,28 @@ class JudgeHandler(ZlibPacketHandler):
     def working(self):
         return bool(self._working)
 
+    def get_cached_submission_data(self, problem, language, meta):
+        # The site sends the per-submission fields along with the submission, so only the problem's limits are
+        # needed, and those are usually cached.
+        limits = self.problem_cache.get(problem, language)
+        if limits is None:
+            _ensure_connection()
+            try:
+                limits = self.problem_cache.load(problem, language)
+            except Problem.DoesNotExist:
+                return None
+
+        time, memory, short_circuit = limits
+        return SubmissionData(
+            time=time,
+            memory=memory,
+            short_circuit=short_circuit,
+            pretests_only=meta['pretests-only'],
+            contest_no=meta['in-contest'],
+            attempt_no=meta['attempt-no'],
+            user_id=meta['user'],
+        )
+
     def get_related_submission_data(self, submission):
         _ensure_connection()
 
@@ -216,10 +283,14 @@ class JudgeHandler(ZlibPacketHandler):
         else:
             self.send({'name': 'disconnect'})
 
-    def submit(self, id, problem, language, source):
-        data = self.get_related_submission_data(id)
+    def submit(self, id, problem, language, source, meta=None):
+        data = None
+        if meta is not None and self.problem_cache is not None:
+            data = self.get_cached_submission_data(problem, language, meta)
+        if data is None:
+            data = self.get_related_submission_data(id)
         self._working = id
-        self._no_response_job = threading.Timer(20, self._kill_if_no_response)
+        self._no_response_job = self.server.call_later(20, self._kill_if_no_response)
         self.send({
             'name': 'submission-request',
             'submission-id': id,
@@ -329,6 +400,7 @@ class JudgeHandler(ZlibPacketHandler):
                 status='G', is_pretested=packet['pretested'], current_testcase=1,
                 batch=False, judged_date=timezone.now()):
             SubmissionTestCase.objects.filter(submission_id=packet['submission-id']).delete()
+            self._test_cases = TestCaseBuffer(packet['submission-id'])
             event.post('sub_%s' % Submission.get_id_secret(packet['submission-id']), {'type': 'grading-begin'})
             self._post_update_submission(packet['submission-id'], 'grading-begin')
             json_log.info(self._make_json_log(packet, action='grading-begin'))
@@ -338,60 +410,67 @@ class JudgeHandler(ZlibPacketHandler):
 
     def on_grading_end(self, packet):
         logger.info('%s: Grading has ended on: %s', self.name, packet['submission-id'])
-        self._free_self(packet)
-        self.batch_id = None
-
-        try:
-            submission = Submission.objects.get(id=packet['submission-id'])
-        except Submission.DoesNotExist:
-            logger.warning('Unknown submission: %s', packet['submission-id'])
-            json_log.error(self._make_json_log(packet, action='grading-end', info='unknown submission'))
-            return
+        with self._free_self_after(packet):
+            self.batch_id = None
+            self._flush_test_cases(packet['submission-id'])
 
-        time = 0
-        memory = 0
-        points = 0.0
-        total = 0
-        status = 0
-        status_codes = ['SC', 'AC', 'WA', 'MLE', 'TLE', 'IR', 'RTE', 'OLE']
-        batches = {}  # batch number: (points, total)
-
-        for case in SubmissionTestCase.objects.filter(submission=submission):
-            time += case.time
-            if not case.batch:
-                points += case.points
-                total += case.total
+            try:
+                submission = Submission.objects.get(id=packet['submission-id'])
+            except Submission.DoesNotExist:
+                logger.warning('Unknown submission: %s', packet['submission-id'])
+                json_log.error(self._make_json_log(packet, action='grading-end', info='unknown submission'))
+                return
+
+            time = 0
+            memory = 0
+            points = 0.0
+            total = 0
+            status = 0
+            status_codes = ['SC', 'AC', 'WA', 'MLE', 'TLE', 'IR', 'RTE', 'OLE']
+            batches = {}  # batch number: (points, total)
+
+            if self._test_cases is not None and self._test_cases.submission == submission.id:
+                cases = self._test_cases.cases
             else:
-                if case.batch in batches:
-                    batches[case.batch][0] = min(batches[case.batch][0], case.points)
-                    batches[case.batch][1] = max(batches[case.batch][1], case.total)
+                cases = SubmissionTestCase.objects.filter(submission=submission)
+            self._test_cases = None
+
+            for case in cases:
+                time += case.time
+                if not case.batch:
+                    points += case.points
+                    total += case.total
                 else:
-                    batches[case.batch] = [case.points, case.total]
-            memory = max(memory, case.memory)
-            i = status_codes.index(case.status)
-            if i > status:
-                status = i
-
-        for i in batches:
-            points += batches[i][0]
-            total += batches[i][1]
-
-        points = round(points, 1)
-        total = round(total, 1)
-        submission.case_points = points
-        submission.case_total = total
-
-        problem = submission.problem
-        sub_points = round(points / total * problem.points if total > 0 else 0, 3)
-        if not problem.partial and sub_points != problem.points:
-            sub_points = 0
-
-        submission.status = 'D'
-        submission.time = time
-        submission.memory = memory
-        submission.points = sub_points
-        submission.result = status_codes[status]
-        submission.save()
+                    if case.batch in batches:
+                        batches[case.batch][0] = min(batches[case.batch][0], case.points)
+                        batches[case.batch][1] = max(batches[case.batch][1], case.total)
+                    else:
+                        batches[case.batch] = [case.points, case.total]
+                memory = max(memory, case.memory)
+                i = status_codes.index(case.status)
+                if i > status:
+                    status = i
+
+            for i in batches:
+                points += batches[i][0]
+                total += batches[i][1]
+
+            points = round(points, 1)
+            total = round(total, 1)
+            submission.case_points = points
+            submission.case_total = total
+
+            problem = submission.problem
+            sub_points = round(points / total * problem.points if total > 0 else 0, 3)
+            if not problem.partial and sub_points != problem.points:
+                sub_points = 0
+
+            submission.status = 'D'
+            submission.time = time
+            submission.memory = memory
+            submission.points = sub_points
+            submission.result = status_codes[status]
+            submission.save()
 
         json_log.info(self._make_json_log(
             packet, action='grading-end', time=time, memory=memory,
@@ -400,15 +479,11 @@ class JudgeHandler(ZlibPacketHandler):
             problem=problem.code, finish=True,
         ))
 
-        if problem.is_public and not problem.is_organization_private:
-            submission.user._updating_stats_only = True
-            submission.user.calculate_points()
-
-        problem._updating_stats_only = True
-        problem.update_stats()
-        submission.update_contest()
-
-        finished_submission(submission)
+        # Points, statistics and contest results are updated later, so that the judge can move on.
+        if self.post_grading is not None:
+            self.post_grading.submit(submission)
+        else:
+            process_finished_submissions([submission.id])
 
         event.post('sub_%s' % submission.id_secret, {
             'type': 'grading-end',
@@ -418,16 +493,15 @@ class JudgeHandler(ZlibPacketHandler):
             'total': float(problem.points),
             'result': submission.result,
         })
-        if hasattr(submission, 'contest'):
-            participation = submission.contest.participation
-            event.post('contest_%d' % participation.contest_id, {'type': 'update'})
         self._post_update_submission(submission.id, 'grading-end', done=True)
 
     def on_compile_error(self, packet):
         logger.info('%s: Submission failed to compile: %s', self.name, packet['submission-id'])
-        self._free_self(packet)
+        with self._free_self_after(packet):
+            updated = Submission.objects.filter(id=packet['submission-id']).update(status='CE', result='CE',
+                                                                                   error=packet['log'])
 
-        if Submission.objects.filter(id=packet['submission-id']).update(status='CE', result='CE', error=packet['log']):
+        if updated:
             event.post('sub_%s' % Submission.get_id_secret(packet['submission-id']), {
                 'type': 'compile-error',
                 'log': packet['log'],
@@ -456,10 +530,13 @@ class JudgeHandler(ZlibPacketHandler):
             raise ValueError('\n\n' + packet['message'])
         except ValueError:
             logger.exception('Judge %s failed while handling submission %s', self.name, packet['submission-id'])
-        self._free_self(packet)
 
         id = packet['submission-id']
-        if Submission.objects.filter(id=id).update(status='IE', result='IE', error=packet['message']):
+        with self._free_self_after(packet):
+            self._flush_test_cases(id)
+            updated = Submission.objects.filter(id=id).update(status='IE', result='IE', error=packet['message'])
+
+        if updated:
             event.post('sub_%s' % Submission.get_id_secret(id), {'type': 'internal-error'})
             self._post_update_submission(id, 'internal-error', done=True)
             json_log.info(self._make_json_log(packet, action='internal-error', message=packet['message'],
@@ -471,9 +548,11 @@ class JudgeHandler(ZlibPacketHandler):
 
     def on_submission_terminated(self, packet):
         logger.info('%s: Submission aborted: %s', self.name, packet['submission-id'])
-        self._free_self(packet)
+        with self._free_self_after(packet):
+            self._flush_test_cases(packet['submission-id'])
+            updated = Submission.objects.filter(id=packet['submission-id']).update(status='AB', result='AB')
 
-        if Submission.objects.filter(id=packet['submission-id']).update(status='AB', result='AB'):
+        if updated:
             event.post('sub_%s' % Submission.get_id_secret(packet['submission-id']), {'type': 'aborted-submission'})
             self._post_update_submission(packet['submission-id'], 'terminated', done=True)
             json_log.info(self._make_json_log(packet, action='aborted', finish=True, result='AB'))
@@ -504,10 +583,13 @@ class JudgeHandler(ZlibPacketHandler):
         updates = packet['cases']
         max_position = max(map(itemgetter('position'), updates))
 
-        if not Submission.objects.filter(id=id).update(current_testcase=max_position + 1):
-            logger.warning('Unknown submission: %s', id)
-            json_log.error(self._make_json_log(packet, action='test-case', info='unknown submission'))
-            return
+        # The submission is known to exist if grading began on this connection, otherwise check now.
+        if self._test_cases is None or self._test_cases.submission != id:
+            if not Submission.objects.filter(id=id).update(current_testcase=max_position + 1):
+                logger.warning('Unknown submission: %s', id)
+                json_log.error(self._make_json_log(packet, action='test-case', info='unknown submission'))
+                return
+            self._test_cases = TestCaseBuffer(id)
 
         bulk_test_case_updates = []
         for result in updates:
@@ -560,15 +642,17 @@ class JudgeHandler(ZlibPacketHandler):
         if id not in self.update_counter:
             self.update_counter[id] = (1, time.monotonic())
 
+        self._test_cases.add(bulk_test_case_updates, max_position + 1)
+
         if do_post:
+            # Clients reload the test cases when notified, so they must be written out first.
+            self._test_cases.flush()
             event.post('sub_%s' % Submission.get_id_secret(id), {
                 'type': 'test-case',
                 'id': max_position,
             })
             self._post_update_submission(id, state='test-case')
 
-        SubmissionTestCase.objects.bulk_create(bulk_test_case_updates)
-
     def on_malformed(self, packet):
         logger.error('%s: Malformed packet: %s', self.name, packet)
         json_log.exception(self._make_json_log(sub=self._working, info='malformed json packet'))
@@ -582,19 +666,31 @@ class JudgeHandler(ZlibPacketHandler):
         self.load = packet['load']
         self._update_ping()
 
-    def _free_self(self, packet):
+    def _flush_test_cases(self, id):
+        if self._test_cases is not None and self._test_cases.submission == id:
+            self._test_cases.flush()
+
+    @contextmanager
+    def _free_self_after(self, packet):
+        # Freeing the judge finishes its submission in the queue journal, so it must only happen once the result is
+        # saved. If saving fails, the submission is left in the journal, to be graded again by a restarted bridge.
+        try:
+            yield
+        except Exception:
+            self.judges.on_judge_free(self, packet['submission-id'], finish=False)
+            raise
         self.judges.on_judge_free(self, packet['submission-id'])
 
-    def _ping_thread(self):
+    def _ping_periodically(self):
+        if self._stop_ping.is_set():
+            return
         try:
-            while True:
-                self.ping()
-                if self._stop_ping.wait(10):
-                    break
+            self.ping()
         except Exception:
             logger.exception('Ping error in %s', self.name)
             self.close()
             raise
+        self._ping_job = self.server.call_later(10, self._ping_periodically)
 
     def _make_json_log(self, packet=None, sub=None, **kwargs):
         data = {
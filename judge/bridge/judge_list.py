@@ -1,48 +1,230 @@
+import heapq
 import logging
 from collections import namedtuple
+from itertools import count
 from operator import attrgetter
 from threading import RLock
 
-try:
-    from llist import dllist
-except ImportError:
-    from pyllist import dllist
+from judge.bridge.scheduling import LeastLoadPolicy
 
 logger = logging.getLogger('judge.bridge')
 
-PriorityMarker = namedtuple('PriorityMarker', 'priority')
+QueuedSubmission = namedtuple('QueuedSubmission', 'id problem language source judge_id priority sequence meta user tag')
+queue_order = attrgetter('tag', 'sequence')
+
+
+class QueueBucket(object):
+    """Entries of a SubmissionQueue sharing a bucket, as a heap in queue order, with removal in constant time."""
+
+    def __init__(self):
+        self._heap = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return (item[2] for item in sorted(self._heap) if item[2] is not None)
+
+    def push(self, entry):
+        item = [entry.tag, entry.sequence, entry]
+        heapq.heappush(self._heap, item)
+        self._size += 1
+        return item
+
+    def remove(self, item):
+        # Removed items are only marked, and dropped once they reach the top of the heap.
+        item[2] = None
+        self._size -= 1
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+
+    @property
+    def first(self):
+        return self._heap[0][2]
+
+
+class SubmissionQueue(object):
+    """
+    Queue of submissions waiting for a free judge.
+
+    Submissions are bucketed per priority by (problem, language), or by the judge name for submissions that
+    must run on a specific judge. Every bucket is ordered, and a queue order shared across buckets lets a free judge
+    only compare the heads of the buckets it can serve. This makes finding the next submission for a judge
+    proportional to the problems and executors involved, not the queue length.
+
+    Within a priority, users are queued fairly by start-time fair queuing, a close relative of deficit round robin:
+    every submission is tagged one past the later of its user's previous tag and the tag of the last submission
+    dispatched at that priority. Submissions are taken in tag order, so a user with many queued submissions gets
+    one in turn with everyone else, instead of holding up everyone who submitted after them. Submissions with the
+    same user keep their arrival order. A submission with no known user is queued as a user of its own, so that
+    such submissions do not share a single turn between them, but are queued in arrival order with everyone else.
+    """
+
+    def __init__(self, priorities):
+        self.priorities = priorities
+        self._sequence = count()
+        # priority -> problem -> language -> QueueBucket
+        self._buckets = [{} for _ in range(priorities)]
+        # priority -> judge name -> QueueBucket
+        self._targeted = [{} for _ in range(priorities)]
+        # submission id -> (bucket, heap item)
+        self._nodes = {}
+        # priority -> tag of the last submission dispatched
+        self._virtual_time = [0] * priorities
+        # priority -> flow -> tag of the flow's last queued submission, where a flow is a user, or the id of a
+        # submission with no known user
+        self._user_tags = [{} for _ in range(priorities)]
+        # user -> number of queued submissions
+        self._user_depths = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, id):
+        return id in self._nodes
+
+    def __iter__(self):
+        entries = (item[2] for _, item in self._nodes.values())
+        return iter(sorted(entries, key=attrgetter('priority', 'tag', 'sequence')))
+
+    def user_depths(self):
+        """Return the number of queued submissions of every user with any."""
+        return dict(self._user_depths)
+
+    @staticmethod
+    def _flow(id, user):
+        return user if user is not None else ('submission', id)
+
+    def push(self, id, problem, language, source, judge_id, priority, meta=None):
+        user = meta.get('user') if meta else None
+        flow = self._flow(id, user)
+        user_tags = self._user_tags[priority]
+        tag = max(self._virtual_time[priority], user_tags.get(flow, 0)) + 1
+        user_tags[flow] = tag
+        self._user_depths[user] = self._user_depths.get(user, 0) + 1
+
+        entry = QueuedSubmission(id, problem, language, source, judge_id, priority, next(self._sequence), meta, user,
+                                 tag)
+        if judge_id:
+            bucket = self._targeted[priority].setdefault(judge_id, QueueBucket())
+        else:
+            bucket = self._buckets[priority].setdefault(problem, {}).setdefault(language, QueueBucket())
+        self._nodes[id] = bucket, bucket.push(entry)
+        return entry
+
+    def remove(self, id, dispatched=False):
+        """Remove a submission from the queue. Pass `dispatched` if it was taken by a judge, not aborted."""
+        try:
+            bucket, item = self._nodes.pop(id)
+        except KeyError:
+            return None
+
+        entry = item[2]
+        bucket.remove(item)
+        if not bucket:
+            if entry.judge_id:
+                del self._targeted[entry.priority][entry.judge_id]
+            else:
+                languages = self._buckets[entry.priority][entry.problem]
+                del languages[entry.language]
+                if not languages:
+                    del self._buckets[entry.priority][entry.problem]
+
+        if dispatched:
+            self._virtual_time[entry.priority] = max(self._virtual_time[entry.priority], entry.tag)
+        self._user_depths[entry.user] -= 1
+        if not self._user_depths[entry.user]:
+            del self._user_depths[entry.user]
+        if entry.user is None:
+            # The flow of a submission with no known user ends with it.
+            self._user_tags[entry.priority].pop(self._flow(entry.id, None), None)
+        elif entry.user not in self._user_depths:
+            # Once the user has nothing queued, their next tag only depends on the virtual time.
+            for priority in range(self.priorities):
+                if self._user_tags[priority].get(entry.user, 0) <= self._virtual_time[priority]:
+                    self._user_tags[priority].pop(entry.user, None)
+        return entry
+
+    def next_for(self, judge):
+        """Return the first entry of the most urgent priority that `judge` can grade, without removing it."""
+        for priority in range(self.priorities):
+            best = min(self.heads_for(judge, priority), key=queue_order, default=None)
+            if best is not None:
+                return best
+        return None
+
+    def heads_for(self, judge, priority, problems=None):
+        """
+        Yield, for every bucket of `priority` with submissions `judge` can grade, the first such submission.
+
+        Any submission a judge can take next is at the head of its bucket, so scheduling policies only need to choose
+        among these. If `problems` is given, only buckets for those problems are considered.
+        """
+        index = self._buckets[priority]
+        if problems is not None:
+            index = {problem: index[problem] for problem in problems if problem in index}
+        for languages in self._matching(index, judge.problems):
+            for bucket in self._matching(languages, judge.executors):
+                yield bucket.first
+
+        # Submissions targeted at a judge are rare, so a scan of this judge's own bucket is acceptable.
+        targeted = self._targeted[priority].get(judge.name)
+        if targeted:
+            for entry in targeted:
+                if (problems is None or entry.problem in problems) and \
+                        judge.can_judge(entry.problem, entry.language, entry.judge_id):
+                    yield entry
+                    break
+
+    @staticmethod
+    def _matching(index, supported):
+        # Walk whichever side is smaller: the queued keys, or the keys the judge supports.
+        if len(index) <= len(supported):
+            return (value for key, value in index.items() if key in supported)
+        return (index[key] for key in supported if key in index)
 
 
 class JudgeList(object):
+    """
+    The connected judges, and the submissions they are grading or that wait for them.
+
+    If given a QueueJournal, every submission is recorded in it from when it is accepted until it is graded, so that
+    it can be restored into a new JudgeList if the bridge dies.
+    """
+
     priorities = 4
 
-    def __init__(self):
-        self.queue = dllist()
-        self.priority = [self.queue.append(PriorityMarker(i)) for i in range(self.priorities)]
+    def __init__(self, policy=None, journal=None):
+        self.policy = policy or LeastLoadPolicy()
+        self.queue = SubmissionQueue(self.priorities)
         self.judges = set()
-        self.node_map = {}
         self.submission_map = {}
+        self.journal = journal
         self.lock = RLock()
 
+    def _finish(self, id):
+        if self.journal is not None:
+            self.journal.finish(id)
+
     def _handle_free_judge(self, judge):
         with self.lock:
-            node = self.queue.first
-            while node:
-                if not isinstance(node.value, PriorityMarker):
-                    id, problem, language, source, judge_id = node.value
-                    if judge.can_judge(problem, language, judge_id):
-                        self.submission_map[id] = judge
-                        try:
-                            judge.submit(id, problem, language, source)
-                        except Exception:
-                            logger.exception('Failed to dispatch %d (%s, %s) to %s', id, problem, language, judge.name)
-                            self.judges.remove(judge)
-                            return
-                        logger.info('Dispatched queued submission %d: %s', id, judge.name)
-                        self.queue.remove(node)
-                        del self.node_map[id]
-                        break
-                node = node.next
+            entry = self.policy.select_submission(judge, self.queue)
+            if entry is None:
+                return
+
+            id, problem, language, source = entry.id, entry.problem, entry.language, entry.source
+            self.submission_map[id] = judge
+            try:
+                judge.submit(id, problem, language, source, entry.meta)
+            except Exception:
+                logger.exception('Failed to dispatch %d (%s, %s) to %s', id, problem, language, judge.name)
+                self.judges.remove(judge)
+                del self.submission_map[id]
+                return
+            logger.info('Dispatched queued submission %d: %s', id, judge.name)
+            self.queue.remove(id, dispatched=True)
+            self.policy.on_dispatch(judge, problem, language, entry.meta)
 
     def register(self, judge):
         with self.lock:
@@ -69,15 +251,19 @@ class JudgeList(object):
                     del self.submission_map[sub]
                 except KeyError:
                     pass
+                # The judge handler fails the submission it was grading.
+                self._finish(sub)
             self.judges.discard(judge)
 
     def __iter__(self):
         return iter(self.judges)
 
-    def on_judge_free(self, judge, submission):
+    def on_judge_free(self, judge, submission, finish=True):
         logger.info('Judge available after grading %d: %s', submission, judge.name)
         with self.lock:
             del self.submission_map[submission]
+            if finish:
+                self._finish(submission)
             judge._working = False
             self._handle_free_judge(judge)
 
@@ -88,46 +274,71 @@ class JudgeList(object):
                 self.submission_map[submission].abort()
                 return True
             except KeyError:
-                try:
-                    node = self.node_map[submission]
-                except KeyError:
-                    pass
-                else:
-                    self.queue.remove(node)
-                    del self.node_map[submission]
+                if self.queue.remove(submission) is not None:
+                    self._finish(submission)
                 return False
 
+    def queue_stats(self):
+        """Return the queue length, and the number of queued submissions per user, for monitoring."""
+        with self.lock:
+            return len(self.queue), self.queue.user_depths()
+
     def check_priority(self, priority):
         return 0 <= priority < self.priorities
 
-    def judge(self, id, problem, language, source, judge_id, priority):
+    def judge(self, id, problem, language, source, judge_id, priority, meta=None):
+        with self.lock:
+            self._record([(id, problem, language, source, judge_id, priority, meta)])
+            self._judge(id, problem, language, source, judge_id, priority, meta, self.judges)
+
+    def judge_many(self, submissions):
+        # Queue the whole batch under one lock acquisition, so free judges never see a partial batch.
+        with self.lock:
+            self._record(submissions)
+            self.restore(submissions)
+
+    def restore(self, submissions):
+        """Queue submissions as judge_many does, without recording them, as when they come from the journal."""
+        with self.lock:
+            idle = [judge for judge in self.judges if not judge.working]
+            for id, problem, language, source, judge_id, priority, meta in submissions:
+                # Only judges that were idle when the batch arrived can pick up anything from it.
+                idle = [judge for judge in idle if not judge.working and judge in self.judges]
+                self._judge(id, problem, language, source, judge_id, priority, meta, idle)
+
+    def _record(self, submissions):
+        if self.journal is not None:
+            # Submissions already being graded or queued are skipped by _judge, and must not be journaled again.
+            self.journal.record([submission for submission in submissions
+                                 if submission[0] not in self.submission_map and submission[0] not in self.queue])
+
+    def _judge(self, id, problem, language, source, judge_id, priority, meta, judges):
         with self.lock:
-            if id in self.submission_map or id in self.node_map:
+            if id in self.submission_map or id in self.queue:
                 # Already judging, don't queue again. This can happen during batch rejudges, rejudges should be
                 # idempotent.
                 return
 
             candidates = [
-                judge for judge in self.judges if not judge.working and judge.can_judge(problem, language, judge_id)
+                judge for judge in judges if not judge.working and judge.can_judge(problem, language, judge_id)
             ]
             if judge_id:
                 logger.info('Specified judge %s is%savailable', judge_id, ' ' if candidates else ' not ')
             else:
                 logger.info('Free judges: %d', len(candidates))
             if candidates:
-                # Schedule the submission on the judge reporting least load.
-                judge = min(candidates, key=attrgetter('load'))
+                judge = self.policy.select_judge(candidates, problem, language, meta)
                 logger.info('Dispatched submission %d to: %s', id, judge.name)
                 self.submission_map[id] = judge
                 try:
-                    judge.submit(id, problem, language, source)
+                    judge.submit(id, problem, language, source, meta)
                 except Exception:
                     logger.exception('Failed to dispatch %d (%s, %s) to %s', id, problem, language, judge.name)
                     self.judges.discard(judge)
-                    return self.judge(id, problem, language, source, judge_id, priority)
+                    del self.submission_map[id]
+                    candidates = [judge for judge in judges if judge in self.judges]
+                    return self._judge(id, problem, language, source, judge_id, priority, meta, candidates)
+                self.policy.on_dispatch(judge, problem, language, meta)
             else:
-                self.node_map[id] = self.queue.insert(
-                    (id, problem, language, source, judge_id),
-                    self.priority[priority],
-                )
+                self.queue.push(id, problem, language, source, judge_id, priority, meta)
                 logger.info('Queued submission: %d', id)
@@ -0,0 +1,70 @@
+import random
+import time
+from itertools import count
+
+from judge.bridge.judge_list import JudgeList
+
+
+class BenchmarkJudge:
+    def __init__(self, name, problems, executors):
+        self.name = name
+        self.problems = dict.fromkeys(problems)
+        self.executors = dict.fromkeys(executors)
+        self.load = 0
+        self._working = False
+
+    @property
+    def working(self):
+        return bool(self._working)
+
+    def can_judge(self, problem, executor, judge_id=None):
+        return problem in self.problems and executor in self.executors and (not judge_id or self.name == judge_id)
+
+    def submit(self, id, problem, language, source, meta=None):
+        self._working = id
+
+
+def benchmark(size, problems, languages, dispatches, seed=0):
+    rng = random.Random(seed)
+    judges = JudgeList()
+    ids = count(1)
+
+    # Most of the queue is for problems this judge does not have, which is the worst case for a linear scan.
+    for _ in range(size):
+        judges.queue.push(next(ids), 'unsupported%d' % rng.randrange(problems), rng.choice(languages), '',
+                          None, rng.randrange(judges.priorities))
+
+    judge = BenchmarkJudge('bench', ['p%d' % i for i in range(problems)], languages)
+    judges.judges.add(judge)
+
+    elapsed = 0
+    for _ in range(dispatches):
+        id = next(ids)
+        judges.queue.push(id, 'p%d' % rng.randrange(problems), rng.choice(languages), '', None,
+                          rng.randrange(judges.priorities))
+        start = time.perf_counter()
+        judges.update_problems(judge)
+        elapsed += time.perf_counter() - start
+        assert judge._working == id
+        judges.submission_map.pop(id, None)
+        judge._working = False
+    return elapsed / dispatches
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Measures the cost of dispatching from a queue of a given size.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('-p', '--problems', type=int, default=200)
+    parser.add_argument('-d', '--dispatches', type=int, default=2000)
+    args = parser.parse_args()
+
+    languages = ['PY3', 'CPP17', 'JAVA8', 'C', 'PYPY3', 'RUST', 'GO', 'KOTLIN']
+    for size in args.sizes:
+        cost = benchmark(size, args.problems, languages, args.dispatches)
+        print('%7d queued: %8.2f us/dispatch' % (size, cost * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django import db
+
+from judge.caching import finished_submission
+from judge.models import Submission, UserProblemPoints
+
+logger = logging.getLogger('judge.bridge')
+
+
+def process_finished_submissions(ids):
+    """
+    Bookkeeping after grading for submissions sharing a user, problem and contest participation.
+
+    The best result is folded in one submission at a time, but user points, problem statistics and contest results
+    are then recalculated once for the whole group.
+    """
+    submissions = list(Submission.objects.filter(id__in=ids).select_related('user', 'problem').order_by('id'))
+    if not submissions:
+        return
+
+    first_result = last_result = None
+    for submission in submissions:
+        old_result, last_result = UserProblemPoints.record(submission)
+        if first_result is None:
+            first_result = old_result
+        submission.update_contest(recompute=False)
+
+    submission = submissions[-1]
+    user, problem = submission.user, submission.problem
+    if first_result != last_result and problem.is_public and not problem.is_organization_private:
+        user._updating_stats_only = True
+        user.update_points()
+
+    if any(submission.was_rejudged for submission in submissions):
+        problem._updating_stats_only = True
+        problem.update_stats()
+    else:
+        problem.add_graded_submissions(submissions, new_solvers=int(last_result[2] and not first_result[2]))
+
+    finished_submission(submission)
+    if hasattr(submission, 'contest'):
+        participation = submission.contest.participation
+        participation.recompute_results()
+
+
+class PostGradingQueue(object):
+    """
+    Runs the bookkeeping for graded submissions on a bounded pool of worker threads, off the judge connections.
+
+    Submissions are grouped by user, problem and contest participation, and each group is processed `window` seconds
+    after its first submission arrives, so that a user submitting repeatedly in a contest causes one rescore rather
+    than one per submission. Groups with the same key are never processed at the same time: a group that comes due
+    while the previous one is still being processed waits for it, so that their recalculations apply in order.
+    Pending work only lives in memory: if the bridge dies, the statistics it would have updated are stale until the
+    next reconcile_points run.
+    """
+
+    def __init__(self, workers, window):
+        self.window = window
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='post-grading')
+        self.lock = threading.Condition()
+        # (user, problem, participation) -> (deadline, [submission ids]), in deadline order
+        self.pending = OrderedDict()
+        # keys of the groups being processed
+        self.running = set()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._dispatch_loop, name='post-grading-dispatch', daemon=True)
+        self._thread.start()
+
+    def submit(self, submission):
+        try:
+            participation = submission.contest.participation_id
+        except AttributeError:
+            participation = None
+        key = submission.user_id, submission.problem_id, participation
+
+        with self.lock:
+            if key in self.pending:
+                self.pending[key][1].append(submission.id)
+                return
+            self.pending[key] = (time.monotonic() + self.window, [submission.id])
+            self.lock.notify()
+
+    def _next_group(self):
+        """Return the key of the first group due and not being processed, or None and how long until one is due."""
+        now = time.monotonic()
+        for key, (deadline, ids) in self.pending.items():
+            if deadline > now and not self._stopped:
+                return None, deadline - now
+            if key not in self.running:
+                return key, None
+        return None, None
+
+    def _dispatch_loop(self):
+        with self.lock:
+            while not self._stopped or self.pending:
+                key, delay = self._next_group()
+                if key is None:
+                    self.lock.wait(delay)
+                    continue
+                deadline, ids = self.pending.pop(key)
+                self.running.add(key)
+                self.executor.submit(self._process, key, ids)
+
+    def _process(self, key, ids):
+        db.close_old_connections()
+        try:
+            process_finished_submissions(ids)
+        except Exception:
+            logger.exception('Failed to process finished submissions: %s', ids)
+        finally:
+            db.close_old_connections()
+            with self.lock:
+                self.running.discard(key)
+                self.lock.notify()
+
+    def shutdown(self):
+        """Process everything still pending right away, and wait for it to finish."""
+        with self.lock:
+            self._stopped = True
+            self.lock.notify()
+        self._thread.join()
+        self.executor.shutdown()
@@ -0,0 +1,48 @@
+import time
+from collections import namedtuple
+
+from judge.models import LanguageLimit, Problem
+
+ProblemLimits = namedtuple('ProblemLimits', 'time memory short_circuit language_limits expires')
+
+
+class ProblemCache(object):
+    """
+    Limits and short circuiting of problems, so that submissions can be dispatched without querying the database.
+
+    Entries are keyed by problem code, and hold the problem's language-specific limits keyed by language key. An
+    entry is dropped when the site reports a change to the problem with a problem-update packet, or after `ttl`
+    seconds, which covers changes made without going through the site.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        # problem code -> number of invalidations, so that a load racing with an invalidation is not cached
+        self._versions = {}
+
+    def get(self, problem, language):
+        """Return (time, memory, short_circuit) for a submission, or None if the problem is not cached."""
+        entry = self._entries.get(problem)
+        if entry is None or entry.expires < time.monotonic():
+            return None
+        time_limit, memory_limit = entry.language_limits.get(language, (entry.time, entry.memory))
+        return time_limit, memory_limit, entry.short_circuit
+
+    def load(self, problem, language):
+        """Like get, but loads the problem from the database first. Raises Problem.DoesNotExist."""
+        version = self._versions.get(problem, 0)
+        time_limit, memory_limit, short_circuit = (
+            Problem.objects.filter(code=problem).values_list('time_limit', 'memory_limit', 'short_circuit').get()
+        )
+        limits = LanguageLimit.objects.filter(problem__code=problem).values_list('language__key', 'time_limit',
+                                                                                 'memory_limit')
+        language_limits = {key: (key_time, key_memory) for key, key_time, key_memory in limits}
+        entry = ProblemLimits(time_limit, memory_limit, short_circuit, language_limits, time.monotonic() + self.ttl)
+        if self._versions.get(problem, 0) == version:
+            self._entries[problem] = entry
+        return language_limits.get(language, (time_limit, memory_limit)) + (short_circuit,)
+
+    def invalidate(self, problem):
+        self._versions[problem] = self._versions.get(problem, 0) + 1
+        self._entries.pop(problem, None)
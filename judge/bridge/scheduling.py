@@ -0,0 +1,134 @@
+import time
+from collections import OrderedDict, defaultdict
+from operator import attrgetter
+
+
+class SchedulingPolicy(object):
+    """
+    Decides which judge grades a submission, and which queued submission a free judge grades next.
+
+    JudgeList calls these with its lock held, so implementations need no locking of their own, but must be quick.
+    """
+
+    def select_judge(self, candidates, problem, language, meta):
+        """Pick one of `candidates`, the idle judges able to grade a new submission."""
+        raise NotImplementedError()
+
+    def select_submission(self, judge, queue):
+        """Pick the queued entry `judge` grades next from a SubmissionQueue, or None, without removing it."""
+        raise NotImplementedError()
+
+    def on_dispatch(self, judge, problem, language, meta):
+        """Called after a submission is sent to `judge`."""
+
+
+class LeastLoadPolicy(SchedulingPolicy):
+    """Sends new submissions to the judge reporting the least load, and free judges take the next in queue order."""
+
+    def select_judge(self, candidates, problem, language, meta):
+        return min(candidates, key=attrgetter('load'))
+
+    def select_submission(self, judge, queue):
+        return queue.next_for(judge)
+
+
+class ProblemAffinityPolicy(LeastLoadPolicy):
+    """
+    Prefers judges that recently graded the same problem, as its test data is likely still in their page cache.
+
+    Each judge remembers the last `history` problems it graded. A new submission goes to the least loaded judge among
+    those that remember its problem, if any. A free judge takes the first queued submission for a remembered problem
+    of the most urgent priority, unless the submission first in line has been passed over for more than `max_skip`
+    later arrivals, which bounds how long affinity can delay anyone.
+    """
+
+    def __init__(self, history=16, max_skip=32):
+        self.history = history
+        self.max_skip = max_skip
+        # judge name -> OrderedDict of recently graded problems, most recent last
+        self._recent = defaultdict(OrderedDict)
+
+    def select_judge(self, candidates, problem, language, meta):
+        warm = [judge for judge in candidates if problem in self._recent[judge.name]]
+        return super().select_judge(warm or candidates, problem, language, meta)
+
+    def select_submission(self, judge, queue):
+        oldest = queue.next_for(judge)
+        recent = self._recent[judge.name]
+        if oldest is None or oldest.problem in recent:
+            return oldest
+
+        warm = min(queue.heads_for(judge, oldest.priority, recent), key=attrgetter('tag', 'sequence'), default=None)
+        if warm is not None and warm.sequence - oldest.sequence <= self.max_skip:
+            return warm
+        return oldest
+
+    def on_dispatch(self, judge, problem, language, meta):
+        recent = self._recent[judge.name]
+        recent[problem] = None
+        recent.move_to_end(problem)
+        if len(recent) > self.history:
+            recent.popitem(last=False)
+
+
+class WeightedFairPolicy(LeastLoadPolicy):
+    """
+    Shares judges fairly between users submitting at the same priority.
+
+    Every user accumulates usage for each submission dispatched, divided by the user's weight (1 unless given in
+    `weights`), and decaying with a half-life of `half_life` seconds. A free judge takes, among the submissions it
+    could grade next at the most urgent priority, the one whose user has the least usage, so that a user with many
+    queued submissions does not hold up everyone else. As in the queue itself, each submission without a known user
+    counts as a user of its own, with no usage, so that such submissions are not held up by each other.
+    """
+
+    # Users whose usage has decayed to nothing are forgotten once this many are tracked.
+    PRUNE_SIZE = 10000
+
+    def __init__(self, weights=None, half_life=60, clock=time.monotonic):
+        self.weights = weights or {}
+        self.half_life = half_life
+        self.clock = clock
+        # user -> (usage, time of last update)
+        self._usage = {}
+
+    def usage(self, user):
+        if user is None:
+            return 0
+        usage, updated = self._usage.get(user, (0, None))
+        if not usage:
+            return 0
+        return usage * 0.5 ** ((self.clock() - updated) / self.half_life)
+
+    @staticmethod
+    def _user(meta):
+        return meta.get('user') if meta else None
+
+    def select_submission(self, judge, queue):
+        for priority in range(queue.priorities):
+            best = min(queue.heads_for(judge, priority),
+                       key=lambda entry: (self.usage(self._user(entry.meta)), entry.sequence), default=None)
+            if best is not None:
+                return best
+        return None
+
+    def on_dispatch(self, judge, problem, language, meta):
+        user = self._user(meta)
+        if user is None:
+            return
+        self._usage[user] = (self.usage(user) + 1 / self.weights.get(user, 1), self.clock())
+        if len(self._usage) > self.PRUNE_SIZE:
+            self._usage = {user: (self.usage(user), self.clock()) for user in self._usage if self.usage(user) > 0.01}
+
+
+POLICIES = {
+    'least-load': LeastLoadPolicy,
+    'problem-affinity': ProblemAffinityPolicy,
+    'weighted-fair': WeightedFairPolicy,
+}
+
+
+def make_policy(name, **kwargs):
+    if name not in POLICIES:
+        raise ValueError('Unknown scheduling policy: %s' % name)
+    return POLICIES[name](**kwargs)
@@ -0,0 +1,184 @@
+"""
+Replays a submission trace against the bridge's judge list under each scheduling policy, and reports how long
+submissions waited in the queue.
+
+A trace is a file with one JSON object per line, in order of arrival, with the keys:
+    time: arrival time in seconds
+    problem, language: problem code and language key
+    user: anything identifying the submitter
+    duration: seconds the submission takes to grade when the problem's data is in the judge's cache
+    priority: optional bridge priority, 1 (a normal submission) if absent
+Without a trace, a synthetic one is generated.
+"""
+import heapq
+import json
+import random
+from collections import OrderedDict, defaultdict, namedtuple
+from itertools import count
+
+from judge.bridge.judge_list import JudgeList
+from judge.bridge.scheduling import LeastLoadPolicy, ProblemAffinityPolicy, WeightedFairPolicy
+
+TraceEntry = namedtuple('TraceEntry', 'time problem language user duration priority')
+
+
+def load_trace(file):
+    trace = []
+    for line in file:
+        if line.strip():
+            data = json.loads(line)
+            trace.append(TraceEntry(float(data['time']), data['problem'], data['language'], data['user'],
+                                    float(data['duration']), int(data.get('priority', 1))))
+    return trace
+
+
+def generate_trace(size, rate, problems, users, seed=0):
+    """Poisson arrivals, with problem and user popularity both following a power law, like a contest's."""
+    rng = random.Random(seed)
+    languages = ['PY3', 'CPP17', 'JAVA8', 'C']
+    problem_weights = [1 / (i + 1) for i in range(problems)]
+    user_weights = [1 / (i + 1) ** 1.2 for i in range(users)]
+    durations = [rng.uniform(0.5, 8) for _ in range(problems)]
+
+    trace = []
+    time = 0
+    for _ in range(size):
+        time += rng.expovariate(rate)
+        problem = rng.choices(range(problems), problem_weights)[0]
+        trace.append(TraceEntry(time, 'p%d' % problem, rng.choice(languages),
+                                rng.choices(range(users), user_weights)[0], durations[problem], 1))
+    return trace
+
+
+class SimulatedJudge(object):
+    def __init__(self, simulation, name, cache_size):
+        self.simulation = simulation
+        self.name = name
+        self.problems = simulation.problems
+        self.executors = simulation.languages
+        self.load = 0
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self._working = False
+
+    @property
+    def working(self):
+        return bool(self._working)
+
+    def can_judge(self, problem, executor, judge_id=None):
+        return problem in self.problems and executor in self.executors and (not judge_id or self.name == judge_id)
+
+    def submit(self, id, problem, language, source, meta=None):
+        self._working = id
+        self.simulation.start(self, id)
+
+    def get_current_submission(self):
+        return self._working or None
+
+    def touch(self, problem):
+        """Mark the problem's data as cached, and return whether it already was."""
+        cached = problem in self.cache
+        self.cache[problem] = None
+        self.cache.move_to_end(problem)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return cached
+
+
+class Simulation(object):
+    def __init__(self, trace, policy, judges, cache_size, cold_penalty):
+        self.trace = trace
+        self.cold_penalty = cold_penalty
+        self.problems = {entry.problem for entry in trace}
+        self.languages = {entry.language for entry in trace}
+        self.now = 0
+        self.events = []
+        self._sequence = count()
+        self.waits = {}
+        self.cold_starts = 0
+
+        self.judge_list = JudgeList(policy)
+        for i in range(judges):
+            self.judge_list.judges.add(SimulatedJudge(self, 'judge%d' % i, cache_size))
+
+    def schedule(self, time, callback, *args):
+        heapq.heappush(self.events, (time, next(self._sequence), callback, args))
+
+    def arrive(self, id):
+        entry = self.trace[id - 1]
+        self.judge_list.judge(id, entry.problem, entry.language, '', None, entry.priority, {'user': entry.user})
+
+    def start(self, judge, id):
+        entry = self.trace[id - 1]
+        self.waits[id] = self.now - entry.time
+        duration = entry.duration
+        if not judge.touch(entry.problem):
+            duration += self.cold_penalty
+            self.cold_starts += 1
+        judge.load += duration
+        self.schedule(self.now + duration, self.finish, judge, id)
+
+    def finish(self, judge, id):
+        judge.load *= 0.9
+        self.judge_list.on_judge_free(judge, id)
+
+    def run(self):
+        # Submission ids are positions in the trace, starting from 1 like database ids.
+        for id, entry in enumerate(self.trace, 1):
+            self.schedule(entry.time, self.arrive, id)
+        while self.events:
+            self.now, _, callback, args = heapq.heappop(self.events)
+            callback(*args)
+        return self
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0
+
+
+def report(name, simulation):
+    waits = sorted(simulation.waits.values())
+    by_user = defaultdict(list)
+    for id, wait in simulation.waits.items():
+        by_user[simulation.trace[id - 1].user].append(wait)
+    # How long a typical submission of the worst treated user waits, which fair policies should keep low.
+    worst_user = max((percentile(sorted(values), 0.5) for values in by_user.values()), default=0)
+    print('%-18s %8.2f %8.2f %8.2f %8.2f %8.2f %10.2f %7.1f%%' % (
+        name, sum(waits) / len(waits) if waits else 0, percentile(waits, 0.5), percentile(waits, 0.9),
+        percentile(waits, 0.99), waits[-1] if waits else 0, worst_user,
+        100 * simulation.cold_starts / max(1, len(waits)),
+    ))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compares scheduling policies by replaying a submission trace.')
+    parser.add_argument('trace', nargs='?', type=argparse.FileType('r'),
+                        help='trace file, with one JSON object per line; a synthetic trace is used if omitted')
+    parser.add_argument('-j', '--judges', type=int, default=8)
+    parser.add_argument('-c', '--cache-size', type=int, default=8,
+                        help='number of problems whose data a judge keeps cached')
+    parser.add_argument('-p', '--cold-penalty', type=float, default=1.0,
+                        help='extra seconds to grade a problem whose data is not cached')
+    parser.add_argument('-n', '--size', type=int, default=20000, help='size of the synthetic trace')
+    parser.add_argument('-r', '--rate', type=float, default=1.2, help='submissions per second in the synthetic trace')
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace) if args.trace else generate_trace(args.size, args.rate, 60, 2000)
+    policies = {
+        'least-load': lambda clock: LeastLoadPolicy(),
+        'problem-affinity': lambda clock: ProblemAffinityPolicy(history=args.cache_size),
+        'weighted-fair': lambda clock: WeightedFairPolicy(clock=clock),
+    }
+
+    print('%d submissions, %d judges; waits in seconds' % (len(trace), args.judges))
+    print('%-18s %8s %8s %8s %8s %8s %10s %8s' % ('policy', 'mean', 'p50', 'p90', 'p99', 'max', 'worst user', 'cold'))
+    for name, make_policy in policies.items():
+        simulation = Simulation(trace, None, args.judges, args.cache_size, args.cold_penalty)
+        simulation.judge_list.policy = make_policy(lambda: simulation.now)
+        report(name, simulation.run())
+
+
+if __name__ == '__main__':
+    main()
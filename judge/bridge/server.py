@@ -5,6 +5,12 @@ from socketserver import TCPServer, ThreadingMixIn
 class ThreadingTCPListener(ThreadingMixIn, TCPServer):
     allow_reuse_address = True
 
+    def call_later(self, delay, callback):
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+        return timer
+
 
 class Server:
     def __init__(self, addresses, handler):
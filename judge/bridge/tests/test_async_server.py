@@ -0,0 +1,99 @@
+import socket
+import threading
+import zlib
+
+from django.test import SimpleTestCase
+
+from judge.bridge.async_server import AsyncServer
+from judge.bridge.base_handler import ZlibPacketHandler, size_pack
+
+
+class EchoHandler(ZlibPacketHandler):
+    flooded = None
+
+    def on_packet(self, data):
+        if data == 'flood me':
+            self.request.settimeout(0.5)
+            sent = 0
+            try:
+                for _ in range(64):
+                    self.request.sendall(b'x' * 1024 * 1024)
+                    sent += 1
+            except socket.timeout:
+                pass
+            EchoHandler.flooded = sent
+            return
+        if data == 'ping me':
+            self.server.call_later(0.01, lambda: self.send('pong'))
+        self.send(data)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class AsyncServerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.address = ('127.0.0.1', free_port())
+        self.server = AsyncServer([self.address], EchoHandler, max_workers=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.addCleanup(self.thread.join)
+        self.addCleanup(self.server.shutdown)
+
+    def connect(self):
+        for _ in range(100):
+            try:
+                sock = socket.create_connection(self.address, timeout=5)
+            except ConnectionRefusedError:
+                threading.Event().wait(0.05)
+            else:
+                self.addCleanup(sock.close)
+                return sock
+        self.fail('server did not start')
+
+    def send(self, sock, data):
+        data = zlib.compress(data.encode('utf-8'))
+        sock.sendall(size_pack.pack(len(data)) + data)
+
+    def recv_exactly(self, sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            self.assertTrue(chunk)
+            data += chunk
+        return data
+
+    def recv(self, sock):
+        size = size_pack.unpack(self.recv_exactly(sock, size_pack.size))[0]
+        return zlib.decompress(self.recv_exactly(sock, size)).decode('utf-8')
+
+    def test_echo(self):
+        sock = self.connect()
+        self.send(sock, 'hello')
+        self.send(sock, 'world')
+        self.assertEqual(self.recv(sock), 'hello')
+        self.assertEqual(self.recv(sock), 'world')
+
+    def test_timer(self):
+        sock = self.connect()
+        self.send(sock, 'ping me')
+        self.assertEqual(self.recv(sock), 'ping me')
+        self.assertEqual(self.recv(sock), 'pong')
+
+    def test_backpressure(self):
+        sock = self.connect()
+        self.send(sock, 'flood me')
+        for _ in range(100):
+            if EchoHandler.flooded is not None:
+                break
+            threading.Event().wait(0.05)
+        # A peer that does not read holds up the sender, instead of everything being buffered.
+        self.assertLess(EchoHandler.flooded, 64)
+
+    def test_bad_packet(self):
+        sock = self.connect()
+        sock.sendall(size_pack.pack(5) + b'hello')
+        self.assertEqual(sock.recv(1), b'')
@@ -0,0 +1,145 @@
+import socket
+import threading
+from functools import partial
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from judge import judgeapi
+from judge.bridge.django_handler import DjangoHandler
+from judge.bridge.judge_list import JudgeList
+from judge.bridge.problem_cache import ProblemCache
+from judge.bridge.server import Server
+from judge.bridge.tests.test_async_server import free_port
+
+
+def submission_packet(id, priority=1):
+    return {
+        'name': 'submission-request', 'submission-id': id, 'problem-id': 'aplusb', 'language': 'PY3',
+        'source': '', 'judge-id': None, 'priority': priority,
+    }
+
+
+class DjangoHandlerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.address = ('127.0.0.1', free_port())
+        self.judges = JudgeList()
+        self.problem_cache = ProblemCache(ttl=1000)
+        self.server = Server([self.address], partial(DjangoHandler, judges=self.judges,
+                                                     problem_cache=self.problem_cache))
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown)
+
+        judgeapi._pool = None
+        self.addCleanup(self.close_pool)
+
+    def close_pool(self):
+        if judgeapi._pool is not None:
+            for conn in judgeapi._pool._idle:
+                conn.close()
+        judgeapi._pool = None
+
+    def test_one_shot(self):
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.address, BRIDGED_DJANGO_POOL_SIZE=0):
+            self.assertEqual(judgeapi.judge_request(submission_packet(1)),
+                             {'name': 'submission-received', 'submission-id': 1})
+        self.assertIn(1, self.judges.queue)
+
+    def test_pipelined(self):
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.address, BRIDGED_DJANGO_POOL_SIZE=2):
+            results = judgeapi.judge_requests([submission_packet(i) for i in range(1, 6)] + [
+                submission_packet(6, priority=10),
+                {'name': 'terminate-submission', 'submission-id': 1},
+            ])
+            self.assertEqual(results[:5], [{'name': 'submission-received', 'submission-id': i} for i in range(1, 6)])
+            self.assertEqual(results[5], {'name': 'bad-request'})
+            self.assertEqual(results[6], {'name': 'submission-received', 'judge-aborted': False})
+            self.assertEqual([entry.id for entry in self.judges.queue], [2, 3, 4, 5])
+
+            # The connection goes back into the pool and is reused.
+            conn = judgeapi._pool._idle[0]
+            judgeapi.judge_request(submission_packet(7))
+            self.assertEqual(judgeapi._pool._idle, [conn])
+        self.assertIn(7, self.judges.queue)
+
+    def test_timeout(self):
+        stalled = socket.socket()
+        stalled.bind(('127.0.0.1', 0))
+        stalled.listen()
+        self.addCleanup(stalled.close)
+        with override_settings(BRIDGED_DJANGO_CONNECT=stalled.getsockname(), BRIDGED_DJANGO_POOL_SIZE=2,
+                               BRIDGED_DJANGO_TIMEOUT=0.1):
+            with self.assertRaises(socket.timeout):
+                judgeapi.judge_request(submission_packet(1))
+            self.assertEqual(judgeapi._pool._idle, [])
+
+    def closing_bridge(self):
+        # A bridge that reads a request, then hangs up without replying, counting the connections it accepted.
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        self.addCleanup(listener.close)
+        accepted = []
+
+        def serve():
+            while True:
+                try:
+                    conn, _ = listener.accept()
+                except OSError:
+                    return
+                accepted.append(conn)
+                conn.recv(65536)
+                conn.close()
+        threading.Thread(target=serve, daemon=True).start()
+        return listener.getsockname(), accepted
+
+    def test_not_resent(self):
+        address, accepted = self.closing_bridge()
+        with override_settings(BRIDGED_DJANGO_CONNECT=address, BRIDGED_DJANGO_POOL_SIZE=2):
+            with self.assertRaises(ValueError):
+                judgeapi.judge_request(submission_packet(1))
+            self.assertEqual(len(accepted), 1)
+            # Only packets that are safe to handle twice are sent again.
+            with self.assertRaises(ValueError):
+                judgeapi.judge_request({'name': 'queue-stats'})
+            self.assertEqual(len(accepted), 3)
+
+    def test_stale_connection(self):
+        address, accepted = self.closing_bridge()
+        stale = judgeapi.BridgeConnection(address)
+        stale.sock.sendall(b'hang up')
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.address, BRIDGED_DJANGO_POOL_SIZE=2):
+            judgeapi._get_pool()._idle.append(stale)
+            for _ in range(100):
+                if stale.is_stale():
+                    break
+                threading.Event().wait(0.01)
+            self.assertEqual(judgeapi.judge_request(submission_packet(1)),
+                             {'name': 'submission-received', 'submission-id': 1})
+            self.assertNotIn(stale, judgeapi._pool._idle)
+        self.assertIn(1, self.judges.queue)
+
+    def test_batch(self):
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.address, BRIDGED_DJANGO_POOL_SIZE=0):
+            packet = {'name': 'submission-batch-request', 'submissions': [submission_packet(i) for i in (3, 1, 2)]}
+            self.assertEqual(judgeapi.judge_request(packet),
+                             {'name': 'submission-batch-received', 'submission-ids': [3, 1, 2]})
+            packet['submissions'].append(submission_packet(4, priority=-1))
+            self.assertEqual(judgeapi.judge_request(packet), {'name': 'bad-request'})
+        self.assertEqual([entry.id for entry in self.judges.queue], [3, 1, 2])
+
+    def test_problem_update(self):
+        self.problem_cache._entries['aplusb'] = mock.Mock()
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.address, BRIDGED_DJANGO_POOL_SIZE=2):
+            judgeapi.update_problem(mock.Mock(code='aplusb'))
+            # Requests on a connection are handled in order, so the update is done once this is answered.
+            judgeapi.judge_request(submission_packet(1))
+        self.assertNotIn('aplusb', self.problem_cache._entries)
+
+    def test_queue_stats(self):
+        self.judges.judge(1, 'aplusb', 'PY3', '', None, 1, {'user': 5})
+        self.judges.judge(2, 'aplusb', 'PY3', '', None, 1)
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.address, BRIDGED_DJANGO_POOL_SIZE=0):
+            self.assertEqual(judgeapi.queue_stats(), (2, {5: 1, None: 1}))
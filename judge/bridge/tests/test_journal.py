@@ -0,0 +1,131 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+
+from django.test import SimpleTestCase, TestCase
+
+from judge.bridge.daemon import recover_queue
+from judge.bridge.journal import QueueJournal
+from judge.bridge.judge_list import JudgeList
+from judge.bridge.tests.test_judge_list import FakeJudge
+from judge.models import Language, Submission
+from judge.models.tests.util import CommonDataMixin, create_problem
+
+# Run by a bridge that is killed while submissions are being graded and queued.
+CRASHING_BRIDGE = '''
+import os, signal, sys
+from judge.bridge.journal import QueueJournal
+from judge.bridge.judge_list import JudgeList
+
+
+class Judge:
+    name = 'judge'
+    problems = {'a': None}
+    executors = {'PY3': None}
+    load = 0
+    _working = False
+
+    @property
+    def working(self):
+        return bool(self._working)
+
+    def can_judge(self, problem, executor, judge_id=None):
+        return problem in self.problems and executor in self.executors
+
+    def submit(self, id, problem, language, source, meta=None):
+        self._working = id
+
+    def get_current_submission(self):
+        return self._working or None
+
+
+judges = JudgeList(journal=QueueJournal(sys.argv[1]))
+judge = Judge()
+judges.register(judge)
+judges.judge(1, 'a', 'PY3', 'print(1)', None, 1, {'user': 1})
+judges.judge_many([(2, 'a', 'PY3', 'print(2)', None, 2, None), (3, 'a', 'PY3', 'print(3)', None, 1, {'user': 2}),
+                   (4, 'a', 'PY3', 'print(4)', None, 0, None), (5, 'a', 'PY3', 'print(5)', None, 1, None)])
+judges.abort(5)
+judges.on_judge_free(judge, 1)
+judges.judge(6, 'a', 'PY3', 'print(6)', None, 1, None)
+os.kill(os.getpid(), signal.SIGKILL)
+'''
+
+
+class QueueJournalTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'queue.journal')
+
+    def test_crash_recovery(self):
+        process = subprocess.run([sys.executable, '-c', CRASHING_BRIDGE, self.path],
+                                 cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
+        self.assertEqual(process.returncode, -signal.SIGKILL)
+
+        # 1 was graded and 5 aborted, while 4 was being graded when the bridge died.
+        journal = QueueJournal(self.path)
+        pending = journal.load()
+        self.assertEqual([submission[0] for submission in pending], [2, 3, 4, 6])
+        self.assertEqual(pending[1], (3, 'a', 'PY3', 'print(3)', None, 1, {'user': 2}))
+
+        pending.sort(key=lambda submission: submission[5])
+        journal.rewrite(pending)
+        judges = JudgeList(journal=journal)
+        judges.restore(pending)
+        judge = FakeJudge('judge', 'a', ['PY3'])
+        judges.register(judge)
+        for _ in range(4):
+            judges.on_judge_free(judge, judge._working)
+        self.assertEqual(judge.submitted, [4, 3, 6, 2])
+        self.assertEqual(QueueJournal(self.path).load(), [])
+
+    def test_torn_line(self):
+        journal = QueueJournal(self.path)
+        journal.record([(1, 'a', 'PY3', '', None, 1, None), (2, 'b', 'PY3', '', None, 1, None)])
+        journal.close()
+        with open(self.path, 'ab') as file:
+            file.write(b'["done",')
+        with self.assertLogs('judge.bridge', 'WARNING'):
+            self.assertEqual([submission[0] for submission in QueueJournal(self.path).load()], [1, 2])
+
+    def test_compact(self):
+        journal = QueueJournal(self.path)
+        journal.COMPACT_SIZE = 2
+        journal.record([(id, 'a', 'PY3', '', None, 1, None) for id in range(5)])
+        for id in range(3):
+            journal.finish(id)
+        with open(self.path) as file:
+            self.assertEqual(len(file.readlines()), 2)
+        journal.finish(3)
+        journal.record([(0, 'a', 'PY3', '', None, 1, None)])
+        self.assertEqual([submission[0] for submission in QueueJournal(self.path).load()], [4, 0])
+
+
+class RecoverQueueTestCase(CommonDataMixin, TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.journal = QueueJournal(os.path.join(self.directory, 'queue.journal'))
+
+        problem = create_problem(code='journal')
+        self.submissions = [
+            Submission.objects.create(user=self.users['normal'].profile, problem=problem,
+                                      language=Language.get_python3(), status=status)
+            for status in ('G', 'QU', 'P', 'D')
+        ]
+
+    def test_recover(self):
+        graded, queued, lost, done = (submission.id for submission in self.submissions)
+        self.journal.record([(done, 'journal', 'PY3', '', None, 1, None), (graded, 'journal', 'PY3', '', None, 1, None),
+                             (queued, 'journal', 'PY3', '', None, 0, None)])
+        self.journal.close()
+
+        pending = recover_queue(self.journal)
+        self.assertEqual([submission[0] for submission in pending], [queued, graded])
+        self.assertEqual(dict(Submission.objects.values_list('id', 'status')),
+                         {graded: 'QU', queued: 'QU', lost: 'IE', done: 'D'})
+        self.assertEqual(QueueJournal(self.journal.path).load(), pending)
@@ -0,0 +1,165 @@
+import json
+from unittest import mock
+
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from judge.bridge.judge_handler import JudgeHandler
+from judge.bridge.problem_cache import ProblemCache
+from judge.models import Language, LanguageLimit, Submission, SubmissionTestCase, UserProblemPoints
+from judge.models.tests.util import CommonDataMixin, create_problem
+
+
+class FakeServer:
+    drives_handlers = True
+    server_address = ('127.0.0.1', 9999)
+
+    def call_later(self, delay, callback):
+        return mock.Mock()
+
+
+def make_handler(**kwargs):
+    handler = JudgeHandler(mock.Mock(), ('127.0.0.1', 12345), FakeServer(), judges=mock.Mock(), **kwargs)
+    handler.name = 'judge'
+    return handler
+
+
+def test_case_packet(id, positions, status=0):
+    return {
+        'name': 'test-case-status', 'submission-id': id, 'cases': [{
+            'position': position, 'status': status, 'time': 0.5, 'memory': 1024, 'points': 1, 'total-points': 1,
+            'output': '', 'feedback': '',
+        } for position in positions],
+    }
+
+
+@override_settings(BRIDGED_TEST_CASE_FLUSH_SIZE=4, BRIDGED_TEST_CASE_FLUSH_INTERVAL=1000)
+class JudgeHandlerTestCase(CommonDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(self):
+        super().setUpTestData()
+        self.submission = Submission.objects.create(
+            user=self.users['normal'].profile,
+            problem=create_problem(code='bridged', points=10),
+            language=Language.get_python3(),
+        )
+
+    def setUp(self):
+        self.handler = make_handler()
+        self.handler.on_grading_begin({'name': 'grading-begin', 'submission-id': self.submission.id,
+                                       'pretested': False})
+
+    def test_buffered_grading(self):
+        handler = self.handler
+        id = self.submission.id
+
+        # Live updates are rate limited to 5 per interval, and flush the buffer when they go out.
+        for position in range(1, 7):
+            handler.on_test_case(test_case_packet(id, [position]))
+        self.assertEqual(SubmissionTestCase.objects.filter(submission_id=id).count(), 5)
+        self.assertEqual(Submission.objects.get(id=id).current_testcase, 6)
+
+        # Otherwise, they are flushed when enough are pending.
+        handler.on_test_case(test_case_packet(id, [7, 8]))
+        self.assertEqual(SubmissionTestCase.objects.filter(submission_id=id).count(), 5)
+        handler.on_test_case(test_case_packet(id, [9, 10], status=1))
+        self.assertEqual(SubmissionTestCase.objects.filter(submission_id=id).count(), 10)
+        self.assertEqual(Submission.objects.get(id=id).current_testcase, 11)
+
+        handler.on_test_case(test_case_packet(id, [11]))
+        with CaptureQueriesContext(connection) as queries:
+            handler.on_grading_end({'name': 'grading-end', 'submission-id': id})
+        # Totals are computed from the buffer, without reading the test cases back.
+        self.assertFalse([query for query in queries
+                          if query['sql'].startswith('SELECT') and 'judge_submissiontestcase' in query['sql']])
+
+        submission = Submission.objects.get(id=id)
+        self.assertEqual(submission.test_cases.count(), 11)
+        self.assertEqual(submission.status, 'D')
+        self.assertEqual(submission.result, 'WA')
+        self.assertEqual(submission.case_points, 11)
+        self.assertEqual(submission.time, 5.5)
+        self.assertEqual(submission.points, 10)
+        self.assertEqual(UserProblemPoints.objects.get(user=submission.user, problem=submission.problem).result,
+                         (10, False, False))
+
+    def test_flushed_on_abort(self):
+        id = self.submission.id
+        self.handler.on_test_case(test_case_packet(id, [1]))
+        self.handler.update_counter[id] = (100, float('inf'))
+        self.handler.on_test_case(test_case_packet(id, [2]))
+        self.assertEqual(SubmissionTestCase.objects.filter(submission_id=id).count(), 1)
+        self.handler.on_submission_terminated({'name': 'submission-terminated', 'submission-id': id})
+        self.assertEqual(SubmissionTestCase.objects.filter(submission_id=id).count(), 2)
+
+    def record_free(self):
+        # What was saved of the submission when the judge was freed, and its submission finished in the journal.
+        freed = []
+        self.handler.judges.on_judge_free.side_effect = lambda judge, id, finish=True: freed.append((
+            Submission.objects.get(id=id).status, SubmissionTestCase.objects.filter(submission_id=id).count(), finish,
+        ))
+        return freed
+
+    def test_freed_after_saving(self):
+        id = self.submission.id
+        for name, packet, status in (
+            ('grading-end', {}, 'D'),
+            ('internal-error', {'message': 'oops'}, 'IE'),
+            ('submission-terminated', {}, 'AB'),
+        ):
+            with self.subTest(name=name):
+                SubmissionTestCase.objects.filter(submission_id=id).delete()
+                self.setUp()
+                freed = self.record_free()
+                self.handler.on_test_case(test_case_packet(id, [1, 2]))
+                with self.assertLogs('judge.bridge'):
+                    self.handler.on_packet(json.dumps(dict(packet, name=name, **{'submission-id': id})))
+                self.assertEqual(freed, [(status, 2, True)])
+
+    def test_freed_on_failure(self):
+        freed = self.record_free()
+        with mock.patch.object(Submission, 'save', side_effect=DatabaseError), self.assertLogs('judge.bridge'), \
+                self.assertLogs('judge.json.bridge'):
+            self.handler.on_packet(json.dumps({'name': 'grading-end', 'submission-id': self.submission.id}))
+        # The submission is left in the journal, to be graded again.
+        self.assertEqual(freed, [('G', 0, False)])
+
+
+class SubmitTestCase(CommonDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(self):
+        super().setUpTestData()
+        self.problem = create_problem(code='cached_limits', time_limit=2, memory_limit=1024)
+        LanguageLimit.objects.create(problem=self.problem, language=Language.get_python3(), time_limit=5,
+                                     memory_limit=2048)
+        self.submission = Submission.objects.create(
+            user=self.users['normal'].profile, problem=self.problem, language=Language.get_python3(),
+        )
+
+    def setUp(self):
+        self.cache = ProblemCache(ttl=1000)
+        self.handler = make_handler(problem_cache=self.cache)
+        self.handler.send = mock.Mock()
+        self.meta = {'pretests-only': False, 'in-contest': None, 'attempt-no': 3, 'user': 1}
+
+    def sent(self):
+        packet = self.handler.send.call_args[0][0]
+        return packet['time-limit'], packet['memory-limit'], packet['meta']
+
+    def test_cached(self):
+        self.handler.submit(self.submission.id, 'cached_limits', 'PY3', '', self.meta)
+        self.assertEqual(self.sent(), (5, 2048, self.meta))
+
+        with self.assertNumQueries(0):
+            self.handler.submit(self.submission.id, 'cached_limits', 'CPP17', '', self.meta)
+        self.assertEqual(self.sent(), (2, 1024, self.meta))
+
+        self.cache.invalidate('cached_limits')
+        self.assertIsNone(self.cache.get('cached_limits', 'PY3'))
+
+    def test_without_meta(self):
+        self.handler.submit(self.submission.id, 'cached_limits', 'PY3', '')
+        self.assertEqual(self.sent(), (5, 2048, {
+            'pretests-only': False, 'in-contest': None, 'attempt-no': 1, 'user': self.users['normal'].profile.id,
+        }))
@@ -0,0 +1,149 @@
+from django.test import SimpleTestCase
+
+from judge.bridge.judge_list import JudgeList, SubmissionQueue
+
+
+class FakeJudge:
+    def __init__(self, name, problems, executors, load=0):
+        self.name = name
+        self.problems = dict.fromkeys(problems)
+        self.executors = dict.fromkeys(executors)
+        self.load = load
+        self._working = False
+        self.submitted = []
+
+    @property
+    def working(self):
+        return bool(self._working)
+
+    def can_judge(self, problem, executor, judge_id=None):
+        return problem in self.problems and executor in self.executors and (not judge_id or self.name == judge_id)
+
+    def submit(self, id, problem, language, source, meta=None):
+        self._working = id
+        self.submitted.append(id)
+
+    def get_current_submission(self):
+        return self._working or None
+
+    def abort(self):
+        pass
+
+
+class SubmissionQueueTestCase(SimpleTestCase):
+    def setUp(self):
+        self.queue = SubmissionQueue(4)
+        self.judge = FakeJudge('judge', ('a', 'b'), ('PY3', 'CPP17'))
+
+    def pop(self):
+        entry = self.queue.next_for(self.judge)
+        if entry is not None:
+            self.queue.remove(entry.id, dispatched=True)
+            return entry.id
+
+    def test_fifo_within_priority(self):
+        self.queue.push(1, 'a', 'PY3', '', None, 1)
+        self.queue.push(2, 'b', 'CPP17', '', None, 1)
+        self.queue.push(3, 'a', 'CPP17', '', None, 1)
+        self.queue.push(4, 'a', 'PY3', '', None, 1)
+        self.assertEqual([self.pop() for _ in range(5)], [1, 2, 3, 4, None])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_priority_order(self):
+        self.queue.push(1, 'a', 'PY3', '', None, 3)
+        self.queue.push(2, 'a', 'PY3', '', None, 1)
+        self.queue.push(3, 'b', 'PY3', '', None, 0)
+        self.assertEqual([self.pop() for _ in range(3)], [3, 2, 1])
+
+    def test_unsupported_skipped(self):
+        self.queue.push(1, 'c', 'PY3', '', None, 0)
+        self.queue.push(2, 'a', 'JAVA8', '', None, 0)
+        self.queue.push(3, 'b', 'PY3', '', None, 2)
+        self.assertEqual(self.pop(), 3)
+        self.assertIsNone(self.pop())
+        self.assertEqual(len(self.queue), 2)
+
+    def test_targeted(self):
+        self.queue.push(1, 'a', 'PY3', '', 'other', 0)
+        self.queue.push(2, 'a', 'PY3', '', None, 0)
+        self.queue.push(3, 'c', 'PY3', '', 'judge', 0)
+        self.queue.push(4, 'b', 'PY3', '', 'judge', 0)
+        self.queue.push(5, 'a', 'PY3', '', None, 0)
+        self.assertEqual([self.pop() for _ in range(4)], [2, 4, 5, None])
+        self.assertIn(1, self.queue)
+        self.assertIn(3, self.queue)
+
+    def test_remove(self):
+        self.queue.push(1, 'a', 'PY3', '', None, 0)
+        self.queue.push(2, 'a', 'PY3', '', None, 0)
+        self.assertEqual(self.queue.remove(1).id, 1)
+        self.assertIsNone(self.queue.remove(1))
+        self.assertEqual([self.pop() for _ in range(2)], [2, None])
+
+    def test_fair_between_users(self):
+        for id in range(1, 5):
+            self.queue.push(id, 'a', 'PY3', '', None, 1, {'user': 'flood'})
+        self.queue.push(5, 'b', 'PY3', '', None, 1, {'user': 'other'})
+        self.assertEqual(self.queue.user_depths(), {'flood': 4, 'other': 1})
+        self.assertEqual(self.pop(), 1)
+        # Someone arriving after a flood waits behind one of its submissions, not all of them.
+        self.queue.push(6, 'a', 'CPP17', '', None, 1, {'user': 'late'})
+        self.assertEqual([entry.id for entry in self.queue], [5, 2, 6, 3, 4])
+
+    def test_unknown_users_apart(self):
+        for id in range(1, 4):
+            self.queue.push(id, 'a', 'PY3', '', None, 1, {'user': 'flood'})
+        self.queue.push(4, 'a', 'PY3', '', None, 1)
+        self.queue.push(5, 'b', 'PY3', '', None, 1)
+        # Submissions with no known user do not share a single turn, but each take their own in arrival order.
+        self.assertEqual([entry.id for entry in self.queue], [1, 4, 5, 2, 3])
+        self.assertEqual(self.queue.user_depths(), {'flood': 3, None: 2})
+        self.queue.remove(4)
+        self.queue.remove(5)
+        self.assertEqual(self.queue._user_tags[1], {'flood': 3})
+
+    def test_aborted_not_counted(self):
+        for id in range(1, 4):
+            self.queue.push(id, 'a', 'PY3', '', None, 1, {'user': 'flood'})
+        self.queue.remove(1)
+        self.queue.remove(2)
+        self.queue.push(4, 'b', 'PY3', '', None, 1, {'user': 'other'})
+        # Aborting submissions moves nobody forward in line.
+        self.assertEqual([entry.id for entry in self.queue], [4, 3])
+        self.queue.remove(3)
+        self.assertEqual(self.queue.user_depths(), {'other': 1})
+
+    def test_iteration_order(self):
+        self.queue.push(1, 'a', 'PY3', '', None, 2)
+        self.queue.push(2, 'b', 'PY3', '', 'judge', 0)
+        self.queue.push(3, 'c', 'PY3', '', None, 2)
+        self.assertEqual([entry.id for entry in self.queue], [2, 1, 3])
+
+
+class JudgeListTestCase(SimpleTestCase):
+    def test_queue_and_dispatch(self):
+        judges = JudgeList()
+        judges.judge(1, 'a', 'PY3', '', None, 1)
+        judges.judge(2, 'a', 'PY3', '', None, 0)
+        judges.judge(2, 'a', 'PY3', '', None, 0)
+        self.assertEqual(len(judges.queue), 2)
+
+        judge = FakeJudge('judge', ('a',), ('PY3',))
+        judges.register(judge)
+        self.assertEqual(judge.submitted, [2])
+
+        judges.on_judge_free(judge, 2)
+        self.assertEqual(judge.submitted, [2, 1])
+        self.assertEqual(len(judges.queue), 0)
+
+    def test_queue_stats(self):
+        judges = JudgeList()
+        judges.judge(1, 'a', 'PY3', '', None, 1, {'user': 1})
+        judges.judge(2, 'a', 'PY3', '', None, 1)
+        self.assertEqual(judges.queue_stats(), (2, {1: 1, None: 1}))
+
+    def test_abort_queued(self):
+        judges = JudgeList()
+        judges.judge(1, 'a', 'PY3', '', None, 1)
+        self.assertFalse(judges.abort(1))
+        self.assertNotIn(1, judges.queue)
@@ -0,0 +1,102 @@
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from judge.bridge.post_grading import PostGradingQueue, process_finished_submissions
+from judge.models import ContestParticipation, ContestSubmission, Language, Problem, Profile, Submission, \
+    UserProblemPoints
+from judge.models.tests.util import CommonDataMixin, create_contest, create_contest_participation, \
+    create_contest_problem, create_problem
+
+
+def fake_submission(id, user=1, problem=1, participation=None):
+    submission = SimpleNamespace(id=id, user_id=user, problem_id=problem)
+    if participation is not None:
+        submission.contest = SimpleNamespace(participation_id=participation)
+    return submission
+
+
+@mock.patch('judge.bridge.post_grading.process_finished_submissions')
+class PostGradingQueueTestCase(SimpleTestCase):
+    def test_grouping(self, process):
+        queue = PostGradingQueue(workers=2, window=1000)
+        for submission in [fake_submission(1), fake_submission(2, problem=2), fake_submission(3),
+                           fake_submission(4, participation=1), fake_submission(5)]:
+            queue.submit(submission)
+        self.assertFalse(process.called)
+
+        queue.shutdown()
+        self.assertCountEqual([call[0][0] for call in process.call_args_list], [[1, 3, 5], [2], [4]])
+
+    def test_window(self, process):
+        queue = PostGradingQueue(workers=1, window=0.01)
+        self.addCleanup(queue.shutdown)
+        queue.submit(fake_submission(1))
+        queue.submit(fake_submission(2))
+        for _ in range(100):
+            if process.called:
+                break
+            queue._thread.join(0.05)
+        process.assert_called_once_with([1, 2])
+
+    def test_serialized(self, process):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow_process(ids):
+            calls.append(ids)
+            started.set()
+            release.wait()
+        process.side_effect = slow_process
+
+        queue = PostGradingQueue(workers=2, window=0)
+        queue.submit(fake_submission(1))
+        self.assertTrue(started.wait(5))
+        # The same key comes due while its previous group is still being processed, unlike another key.
+        queue.submit(fake_submission(2))
+        queue.submit(fake_submission(3, problem=2))
+        queue.submit(fake_submission(4))
+        for _ in range(100):
+            if len(calls) == 2:
+                break
+            queue._thread.join(0.01)
+        self.assertEqual(calls, [[1], [3]])
+
+        release.set()
+        queue.shutdown()
+        self.assertEqual(calls, [[1], [3], [2, 4]])
+
+
+class ProcessFinishedSubmissionsTestCase(CommonDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(self):
+        super().setUpTestData()
+        self.problem = create_problem(code='post_grading', points=10, partial=True, is_public=True)
+        contest = create_contest(key='post_grading')
+        self.participation = create_contest_participation(contest=contest, user='normal')
+        contest_problem = create_contest_problem(contest=contest, problem=self.problem, points=100)
+
+        self.submissions = []
+        for result, points in (('WA', 5), ('AC', 10), ('WA', 0)):
+            submission = Submission.objects.create(
+                user=self.users['normal'].profile, problem=self.problem, language=Language.get_python3(),
+                status='D', result=result, points=points, case_points=points, case_total=10,
+            )
+            ContestSubmission.objects.create(submission=submission, problem=contest_problem,
+                                             participation=self.participation)
+            self.submissions.append(submission)
+
+    def test_process(self):
+        with mock.patch.object(ContestParticipation, 'recompute_results', autospec=True) as recompute:
+            process_finished_submissions([submission.id for submission in self.submissions])
+        recompute.assert_called_once_with(self.participation)
+
+        self.assertEqual(UserProblemPoints.objects.get(problem=self.problem).result, (10, True, True))
+        self.assertEqual(list(ContestSubmission.objects.filter(participation=self.participation)
+                              .order_by('submission_id').values_list('points', flat=True)), [50, 100, 0])
+        problem = Problem.objects.get(id=self.problem.id)
+        self.assertEqual((problem.user_count, problem.ac_submission_count), (1, 1))
+        self.assertAlmostEqual(problem.ac_rate, 100 / 3)
+        self.assertEqual(Profile.objects.get(id=self.users['normal'].profile.id).points, 10)
@@ -0,0 +1,79 @@
+from django.test import SimpleTestCase
+
+from judge.bridge.judge_list import JudgeList
+from judge.bridge.scheduling import ProblemAffinityPolicy, WeightedFairPolicy, make_policy
+from judge.bridge.scheduling_simulator import Simulation, generate_trace
+from judge.bridge.tests.test_judge_list import FakeJudge
+
+
+class SchedulingPolicyTestCase(SimpleTestCase):
+    def make_judges(self, policy, *judges):
+        judge_list = JudgeList(policy)
+        for judge in judges:
+            judge_list.register(judge)
+        return judge_list
+
+    def finish(self, judges, judge):
+        judges.on_judge_free(judge, judge._working)
+
+    def test_affinity_judge(self):
+        policy = ProblemAffinityPolicy()
+        warm, cold = FakeJudge('warm', 'ab', ['PY3'], load=10), FakeJudge('cold', 'ab', ['PY3'])
+        judges = self.make_judges(policy, warm, cold)
+        policy.on_dispatch(warm, 'a', 'PY3', None)
+
+        judges.judge(1, 'a', 'PY3', '', None, 1)
+        judges.judge(2, 'b', 'PY3', '', None, 1)
+        self.assertEqual((warm.submitted, cold.submitted), ([1], [2]))
+
+    def test_affinity_submission(self):
+        policy = ProblemAffinityPolicy(max_skip=2)
+        judge = FakeJudge('judge', 'abc', ['PY3'])
+        judges = self.make_judges(policy, judge)
+        judges.judge(1, 'a', 'PY3', '', None, 1)
+        for id, problem in enumerate('bcaca', 2):
+            judges.judge(id, problem, 'PY3', '', None, 1)
+
+        # 4 is for the problem just graded, and skips over 2 and 3.
+        self.finish(judges, judge)
+        self.assertEqual(judge.submitted, [1, 4])
+        # 6 would skip over 2 by too much.
+        self.finish(judges, judge)
+        self.assertEqual(judge.submitted, [1, 4, 2])
+
+    def test_weighted_fair(self):
+        now = [0]
+        policy = WeightedFairPolicy(weights={'heavy': 2}, half_life=10, clock=lambda: now[0])
+        judge = FakeJudge('judge', 'ab', ['PY3'])
+        judges = self.make_judges(policy, judge)
+
+        judges.judge(1, 'a', 'PY3', '', None, 1, {'user': 'flood'})
+        judges.judge(2, 'a', 'PY3', '', None, 1, {'user': 'flood'})
+        judges.judge(3, 'b', 'PY3', '', None, 1, {'user': 'other'})
+        self.finish(judges, judge)
+        self.assertEqual(judge.submitted, [1, 3])
+
+        self.assertEqual(policy.usage('flood'), 1)
+        now[0] = 10
+        self.assertEqual(policy.usage('flood'), 0.5)
+        policy.on_dispatch(judge, 'a', 'PY3', {'user': 'heavy'})
+        self.assertEqual(policy.usage('heavy'), 0.5)
+        # Submissions without a known user do not add up as if they were one user's.
+        policy.on_dispatch(judge, 'a', 'PY3', None)
+        self.assertEqual(policy.usage(None), 0)
+
+    def test_make_policy(self):
+        self.assertIsInstance(make_policy('problem-affinity', history=4), ProblemAffinityPolicy)
+        with self.assertRaises(ValueError):
+            make_policy('random')
+
+
+class SimulationTestCase(SimpleTestCase):
+    def test_simulation(self):
+        trace = generate_trace(500, 1, 10, 20)
+        for policy in (None, ProblemAffinityPolicy(), WeightedFairPolicy()):
+            simulation = Simulation(trace, policy, judges=4, cache_size=4, cold_penalty=1).run()
+            self.assertEqual(len(simulation.waits), len(trace))
+            self.assertGreaterEqual(min(simulation.waits.values()), 0)
+            self.assertEqual(len(simulation.judge_list.queue), 0)
+            self.assertFalse(any(judge.working for judge in simulation.judge_list.judges))
@@ -48,6 +48,36 @@ class BaseContestFormat(six.with_metaclass(ABCMeta)):
         """
         raise NotImplementedError()
 
+    def update_participations(self, queryset):
+        """
+        Updates the results of every ContestParticipation in a queryset, like update_participation, but in bulk.
+        Implementations should compute all results with a few queries, and save them with bulk_update_values.
+
+        The default implementation calls update_participation for each participation.
+
+        :param queryset: A queryset of ContestParticipation objects of this contest.
+        :return: The number of participations updated.
+        """
+        count = 0
+        for participation in queryset.iterator():
+            self.update_participation(participation)
+            count += 1
+        return count
+
+    def set_participation_results(self, participations, until=None):
+        """
+        Sets the score, cumtime, tiebreaker and format_data fields of every participation in a list, like
+        update_participation, but without saving, and only counting submissions made up to `until` if it is given.
+        This is how frozen scoreboards are ranked.
+
+        The default implementation is not supported.
+
+        :param participations: A list of ContestParticipation objects of this contest.
+        :param until: A datetime, or None to count every submission.
+        :return: None
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     def display_user_problem(self, participation, contest_problem):
         """
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import timedelta
 
 from django.core.exceptions import ValidationError
@@ -10,6 +11,7 @@ from django.utils.translation import gettext_lazy
 
 from judge.contest_format.base import BaseContestFormat
 from judge.contest_format.registry import register_contest_format
+from judge.utils.raw_sql import bulk_update_values
 from judge.utils.timedelta import nice_repr
 
 
@@ -26,13 +28,60 @@ class DefaultContestFormat(BaseContestFormat):
         super(DefaultContestFormat, self).__init__(contest, config)
 
     def update_participation(self, participation):
+        self.set_results(participation, self.get_results([participation])[participation.id])
+        participation.save()
+
+    def update_participations(self, queryset):
+        participations = list(queryset.order_by())
+        self.set_participation_results(participations)
+        bulk_update_values(queryset.model, ['cumtime', 'score', 'tiebreaker', 'format_data'], [
+            (participation.id, participation.cumtime, participation.score, participation.tiebreaker,
+             participation.format_data) for participation in participations
+        ], using=queryset.db)
+        return len(participations)
+
+    def set_participation_results(self, participations, until=None):
+        for participation in participations:
+            # Start and end times of participations depend on the contest.
+            participation.contest = self.contest
+        results = self.get_results(participations, until)
+        for participation in participations:
+            self.set_results(participation, results[participation.id])
+
+    @staticmethod
+    def get_contest_submissions(participations, until=None):
+        from judge.models import ContestSubmission
+        submissions = ContestSubmission.objects.filter(participation_id__in=[p.id for p in participations]).order_by()
+        if until is not None:
+            submissions = submissions.filter(submission__date__lte=until)
+        return submissions
+
+    def get_results(self, participations, until=None):
+        """
+        Computes, with as few queries as possible, what set_results needs to update each participation.
+
+        :param participations: A list of ContestParticipation objects.
+        :param until: A datetime, or None. If given, only submissions made up to then are counted.
+        :return: A dictionary of lists of per-problem results, keyed by participation id.
+        """
+        results = defaultdict(list)
+        submissions = self.get_contest_submissions(participations, until)
+        for result in submissions.values('participation_id', 'problem_id').annotate(
+                time=Max('submission__date'), points=Max('points'),
+        ):
+            results[result['participation_id']].append(result)
+        return results
+
+    def set_results(self, participation, results):
+        """
+        Sets the score, cumtime, tiebreaker and format_data fields of a participation from what get_results computed
+        for it, without saving.
+        """
         cumtime = 0
         points = 0
         format_data = {}
 
-        for result in participation.submissions.values('problem_id').annotate(
-                time=Max('submission__date'), points=Max('points'),
-        ):
+        for result in results:
             dt = (result['time'] - participation.start).total_seconds()
             if result['points']:
                 cumtime += dt
@@ -43,7 +92,6 @@ class DefaultContestFormat(BaseContestFormat):
         participation.score = points
         participation.tiebreaker = 0
         participation.format_data = format_data
-        participation.save()
 
     def display_user_problem(self, participation, contest_problem):
         format_data = (participation.format_data or {}).get(str(contest_problem.id))
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import timedelta
 
 from django.core.exceptions import ValidationError
@@ -46,34 +47,39 @@ class ECOOContestFormat(DefaultContestFormat):
         self.config.update(config or {})
         self.contest = contest
 
-    def update_participation(self, participation):
-        cumtime = 0
-        score = 0
-        format_data = {}
-
-        submissions = participation.submissions.exclude(submission__result__in=('IE', 'CE'))
-
+    def get_results(self, participations, until=None):
+        submissions = self.get_contest_submissions(participations, until).exclude(submission__result__in=('IE', 'CE'))
         submission_counts = {
-            data['problem_id']: data['count'] for data in submissions.values('problem_id').annotate(count=Count('id'))
+            (data['participation_id'], data['problem_id']): data['count']
+            for data in submissions.values('participation_id', 'problem_id').annotate(count=Count('id'))
         }
         queryset = (
             submissions
-            .values('problem_id')
+            .values('participation_id', 'problem_id')
             .filter(
                 submission__date=Subquery(
                     submissions
-                    .filter(problem_id=OuterRef('problem_id'))
+                    .filter(participation_id=OuterRef('participation_id'), problem_id=OuterRef('problem_id'))
                     .order_by('-submission__date')
                     .values('submission__date')[:1],
                 ),
             )
             .annotate(points=Max('points'))
-            .values_list('problem_id', 'problem__points', 'points', 'submission__date')
+            .values_list('participation_id', 'problem_id', 'problem__points', 'points', 'submission__date')
         )
 
-        for problem_id, problem_points, points, date in queryset:
-            sub_cnt = submission_counts.get(problem_id, 0)
+        results = defaultdict(list)
+        for participation_id, problem_id, problem_points, points, date in queryset:
+            results[participation_id].append((problem_id, problem_points, points, date,
+                                              submission_counts.get((participation_id, problem_id), 0)))
+        return results
+
+    def set_results(self, participation, results):
+        cumtime = 0
+        score = 0
+        format_data = {}
 
+        for problem_id, problem_points, points, date, sub_cnt in results:
             dt = (date - participation.start).total_seconds()
 
             bonus = 0
@@ -96,7 +102,6 @@ class ECOOContestFormat(DefaultContestFormat):
         participation.score = score
         participation.tiebreaker = 0
         participation.format_data = format_data
-        participation.save()
 
     def display_user_problem(self, participation, contest_problem):
         format_data = (participation.format_data or {}).get(str(contest_problem.id))
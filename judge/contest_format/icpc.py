@@ -1,7 +1,8 @@
+from collections import defaultdict
 from datetime import timedelta
 
 from django.core.exceptions import ValidationError
-from django.db import connection
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
 from django.template.defaultfilters import floatformat
 from django.urls import reverse
 from django.utils.html import format_html
@@ -10,10 +11,29 @@ from django.utils.translation import gettext_lazy
 
 from judge.contest_format.default import DefaultContestFormat
 from judge.contest_format.registry import register_contest_format
-from judge.timezone import from_database_time
 from judge.utils.timedelta import nice_repr
 
 
+def get_penalty_results(submissions):
+    """
+    For each participation and problem among some ContestSubmissions, find the best points, the time they were
+    first reached, and for penalties, how many submissions were made up to then and in total.
+    """
+    best = submissions.filter(
+        participation_id=OuterRef('participation_id'), problem_id=OuterRef('problem_id'),
+    ).order_by('-points', 'submission__date').values('submission__date')[:1]
+    # An IE can have a submission result of `None`
+    counted = Q(submission__result__isnull=False) & ~Q(submission__result__in=['IE', 'CE'])
+
+    results = defaultdict(list)
+    for result in submissions.values('participation_id', 'problem_id').annotate(
+            points=Max('points'), time=Subquery(best), attempts=Count('id', filter=counted),
+            before=Count('id', filter=counted & Q(submission__date__lte=F('time'))),
+    ):
+        results[result['participation_id']].append(result)
+    return results
+
+
 @register_contest_format('icpc')
 class ICPCContestFormat(DefaultContestFormat):
     name = gettext_lazy('ICPC')
@@ -44,58 +64,41 @@ class ICPCContestFormat(DefaultContestFormat):
         self.config.update(config or {})
         self.contest = contest
 
-    def update_participation(self, participation):
+    def get_results(self, participations, until=None):
+        return get_penalty_results(self.get_contest_submissions(participations, until))
+
+    def set_results(self, participation, results):
         cumtime = 0
         last = 0
         penalty = 0
         score = 0
         format_data = {}
 
-        with connection.cursor() as cursor:
-            cursor.execute('''
-                SELECT MAX(cs.points) as `points`, (
-                    SELECT MIN(csub.date)
-                        FROM judge_contestsubmission ccs LEFT OUTER JOIN
-                             judge_submission csub ON (csub.id = ccs.submission_id)
-                        WHERE ccs.problem_id = cp.id AND ccs.participation_id = %s AND ccs.points = MAX(cs.points)
-                ) AS `time`, cp.id AS `prob`
-                FROM judge_contestproblem cp INNER JOIN
-                     judge_contestsubmission cs ON (cs.problem_id = cp.id AND cs.participation_id = %s) LEFT OUTER JOIN
-                     judge_submission sub ON (sub.id = cs.submission_id)
-                GROUP BY cp.id
-            ''', (participation.id, participation.id))
-
-            for points, time, prob in cursor.fetchall():
-                time = from_database_time(time)
-                dt = (time - participation.start).total_seconds()
-
-                # Compute penalty
-                if self.config['penalty']:
-                    # An IE can have a submission result of `None`
-                    subs = participation.submissions.exclude(submission__result__isnull=True) \
-                                                    .exclude(submission__result__in=['IE', 'CE']) \
-                                                    .filter(problem_id=prob)
-                    if points:
-                        prev = subs.filter(submission__date__lte=time).count() - 1
-                        penalty += prev * self.config['penalty'] * 60
-                    else:
-                        # We should always display the penalty, even if the user has a score of 0
-                        prev = subs.count()
-                else:
-                    prev = 0
+        for result in results:
+            points = result['points']
+            dt = (result['time'] - participation.start).total_seconds()
 
+            if self.config['penalty']:
                 if points:
-                    cumtime += dt
-                    last = max(last, dt)
+                    prev = result['before'] - 1
+                    penalty += prev * self.config['penalty'] * 60
+                else:
+                    # We should always display the penalty, even if the user has a score of 0
+                    prev = result['attempts']
+            else:
+                prev = 0
+
+            if points:
+                cumtime += dt
+                last = max(last, dt)
 
-                format_data[str(prob)] = {'time': dt, 'points': points, 'penalty': prev}
-                score += points
+            format_data[str(result['problem_id'])] = {'time': dt, 'points': points, 'penalty': prev}
+            score += points
 
         participation.cumtime = cumtime + penalty
         participation.score = score
         participation.tiebreaker = last  # field is sorted from least to greatest
         participation.format_data = format_data
-        participation.save()
 
     def display_user_problem(self, participation, contest_problem):
         format_data = (participation.format_data or {}).get(str(contest_problem.id))
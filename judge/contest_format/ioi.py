@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from django.db import connection
 from django.utils.translation import gettext_lazy
 
@@ -14,18 +16,22 @@ class IOIContestFormat(LegacyIOIContestFormat):
         cumtime: Specify True if time penalties are to be computed. Defaults to False.
     '''
 
-    def update_participation(self, participation):
-        cumtime = 0
-        score = 0
-        format_data = {}
+    def get_results(self, participations, until=None):
+        results = defaultdict(list)
+        ids = [participation.id for participation in participations]
+        if not ids:
+            return results
+        params = ids if until is None else ids + [connection.ops.adapt_datetimefield_value(until)]
 
         with connection.cursor() as cursor:
             cursor.execute('''
-                SELECT q.prob,
+                SELECT q.part,
+                       q.prob,
                        MIN(q.date) as `date`,
                        q.batch_points
                 FROM (
-                         SELECT cp.id          as `prob`,
+                         SELECT cs.participation_id as `part`,
+                                cp.id          as `prob`,
                                 sub.id         as `subid`,
                                 sub.date       as `date`,
                                 tc.points      as `points`,
@@ -34,60 +40,69 @@ class IOIContestFormat(LegacyIOIContestFormat):
                          FROM judge_contestproblem cp
                                   INNER JOIN
                               judge_contestsubmission cs
-                              ON (cs.problem_id = cp.id AND cs.participation_id = %s)
+                              ON (cs.problem_id = cp.id AND cs.participation_id IN ({ids}))
                                   LEFT OUTER JOIN
                               judge_submission sub
-                              ON (sub.id = cs.submission_id AND sub.status = 'D')
+                              ON (sub.id = cs.submission_id AND sub.status = 'D'{until})
                                   INNER JOIN judge_submissiontestcase tc
                               ON sub.id = tc.submission_id
-                         GROUP BY cp.id, tc.batch, sub.id
+                         GROUP BY cs.participation_id, cp.id, tc.batch, sub.id
                      ) q
                          INNER JOIN (
-                    SELECT prob, batch, MAX(r.batch_points) as max_batch_points
+                    SELECT part, prob, batch, MAX(r.batch_points) as max_batch_points
                     FROM (
-                             SELECT cp.id          as `prob`,
+                             SELECT cs.participation_id as `part`,
+                                    cp.id          as `prob`,
                                     tc.batch       as `batch`,
                                     MIN(tc.points) as `batch_points`
                              FROM judge_contestproblem cp
                                       INNER JOIN
                                   judge_contestsubmission cs
-                                  ON (cs.problem_id = cp.id AND cs.participation_id = %s)
+                                  ON (cs.problem_id = cp.id AND cs.participation_id IN ({ids}))
                                       LEFT OUTER JOIN
                                   judge_submission sub
-                                  ON (sub.id = cs.submission_id AND sub.status = 'D')
+                                  ON (sub.id = cs.submission_id AND sub.status = 'D'{until})
                                       INNER JOIN judge_submissiontestcase tc
                                   ON sub.id = tc.submission_id
-                             GROUP BY cp.id, tc.batch, sub.id
+                             GROUP BY cs.participation_id, cp.id, tc.batch, sub.id
                          ) r
-                    GROUP BY prob, batch
+                    GROUP BY part, prob, batch
                 ) p
-                ON p.prob = q.prob AND (p.batch = q.batch OR p.batch is NULL AND q.batch is NULL)
+                ON p.part = q.part AND p.prob = q.prob AND (p.batch = q.batch OR p.batch is NULL AND q.batch is NULL)
                 WHERE p.max_batch_points = q.batch_points
-                GROUP BY q.prob, q.batch
-            ''', (participation.id, participation.id))
+                GROUP BY q.part, q.prob, q.batch
+            '''.format(ids=', '.join(['%s'] * len(ids)), until='' if until is None else ' AND sub.date <= %s'),
+                params + params)
+
+            for participation_id, problem_id, time, subtask_points in cursor.fetchall():
+                results[participation_id].append((problem_id, from_database_time(time), subtask_points))
+        return results
+
+    def set_results(self, participation, results):
+        cumtime = 0
+        score = 0
+        format_data = {}
 
-            for problem_id, time, subtask_points in cursor.fetchall():
-                problem_id = str(problem_id)
-                time = from_database_time(time)
-                if self.config['cumtime']:
-                    dt = (time - participation.start).total_seconds()
-                else:
-                    dt = 0
+        for problem_id, time, subtask_points in results:
+            problem_id = str(problem_id)
+            if self.config['cumtime']:
+                dt = (time - participation.start).total_seconds()
+            else:
+                dt = 0
 
-                if format_data.get(problem_id) is None:
-                    format_data[problem_id] = {'points': 0, 'time': 0}
-                format_data[problem_id]['points'] += subtask_points
-                format_data[problem_id]['time'] = max(dt, format_data[problem_id]['time'])
+            if format_data.get(problem_id) is None:
+                format_data[problem_id] = {'points': 0, 'time': 0}
+            format_data[problem_id]['points'] += subtask_points
+            format_data[problem_id]['time'] = max(dt, format_data[problem_id]['time'])
 
-            for _, problem_data in format_data.items():
-                penalty = problem_data['time']
-                points = problem_data['points']
-                if self.config['cumtime'] and points:
-                    cumtime += penalty
-                score += points
+        for _, problem_data in format_data.items():
+            penalty = problem_data['time']
+            points = problem_data['points']
+            if self.config['cumtime'] and points:
+                cumtime += penalty
+            score += points
 
         participation.cumtime = max(cumtime, 0)
         participation.score = score
         participation.tiebreaker = 0
         participation.format_data = format_data
-        participation.save()
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import timedelta
 
 from django.core.exceptions import ValidationError
@@ -40,19 +41,27 @@ class LegacyIOIContestFormat(DefaultContestFormat):
         self.config.update(config or {})
         self.contest = contest
 
-    def update_participation(self, participation):
+    def get_results(self, participations, until=None):
+        submissions = self.get_contest_submissions(participations, until)
+        queryset = (submissions.values('participation_id', 'problem_id')
+                               .filter(points=Subquery(
+                                   submissions.filter(participation_id=OuterRef('participation_id'),
+                                                      problem_id=OuterRef('problem_id'))
+                                              .order_by('-points').values('points')[:1]))
+                               .annotate(time=Min('submission__date'))
+                               .values_list('participation_id', 'problem_id', 'time', 'points'))
+
+        results = defaultdict(list)
+        for participation_id, problem_id, time, points in queryset:
+            results[participation_id].append((problem_id, time, points))
+        return results
+
+    def set_results(self, participation, results):
         cumtime = 0
         score = 0
         format_data = {}
 
-        queryset = (participation.submissions.values('problem_id')
-                                             .filter(points=Subquery(
-                                                 participation.submissions.filter(problem_id=OuterRef('problem_id'))
-                                                                          .order_by('-points').values('points')[:1]))
-                                             .annotate(time=Min('submission__date'))
-                                             .values_list('problem_id', 'time', 'points'))
-
-        for problem_id, time, points in queryset:
+        for problem_id, time, points in results:
             if self.config['cumtime']:
                 dt = (time - participation.start).total_seconds()
                 if points:
@@ -67,7 +76,6 @@ class LegacyIOIContestFormat(DefaultContestFormat):
         participation.score = score
         participation.tiebreaker = 0
         participation.format_data = format_data
-        participation.save()
 
     def display_user_problem(self, participation, contest_problem):
         format_data = (participation.format_data or {}).get(str(contest_problem.id))
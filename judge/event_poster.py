@@ -1,18 +1,47 @@
 from django.conf import settings
 
-__all__ = ['last', 'post']
+__all__ = ['last', 'post', 'stats']
 
 if not settings.EVENT_DAEMON_USE:
     real = False
 
-    def post(channel, message):
+    def _post(channel, message):
         return 0
 
     def last():
         return 0
 elif hasattr(settings, 'EVENT_DAEMON_AMQP'):
-    from .event_poster_amqp import last, post
+    from .event_poster_amqp import EventPoster, last, post as _post
     real = True
 else:
-    from .event_poster_ws import last, post
+    from .event_poster_ws import EventPoster, last, post as _post
     real = True
+
+if real and settings.EVENT_DAEMON_ASYNC:
+    from .event_poster_async import AsyncEventPoster
+
+    _poster = AsyncEventPoster(EventPoster, settings.EVENT_DAEMON_QUEUE_SIZE, settings.EVENT_DAEMON_BATCH_SIZE,
+                               coalesce=settings.EVENT_DAEMON_COALESCE_CHANNELS,
+                               coalesce_window=settings.EVENT_DAEMON_COALESCE_WINDOW)
+    post = _poster.post
+    stats = _poster.stats
+elif real and settings.EVENT_DAEMON_COALESCE_CHANNELS:
+    from .event_poster_async import AsyncEventPoster
+
+    # Coalescing holds messages back, which takes the background thread, so the coalesced channels are posted
+    # through it even when every other channel is posted right away.
+    _poster = AsyncEventPoster(EventPoster, settings.EVENT_DAEMON_QUEUE_SIZE, settings.EVENT_DAEMON_BATCH_SIZE,
+                               coalesce=settings.EVENT_DAEMON_COALESCE_CHANNELS,
+                               coalesce_window=settings.EVENT_DAEMON_COALESCE_WINDOW)
+
+    def post(channel, message):
+        if channel in _poster.coalesce:
+            return _poster.post(channel, message)
+        return _post(channel, message)
+
+    stats = _poster.stats
+else:
+    post = _post
+
+    def stats():
+        return None
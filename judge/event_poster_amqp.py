@@ -30,6 +30,10 @@ class EventPoster(object):
             self._connect()
             return self.post(channel, message, tries + 1)
 
+    def post_many(self, events):
+        """Post a batch of (channel, message) pairs, and return their ids."""
+        return [self.post(channel, message) for channel, message in events]
+
 
 _local = threading.local()
 
@@ -0,0 +1,146 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import count
+
+__all__ = ['AsyncEventPoster']
+logger = logging.getLogger('judge.event_poster')
+
+COUNTERS = ('posted', 'sent', 'dropped', 'failed', 'batches', 'coalesced')
+
+
+class AsyncEventPoster(object):
+    """
+    Posts events from a background thread, so that posting never waits on the event daemon.
+
+    Events are queued in memory, and sent in order by a single thread, in batches of up to `batch_size` with the
+    `post_many` method of a poster made by `make_poster`. At most `max_queue` events are kept waiting: when the
+    daemon cannot keep up, or is down, the oldest are dropped, as live updates are worthless once stale anyway. A
+    batch that fails to send is dropped too, and the poster is made again after `retry_interval` seconds.
+
+    Messages to the channels in `coalesce` are not queued right away, but held for `coalesce_window` seconds, and
+    then queued together as a single message of type "batch", with a list of the held messages. Of the messages with
+    the same "id" key, as the updates of a submission, only the last is kept. This bounds how many messages the
+    listeners of a busy channel receive from each process, however many updates there are.
+
+    The queue and thread belong to the process that made them, and a forked process starts afresh.
+    """
+
+    def __init__(self, make_poster, max_queue=10000, batch_size=100, retry_interval=1.0, coalesce=(),
+                 coalesce_window=0.5):
+        self.make_poster = make_poster
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.coalesce = frozenset(coalesce)
+        self.coalesce_window = coalesce_window
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = deque()
+            # channel -> message id, or a unique key for messages without one -> message
+            self._held = {}
+            self._held_count = count()
+            self._held_until = None
+            self._condition = threading.Condition()
+            self._sending = 0
+            self._poster = None
+            self._counters = dict.fromkeys(COUNTERS, 0)
+            self._thread = threading.Thread(target=self._run, name='event-poster', daemon=True)
+            self._thread.start()
+            # Give events posted just before the process exits a chance to go out.
+            atexit.register(self.flush, self.retry_interval)
+            self._pid = os.getpid()
+
+    def post(self, channel, message):
+        if self._pid != os.getpid():
+            self._start()
+        with self._condition:
+            self._counters['posted'] += 1
+            if channel in self.coalesce:
+                self._hold(channel, message)
+            else:
+                self._enqueue(channel, message)
+            self._condition.notify()
+        # Like a disabled event daemon, as the message id is not known yet.
+        return 0
+
+    def _enqueue(self, channel, message):
+        if len(self._queue) >= self.max_queue:
+            self._queue.popleft()
+            self._counters['dropped'] += 1
+        self._queue.append((channel, message))
+
+    def _hold(self, channel, message):
+        held = self._held.setdefault(channel, OrderedDict())
+        key = message.get('id', None) if isinstance(message, dict) else None
+        if key is None:
+            key = ('unkeyed', next(self._held_count))
+        elif held.pop(key, None) is not None:
+            self._counters['coalesced'] += 1
+        held[key] = message
+        if self._held_until is None:
+            self._held_until = time.monotonic() + self.coalesce_window
+
+    def _release_held(self, force=False):
+        if self._held_until is None or (not force and time.monotonic() < self._held_until):
+            return
+        for channel, held in self._held.items():
+            self._enqueue(channel, {'type': 'batch', 'messages': list(held.values())})
+        self._held = {}
+        self._held_until = None
+
+    def stats(self):
+        """Return the number of events posted, sent, dropped from a full queue and failed to send, and queued."""
+        if self._pid != os.getpid():
+            return dict.fromkeys(COUNTERS + ('queued',), 0)
+        with self._condition:
+            held = sum(len(messages) for messages in self._held.values())
+            return dict(self._counters, queued=len(self._queue) + self._sending + held)
+
+    def flush(self, timeout=None):
+        """Wait until every event posted so far was sent or dropped, without waiting to coalesce any more."""
+        if self._pid != os.getpid():
+            return True
+        with self._condition:
+            self._release_held(force=True)
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._queue and not self._sending, timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    self._release_held()
+                    if self._queue:
+                        break
+                    self._condition.wait(None if self._held_until is None else
+                                         max(0, self._held_until - time.monotonic()))
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._sending = len(batch)
+
+            try:
+                if self._poster is None:
+                    self._poster = self.make_poster()
+                self._poster.post_many(batch)
+            except Exception:
+                logger.exception('Failed to post %d events', len(batch))
+                self._poster = None
+                failed = True
+            else:
+                failed = False
+
+            with self._condition:
+                self._counters['failed' if failed else 'sent'] += len(batch)
+                self._counters['batches'] += 1
+                self._sending = 0
+                self._condition.notify_all()
+            if failed:
+                time.sleep(self.retry_interval)
@@ -15,6 +15,7 @@ class EventPostingError(RuntimeError):
 
 class EventPoster(object):
     def __init__(self):
+        self._batching = True
         self._connect()
 
     def _connect(self):
@@ -39,6 +40,29 @@ class EventPoster(object):
             self._connect()
             return self.post(channel, message, tries + 1)
 
+    def post_many(self, events, tries=0):
+        """Post a batch of (channel, message) pairs with a single round trip, and return their ids."""
+        if not self._batching:
+            return [self.post(channel, message) for channel, message in events]
+        try:
+            self._conn.send(json.dumps({'command': 'post-many', 'messages': [
+                {'channel': channel, 'message': message} for channel, message in events
+            ]}))
+            resp = json.loads(self._conn.recv())
+            if resp['status'] == 'error':
+                if resp['code'] == 'bad-command':
+                    # An event daemon from before batching was added.
+                    self._batching = False
+                    return self.post_many(events)
+                raise EventPostingError(resp['code'])
+            else:
+                return resp['ids']
+        except WebSocketException:
+            if tries > 10:
+                raise
+            self._connect()
+            return self.post_many(events, tries + 1)
+
     def last(self, tries=0):
         try:
             self._conn.send('{"command": "last-msg"}')
@@ -1,8 +1,14 @@
 import json
 import logging
+import os
+import select
 import socket
 import struct
+import threading
 import zlib
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import count
 
 from django.conf import settings
 
@@ -11,6 +17,20 @@ from judge import event_poster as event
 logger = logging.getLogger('judge.judgeapi')
 size_pack = struct.Struct('!I')
 
+CONTEST_SUBMISSION_PRIORITY = 0
+DEFAULT_PRIORITY = 1
+REJUDGE_PRIORITY = 2
+BATCH_REJUDGE_PRIORITY = 3
+
+# Number of submissions judge_submissions processes per set of queries.
+BATCH_JUDGE_CHUNK_SIZE = 1000
+# Total source length allowed in one submission-batch-request packet, keeping it well under the bridge's packet size
+# limit, even for incompressible sources.
+BATCH_JUDGE_PACKET_SOURCE_LIMIT = 4 * 1024 * 1024
+
+# Packets the bridge can safely be sent again, when it is unknown whether it handled them the first time.
+IDEMPOTENT_PACKETS = frozenset(('problem-update', 'queue-stats'))
+
 
 def _post_update_submission(submission, done=False):
     if submission.problem.is_public:
@@ -21,9 +41,141 @@ def _post_update_submission(submission, done=False):
                                    'status': submission.status, 'language': submission.language.key})
 
 
+def _bridge_address():
+    return settings.BRIDGED_DJANGO_CONNECT or settings.BRIDGED_DJANGO_ADDRESS[0]
+
+
+def _encode_packet(packet):
+    output = zlib.compress(json.dumps(packet, separators=(',', ':')).encode('utf-8'))
+    return size_pack.pack(len(output)) + output
+
+
+class BridgeConnection(object):
+    """
+    A persistent connection to the bridge.
+
+    Every packet carries a `request-id`, which tells the bridge to keep the connection open and to tag its reply
+    with the same id. This lets a batch of requests be written in one go and their replies matched up afterwards.
+    """
+
+    def __init__(self, address, timeout=None):
+        self.sock = socket.create_connection(address, timeout)
+        self.reader = self.sock.makefile('rb')
+        self._ids = count(1)
+
+    def _read_packet(self):
+        input = self.reader.read(size_pack.size)
+        if len(input) < size_pack.size:
+            raise ValueError('Judge did not respond')
+        length = size_pack.unpack(input)[0]
+        input = self.reader.read(length)
+        if len(input) < length:
+            raise ValueError('Judge did not respond')
+        return json.loads(zlib.decompress(input).decode('utf-8'))
+
+    def request_many(self, packets):
+        ids = [next(self._ids) for _ in packets]
+        self.sock.sendall(b''.join(_encode_packet(dict(packet, **{'request-id': id}))
+                                   for id, packet in zip(ids, packets)))
+
+        results = {}
+        for _ in ids:
+            result = self._read_packet()
+            if not isinstance(result, dict) or result.get('request-id') not in ids:
+                raise ValueError('Judge sent unexpected response: %r' % (result,))
+            results[result.pop('request-id')] = result
+        return [results[id] for id in ids]
+
+    def is_stale(self):
+        # An idle connection never has anything to read, unless the bridge closed it, e.g. when restarting.
+        return bool(select.select([self.sock], [], [], 0)[0])
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class BridgeConnectionPool(object):
+    def __init__(self, size):
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _acquire(self):
+        with self._lock:
+            # Connections must not be shared with forked children, e.g. celery workers.
+            if self._pid != os.getpid():
+                self._idle = []
+                self._pid = os.getpid()
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.is_stale():
+                    return conn
+                conn.close()
+        return BridgeConnection(_bridge_address(), settings.BRIDGED_DJANGO_TIMEOUT)
+
+    def _release(self, conn):
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request_many(self, packets):
+        conn = self._acquire()
+        try:
+            results = conn.request_many(packets)
+        except BaseException:
+            # Including timeouts: the replies may still arrive later, and would be mistaken for those of the next
+            # requests on the connection.
+            conn.close()
+            raise
+        self._release(conn)
+        return results
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = BridgeConnectionPool(settings.BRIDGED_DJANGO_POOL_SIZE)
+    return _pool
+
+
+def judge_requests(packets):
+    """Send several packets to the bridge in one round trip, returning the replies in order."""
+    if not packets:
+        return []
+
+    if settings.BRIDGED_DJANGO_POOL_SIZE:
+        try:
+            return _get_pool().request_many(packets)
+        except socket.timeout:
+            # The bridge is stalled, so trying again would only keep the caller waiting longer.
+            raise
+        except (socket.error, ValueError):
+            # The bridge may have handled some of the packets before failing, e.g. while replying, and most must not
+            # be handled twice. Stale connections are already weeded out when taken from the pool.
+            if not all(packet['name'] in IDEMPOTENT_PACKETS for packet in packets):
+                raise
+            logger.warning('Pooled bridge connection failed, falling back to one-shot requests', exc_info=True)
+    return [_judge_request_once(packet) for packet in packets]
+
+
 def judge_request(packet, reply=True):
-    sock = socket.create_connection(settings.BRIDGED_DJANGO_CONNECT or
-                                    settings.BRIDGED_DJANGO_ADDRESS[0])
+    if settings.BRIDGED_DJANGO_POOL_SIZE:
+        return judge_requests([packet])[0]
+    return _judge_request_once(packet, reply)
+
+
+def _judge_request_once(packet, reply=True):
+    sock = socket.create_connection(_bridge_address(), settings.BRIDGED_DJANGO_TIMEOUT)
 
     output = json.dumps(packet, separators=(',', ':'))
     output = zlib.compress(output.encode('utf-8'))
@@ -48,14 +200,44 @@ def judge_request(packet, reply=True):
         return result
 
 
+SUBMISSION_META_FIELDS = ('id', 'user_id', 'problem_id', 'date', 'is_pretested', 'contest__participation_id',
+                          'contest__participation__virtual')
+
+
+def _submission_meta(submissions):
+    """
+    Compute the per-submission fields the judge is sent along with a submission, so that the bridge does not have
+    to query for them when dispatching. `submissions` are dicts of SUBMISSION_META_FIELDS.
+    """
+    from .models import Submission
+
+    if not submissions:
+        return {}
+
+    # The attempt number counts the user's earlier submissions to the problem in the same participation, and is
+    # found for all submissions with a single query.
+    dates = defaultdict(list)
+    earlier = Submission.objects.filter(user_id__in={data['user_id'] for data in submissions},
+                                        problem_id__in={data['problem_id'] for data in submissions}) \
+                                .exclude(status__in=('CE', 'IE'))
+    for user, problem, participation, date in earlier.values_list('user_id', 'problem_id',
+                                                                  'contest__participation_id', 'date'):
+        dates[user, problem, participation].append(date)
+    for values in dates.values():
+        values.sort()
+
+    return {data['id']: {
+        'pretests-only': data['is_pretested'],
+        'in-contest': data['contest__participation__virtual'],
+        'attempt-no': bisect_left(dates[data['user_id'], data['problem_id'], data['contest__participation_id']],
+                                  data['date']) + 1,
+        'user': data['user_id'],
+    } for data in submissions}
+
+
 def judge_submission(submission, rejudge=False, batch_rejudge=False, judge_id=None):
     from .models import ContestSubmission, Submission, SubmissionTestCase
 
-    CONTEST_SUBMISSION_PRIORITY = 0
-    DEFAULT_PRIORITY = 1
-    REJUDGE_PRIORITY = 2
-    BATCH_REJUDGE_PRIORITY = 3
-
     updates = {'time': None, 'memory': None, 'points': None, 'result': None, 'error': None,
                'was_rejudged': rejudge or batch_rejudge, 'status': 'QU'}
     try:
@@ -80,6 +262,7 @@ def judge_submission(submission, rejudge=False, batch_rejudge=False, judge_id=No
         return False
 
     SubmissionTestCase.objects.filter(submission_id=submission.id).delete()
+    meta = _submission_meta(list(Submission.objects.filter(id=submission.id).values(*SUBMISSION_META_FIELDS)))
 
     try:
         response = judge_request({
@@ -90,6 +273,7 @@ def judge_submission(submission, rejudge=False, batch_rejudge=False, judge_id=No
             'source': submission.source.source,
             'judge-id': judge_id,
             'priority': BATCH_REJUDGE_PRIORITY if batch_rejudge else (REJUDGE_PRIORITY if rejudge else priority),
+            'meta': meta.get(submission.id),
         })
     except BaseException:
         logger.exception('Failed to send request to judge')
@@ -103,6 +287,117 @@ def judge_submission(submission, rejudge=False, batch_rejudge=False, judge_id=No
     return success
 
 
+def judge_submissions(ids, rejudge=False, batch_rejudge=False, judge_id=None):
+    """
+    Judge many submissions at once, e.g. for rejudges. Behaves like calling Submission.judge on each submission,
+    but updates the database set-wise and sends the bridge a few submission-batch-request packets in one round trip.
+    Returns the number of submissions sent to the bridge.
+    """
+    ids = list(ids)
+    return sum(_judge_submission_chunk(ids[i:i + BATCH_JUDGE_CHUNK_SIZE], rejudge, batch_rejudge, judge_id)
+               for i in range(0, len(ids), BATCH_JUDGE_CHUNK_SIZE))
+
+
+def _judge_submission_chunk(ids, rejudge, batch_rejudge, judge_id):
+    from .models import ContestSubmission, Submission, SubmissionTestCase
+
+    # See judge_submission for why submissions being graded are left alone.
+    queryset = Submission.objects.filter(is_locked=False).exclude(status__in=('P', 'G'))
+    ids = list(queryset.filter(id__in=ids).values_list('id', flat=True))
+    if not ids:
+        return 0
+
+    contest_submissions = ContestSubmission.objects.filter(submission_id__in=ids).values_list(
+        'submission_id', 'problem__contest__run_pretests_only', 'problem__is_pretested',
+    )
+    pretested = set()
+    in_contest = set()
+    for id, run_pretests_only, is_pretested in contest_submissions:
+        in_contest.add(id)
+        if run_pretests_only and is_pretested:
+            pretested.add(id)
+
+    updates = {'time': None, 'memory': None, 'points': None, 'result': None, 'error': None,
+               'was_rejudged': rejudge or batch_rejudge, 'status': 'QU'}
+    if pretested:
+        queryset.filter(id__in=pretested).update(is_pretested=True, **updates)
+    if in_contest - pretested:
+        queryset.filter(id__in=in_contest - pretested).update(is_pretested=False, **updates)
+    queryset.filter(id__in=ids).exclude(id__in=in_contest).update(**updates)
+
+    SubmissionTestCase.objects.filter(submission_id__in=ids).delete()
+
+    submissions = list(Submission.objects.filter(id__in=ids, status='QU').values(
+        'problem__code', 'language__key', 'source__source', 'problem__is_public', 'contest_object__key',
+        *SUBMISSION_META_FIELDS,
+    ))
+    meta = _submission_meta(submissions)
+
+    packets = []
+    packet_size = BATCH_JUDGE_PACKET_SOURCE_LIMIT
+    for data in submissions:
+        if batch_rejudge:
+            priority = BATCH_REJUDGE_PRIORITY
+        elif rejudge:
+            priority = REJUDGE_PRIORITY
+        else:
+            priority = CONTEST_SUBMISSION_PRIORITY if data['id'] in in_contest else DEFAULT_PRIORITY
+
+        source = data['source__source'] or ''
+        if packet_size + len(source) > BATCH_JUDGE_PACKET_SOURCE_LIMIT:
+            packets.append({'name': 'submission-batch-request', 'submissions': []})
+            packet_size = 0
+        packet_size += len(source)
+        packets[-1]['submissions'].append({
+            'submission-id': data['id'],
+            'problem-id': data['problem__code'],
+            'language': data['language__key'],
+            'source': source,
+            'judge-id': judge_id,
+            'priority': priority,
+            'meta': meta[data['id']],
+        })
+
+    try:
+        responses = judge_requests(packets)
+    except BaseException:
+        logger.exception('Failed to send request to judge')
+        Submission.objects.filter(id__in=ids, status='QU').update(status='IE', result='IE')
+        return 0
+
+    received = set()
+    for response in responses:
+        if response.get('name') == 'submission-batch-received':
+            received.update(response['submission-ids'])
+    if len(received) < len(submissions):
+        Submission.objects.filter(id__in=[data['id'] for data in submissions if data['id'] not in received]) \
+                          .update(status='IE', result='IE')
+
+    for data in submissions:
+        if data['problem__is_public']:
+            event.post('submissions', {'type': 'update-submission', 'id': data['id'],
+                                       'contest': data['contest_object__key'],
+                                       'user': data['user_id'], 'problem': data['problem_id'],
+                                       'status': 'QU' if data['id'] in received else 'IE',
+                                       'language': data['language__key']})
+    return len(submissions)
+
+
+def update_problem(problem):
+    # The bridge caches problem limits, and drops them when told the problem has changed.
+    try:
+        judge_request({'name': 'problem-update', 'problem-id': problem.code}, reply=False)
+    except Exception:
+        logger.warning('Failed to notify the bridge of a change to problem %s', problem.code, exc_info=True)
+
+
+def queue_stats():
+    """Return the number of submissions queued in the bridge, and a dict of how many each user id has queued."""
+    response = judge_request({'name': 'queue-stats'})
+    users = {int(user) if user else None: depth for user, depth in response.get('users', {}).items()}
+    return response.get('size', 0), users
+
+
 def disconnect_judge(judge, force=False):
     judge_request({'name': 'disconnect-judge', 'judge-id': judge.name, 'force': force}, reply=False)
 
@@ -0,0 +1,58 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Q
+
+
+def populate_user_problem_points(apps, schema_editor):
+    Submission = apps.get_model('judge', 'Submission')
+    UserProblemPoints = apps.get_model('judge', 'UserProblemPoints')
+    Problem = apps.get_model('judge', 'Problem')
+
+    results = (
+        Submission.objects.values('user_id', 'problem_id').order_by()
+                  .annotate(max_points=Max('points'), ac=Count('id', filter=Q(result='AC')),
+                            full_ac=Count('id', filter=Q(result='AC', points__gte=F('problem__points'))))
+    )
+    UserProblemPoints.objects.bulk_create((
+        UserProblemPoints(user_id=row['user_id'], problem_id=row['problem_id'], points=row['max_points'] or 0,
+                          is_ac=bool(row['ac']), is_full_ac=bool(row['full_ac'])) for row in results.iterator()
+    ), batch_size=1000)
+
+    accepted = (
+        Submission.objects.filter(result='AC', points__gte=F('problem__points'), user__is_unlisted=False)
+                  .values('problem_id').order_by().annotate(count=Count('id'))
+    )
+    for row in accepted.iterator():
+        Problem.objects.filter(id=row['problem_id']).update(ac_submission_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0110_default_output_prefix_override'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='ac_submission_count',
+            field=models.IntegerField(default=0, help_text='The number of accepted submissions with full points.', verbose_name='number of accepted submissions'),
+        ),
+        migrations.CreateModel(
+            name='UserProblemPoints',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.FloatField(default=0, verbose_name='best points')),
+                ('is_ac', models.BooleanField(default=False, verbose_name='has an accepted submission')),
+                ('is_full_ac', models.BooleanField(default=False, verbose_name='has an accepted submission with full points')),
+                ('problem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_points', to='judge.Problem', verbose_name='problem')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='problem_points', to='judge.Profile', verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'user problem points',
+                'verbose_name_plural': 'user problem points',
+                'unique_together': {('user', 'problem')},
+            },
+        ),
+        migrations.RunPython(populate_user_problem_points, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0111_user_problem_points'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contest',
+            name='frozen_last_minutes',
+            field=models.PositiveIntegerField(default=0, help_text='If not zero, the scoreboard stops changing this many minutes before the end of the contest, except for those who can see hidden scoreboards.', verbose_name='frozen last minutes'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_submission_count(apps, schema_editor):
+    Submission = apps.get_model('judge', 'Submission')
+    Problem = apps.get_model('judge', 'Problem')
+
+    for row in Submission.objects.values('problem_id').order_by().annotate(count=Count('id')).iterator():
+        Problem.objects.filter(id=row['problem_id']).update(submission_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0112_contest_frozen_last_minutes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problem',
+            name='submission_count',
+            field=models.IntegerField(default=0, help_text='The number of submissions, from which the solve rate is computed.', verbose_name='number of submissions'),
+        ),
+        migrations.RunPython(populate_submission_count, reverse_code=migrations.RunPython.noop),
+    ]
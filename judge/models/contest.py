@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models, transaction
@@ -14,7 +16,7 @@ from judge import contest_format
 from judge.models.problem import Problem
 from judge.models.profile import Organization, Profile
 from judge.models.submission import Submission
-from judge.ratings import rate_contest
+from judge.ratings import replay_ratings
 
 __all__ = ['Contest', 'ContestTag', 'ContestParticipation', 'ContestProblem', 'ContestSubmission', 'Rating']
 
@@ -74,6 +76,10 @@ class Contest(models.Model):
                                           help_text=_('Whether the scoreboard should remain hidden for the duration '
                                                       'of the contest.'),
                                           default=False)
+    frozen_last_minutes = models.PositiveIntegerField(verbose_name=_('frozen last minutes'), default=0,
+                                                      help_text=_('If not zero, the scoreboard stops changing this '
+                                                                  'many minutes before the end of the contest, except '
+                                                                  'for those who can see hidden scoreboards.'))
     view_contest_scoreboard = models.ManyToManyField(Profile, verbose_name=_('view contest scoreboard'), blank=True,
                                                      related_name='view_contest_scoreboard',
                                                      help_text=_('These users will be able to view the scoreboard.'))
@@ -181,6 +187,9 @@ class Contest(models.Model):
     def can_see_full_scoreboard(self, user):
         if self.show_scoreboard:
             return True
+        return self.can_see_hidden_scoreboard(user)
+
+    def can_see_hidden_scoreboard(self, user):
         if user.has_perm('judge.see_private_contest'):
             return True
         if self.is_editable_by(user):
@@ -189,6 +198,22 @@ class Contest(models.Model):
             return True
         return False
 
+    def can_see_live_scoreboard(self, user):
+        """Whether the scoreboard `user` sees is up to date, rather than as it was when it was frozen."""
+        if not self.can_see_full_scoreboard(user):
+            return False
+        return not self.is_frozen or self.can_see_hidden_scoreboard(user)
+
+    @property
+    def frozen_time(self):
+        if not self.frozen_last_minutes:
+            return None
+        return self.end_time - timedelta(minutes=self.frozen_last_minutes)
+
+    @cached_property
+    def is_frozen(self):
+        return self.frozen_time is not None and self.frozen_time <= self._now and not self.ended
+
     @cached_property
     def show_scoreboard(self):
         if not self.can_join:
@@ -331,9 +356,7 @@ class Contest(models.Model):
         return queryset.distinct()
 
     def rate(self):
-        Rating.objects.filter(contest__end_time__gte=self.end_time).delete()
-        for contest in Contest.objects.filter(is_rated=True, end_time__gte=self.end_time).order_by('end_time'):
-            rate_contest(contest)
+        replay_ratings(self)
 
     class Meta:
         permissions = (
@@ -370,18 +393,22 @@ class ContestParticipation(models.Model):
     format_data = JSONField(verbose_name=_('contest format specific data'), null=True, blank=True)
 
     def recompute_results(self):
+        from judge.utils.scoreboard import update_scoreboard
+
         with transaction.atomic():
             self.contest.format.update_participation(self)
             if self.is_disqualified:
                 self.score = -9999
                 self.save(update_fields=['score'])
+        transaction.on_commit(lambda: update_scoreboard(self))
     recompute_results.alters_data = True
 
     def set_disqualified(self, disqualified):
         self.is_disqualified = disqualified
         self.recompute_results()
         if self.contest.is_rated and self.contest.ratings.exists():
-            self.contest.rate()
+            from judge.tasks import rate_contests
+            transaction.on_commit(rate_contests.s(self.contest.key).delay)
         if self.is_disqualified:
             if self.user.current_contest == self:
                 self.user.remove_contest()
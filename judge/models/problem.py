@@ -5,7 +5,7 @@ from django.contrib.contenttypes.fields import GenericRelation
 from django.core.cache import cache
 from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
 from django.db import models
-from django.db.models import CASCADE, F, Q, QuerySet, SET_NULL
+from django.db.models import CASCADE, Case, F, Q, QuerySet, SET_NULL, Value, When
 from django.db.models.expressions import RawSQL
 from django.db.models.functions import Coalesce
 from django.urls import reverse
@@ -148,6 +148,11 @@ class Problem(models.Model):
     user_count = models.IntegerField(verbose_name=_('number of users'), default=0,
                                      help_text=_('The number of users who solved the problem.'))
     ac_rate = models.FloatField(verbose_name=_('solve rate'), default=0)
+    ac_submission_count = models.IntegerField(verbose_name=_('number of accepted submissions'), default=0,
+                                              help_text=_('The number of accepted submissions with full points.'))
+    submission_count = models.IntegerField(verbose_name=_('number of submissions'), default=0,
+                                           help_text=_('The number of submissions, from which the solve rate is '
+                                                       'computed.'))
     is_full_markup = models.BooleanField(verbose_name=_('allow full markdown access'), default=False)
 
     objects = TranslatedProblemQuerySet.as_manager()
@@ -336,18 +341,48 @@ class Problem(models.Model):
         return ProblemClarification.objects.filter(problem=self)
 
     def update_stats(self):
-        self.user_count = self.submission_set.filter(points__gte=self.points, result='AC',
-                                                     user__is_unlisted=False).values('user').distinct().count()
-        submissions = self.submission_set.count()
-        if submissions:
-            self.ac_rate = 100.0 * self.submission_set.filter(points__gte=self.points, result='AC',
-                                                              user__is_unlisted=False).count() / submissions
+        accepted = self.submission_set.filter(points__gte=self.points, result='AC', user__is_unlisted=False)
+        self.user_count = accepted.values('user').distinct().count()
+        self.ac_submission_count = accepted.count()
+        self.submission_count = self.submission_set.count()
+        if self.submission_count:
+            self.ac_rate = 100.0 * self.ac_submission_count / self.submission_count
         else:
             self.ac_rate = 0
         self.save()
 
     update_stats.alters_data = True
 
+    def add_graded_submissions(self, submissions, new_solvers):
+        """
+        Account for freshly graded submissions in the statistics, without recounting every submission.
+
+        `new_solvers` is the number of users for whom these are the first accepted submissions with full points. The
+        counters are updated in the database only, and update_stats remains the way to recompute them from scratch.
+        The total number of submissions is counted as they are made, by add_submission.
+        """
+        accepted = sum(submission.result == 'AC' and (submission.points or 0) >= self.points
+                       for submission in submissions if not submission.user.is_unlisted)
+        if any(submission.user.is_unlisted for submission in submissions):
+            new_solvers = 0
+
+        problems = Problem.objects.filter(id=self.id)
+        if accepted or new_solvers:
+            problems.update(ac_submission_count=F('ac_submission_count') + accepted,
+                            user_count=F('user_count') + new_solvers)
+        # Some databases see the updated values in the rest of the SET clause and others do not, so the rate is
+        # updated separately from the counts it derives from.
+        problems.update(ac_rate=Case(When(submission_count=0, then=Value(0.0)),
+                                     default=100.0 * F('ac_submission_count') / F('submission_count'),
+                                     output_field=models.FloatField()))
+
+    add_graded_submissions.alters_data = True
+
+    @classmethod
+    def add_submission(cls, problem_id):
+        """Count a new submission to a problem, in the database only."""
+        cls.objects.filter(id=problem_id).update(submission_count=F('submission_count') + 1)
+
     def _get_limits(self, key):
         global_limit = getattr(self, key)
         limits = {limit['language_id']: (limit['language__name'], limit[key])
@@ -164,6 +164,21 @@ class Profile(models.Model):
         extradata = (
             public_problems.filter(submission__user=self, submission__result='AC').values('id').distinct().count()
         )
+        return self._set_points(data, extradata, table)
+
+    calculate_points.alters_data = True
+
+    def update_points(self, table=_pp_table):
+        """Like calculate_points, but reads the best result on each problem from UserProblemPoints."""
+        from judge.models import Problem
+        results = self.problem_points.filter(problem__in=Problem.get_public_problems())
+        data = results.filter(points__gt=0).order_by('-points').values_list('points', flat=True)
+        return self._set_points(data, results.filter(is_ac=True).count(), table)
+
+    update_points.alters_data = True
+
+    def _set_points(self, data, extradata, table):
+        data = list(data)
         bonus_function = settings.DMOJ_PP_BONUS_FUNCTION
         points = sum(data)
         problems = len(data)
@@ -176,8 +191,6 @@ class Profile(models.Model):
             self.save(update_fields=['points', 'problem_count', 'performance_points'])
         return points
 
-    calculate_points.alters_data = True
-
     def generate_api_token(self):
         secret = secrets.token_bytes(32)
         self.api_token = hmac.new(force_bytes(settings.SECRET_KEY), msg=secret, digestmod='sha256').hexdigest()
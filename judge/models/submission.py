@@ -3,7 +3,8 @@ import hmac
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Max, Q
 from django.urls import reverse
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
@@ -14,7 +15,7 @@ from judge.models.profile import Profile
 from judge.models.runtime import Language
 from judge.utils.unicode import utf8bytes
 
-__all__ = ['SUBMISSION_RESULT', 'Submission', 'SubmissionSource', 'SubmissionTestCase']
+__all__ = ['SUBMISSION_RESULT', 'Submission', 'SubmissionSource', 'SubmissionTestCase', 'UserProblemPoints']
 
 SUBMISSION_RESULT = (
     ('AC', _('Accepted')),
@@ -141,7 +142,7 @@ class Submission(models.Model):
             return True
         return False
 
-    def update_contest(self):
+    def update_contest(self, recompute=True):
         try:
             contest = self.contest
         except AttributeError:
@@ -153,7 +154,8 @@ class Submission(models.Model):
         if not contest_problem.partial and contest.points != contest_problem.points:
             contest.points = 0
         contest.save()
-        contest.participation.recompute_results()
+        if recompute:
+            contest.participation.recompute_results()
 
     update_contest.alters_data = True
 
@@ -235,3 +237,77 @@ class SubmissionTestCase(models.Model):
         unique_together = ('submission', 'case')
         verbose_name = _('submission test case')
         verbose_name_plural = _('submission test cases')
+
+
+class UserProblemPoints(models.Model):
+    """
+    The best result of every user on every problem they submitted to.
+
+    This is kept up to date as submissions are graded, so that user points and problem statistics do not have to
+    aggregate over all submissions every time. Profile.calculate_points and Problem.update_stats still compute
+    everything from the submissions, and remain the way to reconcile.
+    """
+    user = models.ForeignKey(Profile, verbose_name=_('user'), related_name='problem_points', on_delete=models.CASCADE)
+    problem = models.ForeignKey(Problem, verbose_name=_('problem'), related_name='user_points',
+                                on_delete=models.CASCADE)
+    points = models.FloatField(verbose_name=_('best points'), default=0)
+    is_ac = models.BooleanField(verbose_name=_('has an accepted submission'), default=False)
+    is_full_ac = models.BooleanField(verbose_name=_('has an accepted submission with full points'), default=False)
+
+    NONE = (0, False, False)
+
+    @property
+    def result(self):
+        return self.points, self.is_ac, self.is_full_ac
+
+    @staticmethod
+    def _best_result():
+        return {'max_points': Max('points'), 'ac': Count('id', filter=Q(result='AC')),
+                'full_ac': Count('id', filter=Q(result='AC', points__gte=F('problem__points')))}
+
+    @classmethod
+    def rebuild(cls, **filters):
+        """Recompute the rows for the submissions matching `filters`, e.g. user_id or problem_id, from scratch."""
+        results = (
+            Submission.objects.filter(**filters).values('user_id', 'problem_id').order_by()
+                      .annotate(**cls._best_result())
+        )
+        with transaction.atomic():
+            cls.objects.filter(**filters).delete()
+            cls.objects.bulk_create([
+                cls(user_id=row['user_id'], problem_id=row['problem_id'], points=row['max_points'] or 0,
+                    is_ac=bool(row['ac']), is_full_ac=bool(row['full_ac'])) for row in results
+            ], batch_size=1000)
+
+    @classmethod
+    def record(cls, submission):
+        """
+        Fold a graded submission into its user's row for the problem.
+
+        Returns the (points, is_ac, is_full_ac) of the row before and after. A fresh submission can only improve the
+        best result, but a rejudge may also worsen it, so the row is then recomputed from the submissions.
+        """
+        filters = {'user_id': submission.user_id, 'problem_id': submission.problem_id}
+        with transaction.atomic():
+            # Make sure the row exists before locking it, as nothing would be locked otherwise, and two first
+            # gradings could then both go on to create it.
+            cls.objects.bulk_create([cls(**filters)], ignore_conflicts=True)
+            row = cls.objects.select_for_update().get(**filters)
+            old = row.result
+
+            if submission.was_rejudged:
+                best = Submission.objects.filter(**filters).aggregate(**cls._best_result())
+                new = (best['max_points'] or 0, bool(best['ac']), bool(best['full_ac']))
+            else:
+                points = submission.points or 0
+                is_ac = submission.result == 'AC'
+                new = (max(old[0], points), old[1] or is_ac, old[2] or (is_ac and points >= submission.problem.points))
+            if new != old:
+                row.points, row.is_ac, row.is_full_ac = new
+                row.save(update_fields=['points', 'is_ac', 'is_full_ac'])
+            return old, new
+
+    class Meta:
+        unique_together = ('user', 'problem')
+        verbose_name = _('user problem points')
+        verbose_name_plural = _('user problem points')
@@ -1,10 +1,15 @@
+import unittest
+
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import SimpleTestCase, TestCase
 from django.utils import timezone
 
-from judge.models import Contest, ContestParticipation, ContestTag
+from judge.models import Contest, ContestParticipation, ContestSubmission, ContestTag, Language, Submission, \
+    SubmissionTestCase
 from judge.models.contest import MinValueOrNoneValidator
-from judge.models.tests.util import CommonDataMixin, create_contest, create_contest_participation, create_user
+from judge.models.tests.util import CommonDataMixin, create_contest, create_contest_participation, \
+    create_contest_problem, create_user
 
 
 class ContestTestCase(CommonDataMixin, TestCase):
@@ -413,6 +418,129 @@ class ContestTestCase(CommonDataMixin, TestCase):
         self.assertIsInstance(participation.end_time, timezone.datetime)
 
 
+class UpdateParticipationsTestCase(TestCase):
+    # Submissions as (user, problem index, result, points, minutes into the contest, test case points by batch).
+    SUBMISSIONS = (
+        ('alice', 0, 'WA', 0, 5, (0, 0)),
+        ('alice', 0, 'CE', 0, 6, ()),
+        ('alice', 0, 'AC', 100, 10, (50, 50)),
+        ('alice', 0, 'WA', 50, 12, (50, 0)),
+        ('alice', 1, 'AC', 100, 30, (50, 50)),
+        ('bob', 0, 'WA', 50, 8, (50, 0)),
+        ('bob', 0, 'WA', 50, 9, (0, 50)),
+        ('bob', 1, 'WA', 0, 20, (0, 0)),
+        ('bob', 1, 'IE', 0, 21, ()),
+        ('carol', 1, 'TLE', 50, 40, (0, 50)),
+    )
+
+    @classmethod
+    def setUpTestData(self):
+        self.start = timezone.now() - timezone.timedelta(days=1)
+        self.contests = {}
+        for format_name in ('default', 'ecoo', 'icpc', 'atcoder', 'ioi', 'ioi16'):
+            contest = create_contest(key='bulk_%s' % format_name, format_name=format_name, start_time=self.start)
+            problems = [create_contest_problem(contest=contest, problem='bulk_%s' % problem, partial=True,
+                                               order=order) for order, problem in enumerate('ab')]
+            participations = {
+                username: create_contest_participation(contest=contest, user='bulk_%s' % username)
+                for username in ('alice', 'bob', 'carol', 'dave')
+            }
+            for username, index, result, points, minutes, batches in self.SUBMISSIONS:
+                participation = participations[username]
+                problem = problems[index]
+                submission = Submission.objects.create(user=participation.user, problem=problem.problem,
+                                                       language=Language.get_python3(), result=result, status='D',
+                                                       points=points)
+                Submission.objects.filter(id=submission.id).update(
+                    date=self.start + timezone.timedelta(minutes=minutes))
+                ContestSubmission.objects.create(submission=submission, problem=problem,
+                                                 participation=participation, points=points)
+                for case, case_points in enumerate(batches, 1):
+                    SubmissionTestCase.objects.create(submission=submission, case=case, status=result,
+                                                      points=case_points, total=50, batch=case)
+            self.contests[format_name] = contest
+
+    def results(self, contest):
+        return {
+            participation.id: (participation.score, participation.cumtime, participation.tiebreaker,
+                               participation.format_data)
+            for participation in contest.users.order_by('id')
+        }
+
+    def assertBulkUpdateMatches(self, format_name):
+        contest = self.contests[format_name]
+        for participation in contest.users.all():
+            contest.format.update_participation(participation)
+        expected = self.results(contest)
+
+        contest.users.update(score=0, cumtime=0, tiebreaker=0, format_data=None)
+        self.assertEqual(contest.format.update_participations(contest.users.all()), 4)
+        self.assertEqual(self.results(contest), expected)
+
+    def test_default(self):
+        self.assertBulkUpdateMatches('default')
+
+    def test_ecoo(self):
+        self.assertBulkUpdateMatches('ecoo')
+
+    def test_legacy_ioi(self):
+        self.assertBulkUpdateMatches('ioi')
+
+    def test_icpc(self):
+        self.assertBulkUpdateMatches('icpc')
+
+    def test_atcoder(self):
+        self.assertBulkUpdateMatches('atcoder')
+
+    # The raw SQL of this format relies on MySQL returning dates as datetime objects.
+    @unittest.skipUnless(connection.vendor == 'mysql', 'requires MySQL')
+    def test_ioi16(self):
+        self.assertBulkUpdateMatches('ioi16')
+
+    def test_results_until(self):
+        # Results as of a time match those recomputed as if no submissions were made since.
+        until = self.start + timezone.timedelta(minutes=15)
+        for format_name in ('default', 'ecoo', 'icpc', 'atcoder', 'ioi', 'ioi16'):
+            if format_name == 'ioi16' and connection.vendor != 'mysql':
+                continue
+            contest = self.contests[format_name]
+            with self.subTest(format=format_name):
+                participations = list(contest.users.order_by('id'))
+                contest.format.set_participation_results(participations, until=until)
+                ContestSubmission.objects.filter(participation__contest=contest, submission__date__gt=until).delete()
+                contest.format.update_participations(contest.users.all())
+                self.assertEqual({participation.id: (participation.score, participation.cumtime,
+                                                     participation.tiebreaker, participation.format_data)
+                                  for participation in participations}, self.results(contest))
+
+    def test_recompute_queries(self):
+        # Recomputing results takes a fixed number of queries, however many problems were attempted: one to compute
+        # them, and one to save them, along with the savepoint around them.
+        for format_name in ('default', 'icpc', 'atcoder'):
+            contest = self.contests[format_name]
+            for participation in contest.users.select_related('contest').order_by('id'):
+                with self.subTest(format=format_name, user=participation.user.username), self.assertNumQueries(4):
+                    participation.recompute_results()
+
+    def test_icpc_penalties(self):
+        contest = self.contests['icpc']
+        problems = [str(problem.id) for problem in contest.contest_problems.order_by('order')]
+        contest.format.update_participations(contest.users.all())
+        alice, bob, carol, dave = contest.users.order_by('id')
+
+        # Alice's CE is not counted, nor is her WA after solving the problem.
+        self.assertEqual(alice.format_data[problems[0]], {'time': 600, 'points': 100, 'penalty': 1})
+        self.assertEqual(alice.format_data[problems[1]], {'time': 1800, 'points': 100, 'penalty': 0})
+        self.assertEqual((alice.score, alice.cumtime, alice.tiebreaker), (200, 600 + 1800 + 20 * 60, 1800))
+        # Bob's first partial score counts, his IE is not counted, and unsolved problems show their attempts without
+        # adding to the penalty.
+        self.assertEqual(bob.format_data[problems[0]], {'time': 480, 'points': 50, 'penalty': 0})
+        self.assertEqual(bob.format_data[problems[1]], {'time': 1200, 'points': 0, 'penalty': 1})
+        self.assertEqual((bob.score, bob.cumtime, bob.tiebreaker), (50, 480, 480))
+        self.assertEqual((carol.score, carol.format_data[problems[1]]['penalty']), (50, 0))
+        self.assertEqual((dave.score, dave.cumtime, dave.format_data), (0, 0, {}))
+
+
 class ContestTagTestCase(TestCase):
     @classmethod
     def setUpTestData(self):
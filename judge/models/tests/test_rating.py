@@ -0,0 +1,90 @@
+from collections import defaultdict
+from operator import itemgetter
+
+from django.test import TestCase
+from django.utils import timezone
+
+from judge.models import Contest, Profile, Rating
+from judge.models.tests.util import create_contest, create_contest_participation, create_user
+from judge.ratings import recalculate_ratings, replay_ratings
+from judge.utils.ranker import tie_ranker
+
+
+class ReplayRatingsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        now = timezone.now()
+        self.contests = [
+            create_contest(key='replay_%d' % i, is_rated=True, rate_all=True,
+                           start_time=now - timezone.timedelta(days=10 - i),
+                           end_time=now - timezone.timedelta(days=9 - i))
+            for i in range(3)
+        ]
+        # Contest scores by user, with None for a contest not entered.
+        self.scores = {
+            'alice': (300, 100, 200),
+            'bob': (200, 300, None),
+            'carol': (100, 200, 300),
+            'dave': (None, 0, 100),
+        }
+        for username, scores in self.scores.items():
+            profile = create_user(username=username).profile
+            for contest, score in zip(self.contests, scores):
+                if score is not None:
+                    create_contest_participation(contest=contest, user=profile, score=score)
+
+    def expected(self):
+        # What rating each contest in order from scratch gives, as username -> [(contest key, rating, volatility)].
+        state = {}
+        expected = defaultdict(list)
+        for contest in Contest.objects.filter(is_rated=True).order_by('end_time'):
+            participations = list(contest.users.filter(virtual=0).order_by('-score')
+                                  .values_list('user__user__username', 'score'))
+            participations = [(username, score) for username, score in participations
+                              if not contest.rate_exclude.filter(user__username=username).exists()]
+            old = [state.get(username, (1200, 535, 0)) for username, _ in participations]
+            ranks = [rank for rank, _ in tie_ranker(participations, key=itemgetter(1))]
+            rating, volatility = recalculate_ratings([r for r, _, _ in old], [v for _, v, _ in old], ranks,
+                                                     [t for _, _, t in old])
+            for (username, _), r, v, (_, _, times) in zip(participations, rating, volatility, old):
+                state[username] = (r, v, times + 1)
+                expected[username].append((contest.key, r, v))
+        return expected
+
+    def ratings(self):
+        ratings = defaultdict(list)
+        for username, key, rating, volatility in Rating.objects.order_by('contest__end_time').values_list(
+                'user__user__username', 'contest__key', 'rating', 'volatility'):
+            ratings[username].append((key, rating, volatility))
+        return ratings
+
+    def assertProfileRatings(self):
+        for username, ratings in self.ratings().items():
+            self.assertEqual(Profile.objects.get(user__username=username).rating, ratings[-1][1])
+
+    def test_replay(self):
+        rated = []
+        self.assertEqual(replay_ratings(self.contests[0], callback=rated.append), 10)
+        self.assertEqual(rated, self.contests)
+        self.assertEqual(self.ratings(), self.expected())
+        self.assertProfileRatings()
+        self.assertEqual(replay_ratings(self.contests[0]), 0)
+
+    def test_replay_later(self):
+        replay_ratings(self.contests[0])
+        last_rated = dict(Rating.objects.values_list('id', 'last_rated'))
+
+        # Excluding Dave from the second contest changes everyone's rating from there, and removes one.
+        self.contests[1].rate_exclude.add(Profile.objects.get(user__username='dave'))
+        self.assertEqual(replay_ratings(self.contests[1]), 7)
+        self.assertEqual(self.ratings(), self.expected())
+        self.assertProfileRatings()
+        first = Rating.objects.filter(contest=self.contests[0]).values_list('id', 'last_rated')
+        self.assertEqual(dict(first), {id: last_rated[id] for id, _ in first})
+
+    def test_unrated(self):
+        replay_ratings(self.contests[0])
+        Contest.objects.filter(id=self.contests[2].id).update(is_rated=False)
+        self.assertEqual(replay_ratings(self.contests[2]), 3)
+        self.assertFalse(Rating.objects.filter(contest=self.contests[2]).exists())
+        self.assertProfileRatings()
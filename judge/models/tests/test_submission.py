@@ -1,6 +1,10 @@
+from unittest import mock
+
 from django.test import TestCase
 
-from judge.models import ContestSubmission, Language, Submission, SubmissionSource
+from judge.judgeapi import REJUDGE_PRIORITY, judge_submissions
+from judge.models import ContestSubmission, Language, Problem, Profile, Submission, SubmissionSource, \
+    UserProblemPoints
 from judge.models.tests.util import CommonDataMixin, create_contest, create_contest_participation, \
     create_contest_problem, create_problem, create_user
 
@@ -159,3 +163,146 @@ class SubmissionTestCase(CommonDataMixin, TestCase):
             },
         }
         self._test_object_methods_with_users(self.ie_submission, data)
+
+
+class BatchJudgeTestCase(CommonDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(self):
+        super().setUpTestData()
+        problem = create_problem(code='batch_judge')
+        contest = create_contest(key='batch_judge', run_pretests_only=True)
+        participation = create_contest_participation(contest=contest, user='normal')
+        contest_problem = create_contest_problem(problem=problem, contest=contest, is_pretested=True)
+
+        self.submissions = []
+        for i in range(5):
+            submission = Submission.objects.create(
+                user=self.users['normal'].profile,
+                problem=problem,
+                language=Language.get_python3(),
+                result='WA',
+                status='D',
+                points=0,
+                is_locked=i == 4,
+            )
+            SubmissionSource.objects.create(submission=submission, source='print(%d)' % i)
+            submission.test_cases.create(case=1, status='WA')
+            self.submissions.append(submission)
+
+        ContestSubmission.objects.create(
+            submission=self.submissions[0], problem=contest_problem, participation=participation,
+        )
+
+    def test_judge_submissions(self):
+        def reply(packets):
+            return [{'name': 'submission-batch-received',
+                     'submission-ids': [item['submission-id'] for item in packet['submissions']]}
+                    for packet in packets]
+
+        ids = [submission.id for submission in self.submissions]
+        with mock.patch('judge.judgeapi.judge_requests', side_effect=reply) as judge_requests:
+            self.assertEqual(judge_submissions(ids, rejudge=True), 4)
+
+        packets = judge_requests.call_args[0][0]
+        self.assertEqual(len(packets), 1)
+        self.assertEqual([item['submission-id'] for item in packets[0]['submissions']], ids[:4])
+        self.assertEqual(packets[0]['submissions'][2]['source'], 'print(2)')
+        self.assertEqual({item['priority'] for item in packets[0]['submissions']}, {REJUDGE_PRIORITY})
+        self.assertEqual(packets[0]['submissions'][0]['meta'], {
+            'pretests-only': True, 'in-contest': 0, 'attempt-no': 1, 'user': self.users['normal'].profile.id,
+        })
+        self.assertEqual(packets[0]['submissions'][1]['meta']['in-contest'], None)
+
+        self.assertEqual(list(Submission.objects.filter(id__in=ids).order_by('id').values_list('status', flat=True)),
+                         ['QU'] * 4 + ['D'])
+        self.assertTrue(Submission.objects.get(id=ids[0]).is_pretested)
+        self.assertTrue(Submission.objects.get(id=ids[1]).was_rejudged)
+        self.assertEqual(sum(submission.test_cases.count() for submission in self.submissions), 1)
+
+    def test_judge_submissions_failure(self):
+        ids = [submission.id for submission in self.submissions]
+        with mock.patch('judge.judgeapi.judge_requests', side_effect=ValueError):
+            self.assertEqual(judge_submissions(ids), 0)
+        self.assertEqual(Submission.objects.filter(id__in=ids, status='IE').count(), 4)
+
+
+class UserProblemPointsTestCase(CommonDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(self):
+        super().setUpTestData()
+        self.problem = create_problem(code='best_points', points=10, partial=True, is_public=True)
+        self.profile = self.users['normal'].profile
+
+    def grade(self, result, points, was_rejudged=False, submission=None):
+        if submission is None:
+            submission = Submission(user=self.profile, problem=self.problem, language=Language.get_python3())
+        submission.result = result
+        submission.points = points
+        submission.status = 'D'
+        submission.was_rejudged = was_rejudged
+        submission.save()
+
+        old, new = UserProblemPoints.record(submission)
+        self.profile.update_points()
+        if was_rejudged:
+            self.problem.update_stats()
+        else:
+            self.problem.add_graded_submissions([submission], new_solvers=int(new[2] and not old[2]))
+        return submission, old, new
+
+    def assertReconciled(self):
+        incremental = Profile.objects.get(id=self.profile.id), Problem.objects.get(id=self.problem.id)
+        rows = UserProblemPoints.objects.filter(problem=self.problem).values_list('points', 'is_ac', 'is_full_ac')
+        table = list(rows)
+
+        UserProblemPoints.rebuild(problem_id=self.problem.id)
+        self.profile.calculate_points()
+        self.problem.update_stats()
+
+        self.assertEqual(table, list(rows.all()))
+        profile, problem = incremental
+        for attr in ('points', 'problem_count', 'performance_points'):
+            self.assertEqual(getattr(profile, attr), getattr(self.profile, attr), attr)
+        for attr in ('user_count', 'ac_submission_count', 'submission_count', 'ac_rate'):
+            self.assertEqual(getattr(problem, attr), getattr(self.problem, attr), attr)
+
+    def test_incremental(self):
+        self.assertEqual(self.grade('WA', 4)[1:], (UserProblemPoints.NONE, (4, False, False)))
+        self.assertReconciled()
+        accepted, old, new = self.grade('AC', 10)
+        self.assertEqual(new, (10, True, True))
+        self.assertReconciled()
+        self.assertEqual(self.grade('WA', 2)[1:], ((10, True, True), (10, True, True)))
+        self.assertReconciled()
+        self.assertEqual(self.problem.user_count, 1)
+        self.assertEqual(self.problem.ac_submission_count, 1)
+
+        # A rejudge can make the best result worse.
+        self.assertEqual(self.grade('WA', 5, was_rejudged=True, submission=accepted)[2], (5, False, False))
+        self.assertReconciled()
+        self.assertEqual(self.problem.user_count, 0)
+        self.assertEqual(self.profile.points, 5)
+
+    def test_no_recount(self):
+        submission = self.grade('WA', 4)[0]
+        submission.result, submission.points = 'AC', 10
+        # The counters, then the rate derived from them.
+        with self.assertNumQueries(2):
+            self.problem.add_graded_submissions([submission], new_solvers=1)
+        problem = Problem.objects.get(id=self.problem.id)
+        self.assertEqual((problem.submission_count, problem.ac_submission_count, problem.ac_rate), (1, 1, 100))
+
+    def test_first_grading(self):
+        # Even a first grading that scores nothing has a row, like one from a rebuild.
+        self.assertEqual(self.grade('WA', 0)[1:], (UserProblemPoints.NONE, UserProblemPoints.NONE))
+        self.assertReconciled()
+
+        # Another grading may create the row first, and is then built on rather than overwritten.
+        UserProblemPoints.objects.filter(problem=self.problem).update(points=7)
+        self.assertEqual(self.grade('WA', 4)[1:], ((7, False, False), (7, False, False)))
+
+    def test_delete(self):
+        submission = self.grade('AC', 10)[0]
+        submission.delete()
+        self.assertFalse(UserProblemPoints.objects.filter(problem=self.problem).exists())
+        self.assertReconciled()
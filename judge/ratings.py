@@ -1,12 +1,20 @@
 import math
 from bisect import bisect
-from operator import itemgetter
+from collections import defaultdict
+from itertools import groupby
+from operator import attrgetter, itemgetter
 
 from django.db import connection, transaction
-from django.db.models import Count
+from django.db.models import Count, Q
 from django.utils import timezone
 
 from judge.utils.ranker import tie_ranker
+from judge.utils.raw_sql import bulk_update_values
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 def rational_approximation(t):
@@ -35,7 +43,7 @@ def WP(RA, RB, VA, VB):
     return (math.erf((RB - RA) / math.sqrt(2 * (VA * VA + VB * VB))) + 1) / 2.0
 
 
-def recalculate_ratings(old_rating, old_volatility, actual_rank, times_rated):
+def recalculate_ratings_python(old_rating, old_volatility, actual_rank, times_rated):
     # actual_rank: 1 is first place, N is last place
     # if there are ties, use the average of places (if places 2, 3, 4, 5 tie, use 3.5 for all of them)
 
@@ -93,8 +101,114 @@ def recalculate_ratings(old_rating, old_volatility, actual_rank, times_rated):
     return list(map(int, map(round, new_rating))), list(map(int, map(round, new_volatility)))
 
 
+# Win probabilities are computed by recalculate_ratings_numpy in blocks of rows with about this many elements, which
+# keeps the arrays involved in the CPU cache, and memory use bounded for contests of any size.
+WP_BLOCK_SIZE = 1 << 16
+
+# math.erf is not vectorized, and NumPy has no erf of its own, so erf is computed by Taylor polynomials around
+# multiples of ERF_STEP, whose coefficients are tabulated. Their terms involve Hermite polynomials, as
+# erf'(x) = 2 / sqrt(pi) * e^(-x^2), and the nth derivative of e^(-x^2) is (-1)^n * H_n(x) * e^(-x^2). With steps
+# this small, ERF_DEGREE is enough to be exact to double precision. Past ERF_MAX, erf(x) rounds to +/-1.
+ERF_STEP = 1 / 256
+ERF_MAX = 6.0
+ERF_DEGREE = 5
+_erf_coefficients = None
+
+
+def _make_erf_coefficients():
+    points = np.arange(-int(ERF_MAX / ERF_STEP), int(ERF_MAX / ERF_STEP) + 1) * ERF_STEP
+    slopes = 2 / math.sqrt(math.pi) * np.exp(-points * points)
+    coefficients = [np.array([math.erf(point) for point in points])]
+    # H_(n + 1)(x) = 2x * H_n(x) - 2n * H_(n - 1)(x)
+    hermite_prev, hermite = np.zeros_like(points), np.ones_like(points)
+    for n in range(ERF_DEGREE):
+        if n:
+            hermite_prev, hermite = hermite, 2 * points * hermite - 2 * (n - 1) * hermite_prev
+        coefficients.append((-1) ** n * slopes * hermite / math.factorial(n + 1))
+    return coefficients
+
+
+def erf_numpy(x):
+    global _erf_coefficients
+    if _erf_coefficients is None:
+        _erf_coefficients = _make_erf_coefficients()
+
+    x = np.clip(x, -ERF_MAX, ERF_MAX)
+    index = ((x + ERF_MAX) * (1 / ERF_STEP) + 0.5).astype(np.intp)
+    d = x - (index * ERF_STEP - ERF_MAX)
+    result = _erf_coefficients[-1].take(index)
+    for coefficient in reversed(_erf_coefficients[:-1]):
+        result *= d
+        result += coefficient.take(index)
+    return result
+
+
+def normal_CDF_inverse_numpy(p):
+    assert np.all((0.0 < p) & (p < 1))
+    return np.where(p < 0.5, -rational_approximation(np.sqrt(-2.0 * np.log(p))),
+                    rational_approximation(np.sqrt(-2.0 * np.log(1.0 - p))))
+
+
+def WP_numpy(RA, RB, VA, VB):
+    return (erf_numpy((RB - RA) / np.sqrt(2 * (VA * VA + VB * VB))) + 1) / 2.0
+
+
+def recalculate_ratings_numpy(old_rating, old_volatility, actual_rank, times_rated):
+    """A vectorized recalculate_ratings_python, with the same results, which takes O(N^2) time but only in NumPy."""
+    N = len(old_rating)
+    if N <= 1:
+        return old_rating[:], old_volatility[:]
+
+    old_rating = np.array(old_rating, dtype=np.float64)
+    old_volatility = np.array(old_volatility, dtype=np.float64)
+    actual_rank = np.array(actual_rank, dtype=np.float64)
+    times_rated = np.array(times_rated, dtype=np.float64)
+
+    ave_rating = old_rating.sum() / N
+    sum1 = (old_volatility * old_volatility).sum() / N
+    sum2 = ((old_rating - ave_rating) ** 2).sum() / (N - 1)
+    CF = math.sqrt(sum1 + sum2)
+
+    # Contestants with the same rating and volatility, like all unrated ones, have the same chance of beating anyone.
+    opponents, counts = np.unique(np.stack([old_rating, old_volatility], axis=1), axis=0, return_counts=True)
+    ERank = np.full(N, 0.5)
+    rows = max(1, WP_BLOCK_SIZE // len(opponents))
+    for start in range(0, N, rows):
+        block = slice(start, start + rows)
+        ERank[block] += WP_numpy(old_rating[block, None], opponents[:, 0], old_volatility[block, None],
+                                 opponents[:, 1]) @ counts
+
+    EPerf = -normal_CDF_inverse_numpy((ERank - 0.5) / N)
+    APerf = -normal_CDF_inverse_numpy((actual_rank - 0.5) / N)
+    PerfAs = old_rating + CF * (APerf - EPerf)
+    Weight = 1.0 / (1 - (0.42 / (times_rated + 1) + 0.18)) - 1.0
+    Weight *= np.where(old_rating > 2500, 0.8, np.where(old_rating >= 2000, 0.9, 1.0))
+
+    Cap = 150.0 + 1500.0 / (times_rated + 2)
+
+    new_rating = (old_rating + Weight * PerfAs) / (1.0 + Weight)
+    new_volatility = np.where(times_rated == 0, 385,
+                              np.sqrt(((new_rating - old_rating) ** 2) / Weight +
+                                      (old_volatility ** 2) / (Weight + 1)))
+    new_rating = np.clip(new_rating, old_rating - Cap, old_rating + Cap)
+
+    # try to keep the sum of ratings constant
+    new_rating += (old_rating.sum() - new_rating.sum()) / N
+    # inflate a little if we have to so people who placed first don't lose rating
+    first = np.abs(actual_rank - actual_rank.min()) <= 1e-3
+    new_rating = np.where(first & (new_rating < old_rating + 1), old_rating + 1, new_rating)
+    return np.rint(new_rating).astype(int).tolist(), np.rint(new_volatility).astype(int).tolist()
+
+
+def recalculate_ratings(old_rating, old_volatility, actual_rank, times_rated):
+    if np is None:
+        return recalculate_ratings_python(old_rating, old_volatility, actual_rank, times_rated)
+    return recalculate_ratings_numpy(old_rating, old_volatility, actual_rank, times_rated)
+
+
 def rate_contest(contest):
     from judge.models import Rating, Profile
+    from judge.utils.scoreboard import invalidate_scoreboard
 
     cursor = connection.cursor()
     cursor.execute('''
@@ -140,21 +254,124 @@ def rate_contest(contest):
     now = timezone.now()
     ratings = [Rating(user_id=id, contest=contest, rating=r, volatility=v, last_rated=now, participation_id=p, rank=z)
                for id, p, r, v, z in zip(user_ids, participation_ids, rating, volatility, ranking)]
-    cursor = connection.cursor()
-    cursor.execute('CREATE TEMPORARY TABLE _profile_rating_update(id integer, rating integer)')
-    cursor.executemany('INSERT INTO _profile_rating_update VALUES (%s, %s)', list(zip(user_ids, rating)))
     with transaction.atomic():
         Rating.objects.filter(contest=contest).delete()
         Rating.objects.bulk_create(ratings)
-        cursor.execute('''
-            UPDATE `%s` p INNER JOIN `_profile_rating_update` tmp ON (p.id = tmp.id)
-            SET p.rating = tmp.rating
-        ''' % Profile._meta.db_table)
-    cursor.execute('DROP TABLE _profile_rating_update')
-    cursor.close()
+        bulk_update_values(Profile, ['rating'], zip(user_ids, rating))
+    invalidate_scoreboard(contest.id)
     return old_rating, old_volatility, ranking, times_ranked, rating, volatility
 
 
+# Number of rows written by each query of replay_ratings.
+REPLAY_BATCH_SIZE = 500
+
+
+def replay_ratings(contest, callback=None):
+    """
+    Recomputes the ratings of every rated contest that ended no earlier than `contest`, as if rate_contest was called
+    on each in order, after deleting their ratings. Instead, every rating involved is loaded once, the contests are
+    rated in memory, each from the ratings carried forward from those before it, and only changed rows are written.
+
+    :param contest: The earliest contest whose ratings changed.
+    :param callback: If given, called with each contest once it is rated.
+    :return: The number of ratings created, updated or deleted.
+    """
+    from judge.models import Contest, ContestParticipation, Profile, Rating
+    from judge.utils.scoreboard import invalidate_scoreboard
+
+    contests = list(Contest.objects.filter(is_rated=True, end_time__gte=contest.end_time).order_by('end_time')
+                    .only('id', 'end_time', 'rate_all', 'rating_floor', 'rating_ceiling'))
+    replayed = Rating.objects.filter(contest__end_time__gte=contest.end_time)
+    participations = ContestParticipation.objects.filter(contest__is_rated=True,
+                                                         contest__end_time__gte=contest.end_time, virtual=0)
+    involved = Q(user_id__in=participations.values('user_id')) | Q(user_id__in=replayed.values('user_id'))
+
+    excluded = set(Contest.rate_exclude.through.objects.filter(contest__is_rated=True,
+                                                               contest__end_time__gte=contest.end_time)
+                   .values_list('contest_id', 'profile_id'))
+    contestants = defaultdict(list)
+    for contest_id, *row in participations.filter(user__is_unlisted=False).annotate(submissions=Count('submission')) \
+            .order_by('is_disqualified', '-score', 'cumtime', 'tiebreaker') \
+            .values_list('contest_id', 'id', 'user_id', 'score', 'cumtime', 'submissions'):
+        if (contest_id, row[1]) not in excluded:
+            contestants[contest_id].append(row)
+
+    # user id -> (rating, volatility, times rated), as of the contest being rated
+    state = {}
+    for user_id, rating, volatility in Rating.objects.filter(involved, contest__end_time__lt=contest.end_time) \
+            .order_by('contest__end_time').values_list('user_id', 'rating', 'volatility'):
+        state[user_id] = (rating, volatility, state[user_id][2] + 1 if user_id in state else 1)
+    existing = {(rating.contest_id, rating.user_id): rating for rating in replayed}
+    profiles = list(Profile.objects.filter(Q(id__in=participations.values('user_id')) |
+                                           Q(id__in=replayed.values('user_id'))).only('id', 'rating'))
+
+    ratings = {}
+    # Like rate_contest, contests ending at the same time are rated without the ratings of each other.
+    for end_time, group in groupby(contests, key=attrgetter('end_time')):
+        rated = []
+        for rated_contest in group:
+            users = contestants[rated_contest.id]
+            if not rated_contest.rate_all:
+                users = [user for user in users if user[4] > 0]
+            if rated_contest.rating_floor is not None:
+                users = [user for user in users if user[1] not in state or
+                         state[user[1]][0] >= rated_contest.rating_floor]
+            if rated_contest.rating_ceiling is not None:
+                users = [user for user in users if user[1] not in state or
+                         state[user[1]][0] <= rated_contest.rating_ceiling]
+
+            ranked = list(tie_ranker(users, key=itemgetter(2, 3)))
+            old_data = [state.get(user[1], (1200, 535, 0)) for _, user in ranked]
+            new_rating, new_volatility = recalculate_ratings(list(map(itemgetter(0), old_data)),
+                                                             list(map(itemgetter(1), old_data)),
+                                                             list(map(itemgetter(0), ranked)),
+                                                             list(map(itemgetter(2), old_data)))
+            for (rank, (participation_id, user_id, *_)), r, v in zip(ranked, new_rating, new_volatility):
+                ratings[rated_contest.id, user_id] = (participation_id, int(rank), r, v)
+                rated.append((user_id, r, v))
+            if callback is not None:
+                callback(rated_contest)
+
+        for user_id, r, v in rated:
+            state[user_id] = (r, v, state[user_id][2] + 1 if user_id in state else 1)
+
+    now = timezone.now()
+    stale = [rating.id for key, rating in existing.items() if key not in ratings]
+    created = []
+    updated = []
+    for (contest_id, user_id), (participation_id, rank, r, v) in ratings.items():
+        rating = existing.get((contest_id, user_id))
+        if rating is None:
+            created.append(Rating(user_id=user_id, contest_id=contest_id, participation_id=participation_id,
+                                  rank=rank, rating=r, volatility=v, last_rated=now))
+        elif (rating.participation_id, rating.rank, rating.rating, rating.volatility) != (participation_id, rank, r, v):
+            rating.participation_id, rating.rank, rating.rating, rating.volatility = participation_id, rank, r, v
+            rating.last_rated = now
+            updated.append(rating)
+
+    # Profiles show the rating from the last contest they were rated in.
+    changed_profiles = []
+    for profile in profiles:
+        rating = state[profile.id][0] if profile.id in state else None
+        if profile.rating != rating:
+            profile.rating = rating
+            changed_profiles.append(profile)
+
+    with transaction.atomic():
+        for start in range(0, len(stale), REPLAY_BATCH_SIZE):
+            Rating.objects.filter(id__in=stale[start:start + REPLAY_BATCH_SIZE]).delete()
+        bulk_update_values(Rating, ['participation', 'rank', 'rating', 'volatility', 'last_rated'],
+                           [(rating.id, rating.participation_id, rating.rank, rating.rating, rating.volatility,
+                             rating.last_rated) for rating in updated], batch_size=REPLAY_BATCH_SIZE)
+        Rating.objects.bulk_create(created, batch_size=REPLAY_BATCH_SIZE)
+        bulk_update_values(Profile, ['rating'], [(profile.id, profile.rating) for profile in changed_profiles],
+                           batch_size=REPLAY_BATCH_SIZE)
+
+    for contest_id in {rated_contest.id for rated_contest in contests} | {key[0] for key in existing}:
+        invalidate_scoreboard(contest_id)
+    return len(stale) + len(updated) + len(created)
+
+
 RATING_LEVELS = ['Newbie', 'Amateur', 'Expert', 'Candidate Master', 'Master', 'Grandmaster', 'Target']
 RATING_VALUES = [1000, 1200, 1500, 1800, 2200, 3000]
 RATING_CLASS = ['rate-newbie', 'rate-amateur', 'rate-expert', 'rate-candidate-master',
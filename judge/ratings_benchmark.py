@@ -0,0 +1,36 @@
+import time
+
+from judge.ratings import np, recalculate_ratings_numpy, recalculate_ratings_python
+from judge.utils.rating_samples import random_contest
+
+
+def benchmark(function, contest):
+    start = time.perf_counter()
+    function(*contest)
+    return time.perf_counter() - start
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Measures the time taken to rate contests of given sizes.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[500, 5000, 20000])
+    parser.add_argument('--python-limit', type=int, default=5000,
+                        help='largest size to also rate without NumPy, which is slow')
+    args = parser.parse_args()
+
+    if np is None:
+        parser.error('NumPy is not installed')
+
+    for size in args.sizes:
+        contest = random_contest(size, size)
+        numpy_time = benchmark(recalculate_ratings_numpy, contest)
+        if size <= args.python_limit:
+            python_time = benchmark(recalculate_ratings_python, contest)
+            print('%6d contestants: %8.3f s with NumPy, %8.3f s without' % (size, numpy_time, python_time))
+        else:
+            print('%6d contestants: %8.3f s with NumPy' % (size, numpy_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,12 +5,15 @@ from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
 from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
 from .caching import finished_submission
-from .models import BlogPost, Comment, Contest, ContestSubmission, EFFECTIVE_MATH_ENGINES, Judge, Language, License, \
-    MiscConfig, Organization, Problem, Profile, Submission
+from .judgeapi import update_problem
+from .models import BlogPost, Comment, Contest, ContestParticipation, ContestSubmission, EFFECTIVE_MATH_ENGINES, \
+    Judge, Language, License, MiscConfig, Organization, Problem, Profile, Submission, UserProblemPoints
+from .utils.scoreboard import invalidate_scoreboard
 
 
 def get_pdf_path(basename):
@@ -40,6 +43,7 @@ def problem_update(sender, instance, **kwargs):
     cache.delete_many([make_template_fragment_key('problem_authors', (instance.id, lang))
                        for lang, _ in settings.LANGUAGES])
     cache.delete_many(['generated-meta-problem:%s:%d' % (lang, instance.id) for lang, _ in settings.LANGUAGES])
+    transaction.on_commit(lambda: update_problem(instance))
 
     for lang, _ in settings.LANGUAGES:
         unlink_if_exists(get_pdf_path('%s.%s.pdf' % (instance.code, lang)))
@@ -64,6 +68,28 @@ def contest_update(sender, instance, **kwargs):
     cache.delete_many(['generated-meta-contest:%d' % instance.id] +
                       [make_template_fragment_key('contest_html', (instance.id, engine))
                        for engine in EFFECTIVE_MATH_ENGINES])
+    invalidate_scoreboard(instance.id)
+
+
+def _invalidate_participation_scoreboard(participation):
+    if participation.virtual != ContestParticipation.LIVE:
+        return
+    contest_id = participation.contest_id
+    # Again once committed, in case the scoreboard was rebuilt without the change in the meantime.
+    invalidate_scoreboard(contest_id)
+    transaction.on_commit(lambda: invalidate_scoreboard(contest_id))
+
+
+@receiver(post_save, sender=ContestParticipation)
+def contest_participation_update(sender, instance, created, **kwargs):
+    # Other changes to a participation go through recompute_results, which updates the scoreboard in place.
+    if created:
+        _invalidate_participation_scoreboard(instance)
+
+
+@receiver(post_delete, sender=ContestParticipation)
+def contest_participation_delete(sender, instance, **kwargs):
+    _invalidate_participation_scoreboard(instance)
 
 
 @receiver(post_save, sender=License)
@@ -98,9 +124,16 @@ def post_update(sender, instance, **kwargs):
                        for engine in EFFECTIVE_MATH_ENGINES])
 
 
+@receiver(post_save, sender=Submission)
+def submission_create(sender, instance, created, **kwargs):
+    if created:
+        Problem.add_submission(instance.problem_id)
+
+
 @receiver(post_delete, sender=Submission)
 def submission_delete(sender, instance, **kwargs):
     finished_submission(instance)
+    UserProblemPoints.rebuild(user_id=instance.user_id, problem_id=instance.problem_id)
     instance.user._updating_stats_only = True
     instance.user.calculate_points()
     instance.problem._updating_stats_only = True
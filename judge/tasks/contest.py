@@ -1,28 +1,47 @@
 from celery import shared_task
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
 from django.utils.translation import gettext as _
 from moss import MOSS
 
 from judge.models import Contest, ContestMoss, ContestParticipation, Submission
+from judge.ratings import replay_ratings
 from judge.utils.celery import Progress
+from judge.utils.scoreboard import invalidate_scoreboard
 
-__all__ = ('rescore_contest', 'run_moss')
+__all__ = ('rescore_contest', 'rate_contests', 'run_moss')
+
+
+# Participations whose results are computed together, which also keeps the number of query parameters in check.
+RESCORE_CHUNK_SIZE = 500
 
 
 @shared_task(bind=True)
 def rescore_contest(self, contest_key):
     contest = Contest.objects.get(key=contest_key)
     participations = contest.users
+    ids = list(participations.values_list('id', flat=True))
+
+    with Progress(self, len(ids), stage=_('Recalculating contest scores')) as p:
+        for start in range(0, len(ids), RESCORE_CHUNK_SIZE):
+            chunk = ids[start:start + RESCORE_CHUNK_SIZE]
+            with transaction.atomic():
+                contest.format.update_participations(participations.filter(id__in=chunk))
+                participations.filter(id__in=chunk, is_disqualified=True).update(score=-9999)
+            p.did(len(chunk))
+
+    # Bulk updates bypass the scoreboard updates of each participation, and rebuilding it once is cheaper anyway.
+    invalidate_scoreboard(contest.id)
+    return len(ids)
 
-    rescored = 0
-    with Progress(self, participations.count(), stage=_('Recalculating contest scores')) as p:
-        for participation in participations.iterator():
-            participation.recompute_results()
-            rescored += 1
-            if rescored % 10 == 0:
-                p.done = rescored
-    return rescored
+
+@shared_task(bind=True)
+def rate_contests(self, contest_key):
+    contest = Contest.objects.get(key=contest_key)
+    total = Contest.objects.filter(is_rated=True, end_time__gte=contest.end_time).count()
+    with Progress(self, total, stage=_('Recalculating ratings')) as p:
+        return replay_ratings(contest, callback=lambda rated: p.did(1))
 
 
 @shared_task(bind=True)
@@ -2,10 +2,15 @@ from celery import shared_task
 from django.core.cache import cache
 from django.utils.translation import gettext as _
 
-from judge.models import Problem, Profile, Submission
+from judge.judgeapi import BATCH_JUDGE_CHUNK_SIZE, judge_submissions
+from judge.models import ContestParticipation, ContestSubmission, Problem, Profile, Submission, UserProblemPoints
 from judge.utils.celery import Progress
+from judge.utils.raw_sql import bulk_update_values
 
-__all__ = ('apply_submission_filter', 'rejudge_problem_filter', 'rescore_problem')
+__all__ = ('apply_submission_filter', 'rejudge_problem_filter', 'rescore_problem', 'reconcile_points')
+
+# Submissions whose points are updated by each query of rescore_problem.
+RESCORE_CHUNK_SIZE = 1000
 
 
 def apply_submission_filter(queryset, id_range, languages, results):
@@ -25,13 +30,12 @@ def rejudge_problem_filter(self, problem_id, id_range=None, languages=None, resu
     queryset = Submission.objects.filter(problem_id=problem_id)
     queryset = apply_submission_filter(queryset, id_range, languages, results)
 
+    ids = list(queryset.order_by('id').values_list('id', flat=True))
     rejudged = 0
-    with Progress(self, queryset.count()) as p:
-        for submission in queryset.iterator():
-            submission.judge(rejudge=True, batch_rejudge=True)
-            rejudged += 1
-            if rejudged % 10 == 0:
-                p.done = rejudged
+    with Progress(self, len(ids)) as p:
+        for start in range(0, len(ids), BATCH_JUDGE_CHUNK_SIZE):
+            rejudged += judge_submissions(ids[start:start + BATCH_JUDGE_CHUNK_SIZE], rejudge=True, batch_rejudge=True)
+            p.done = min(start + BATCH_JUDGE_CHUNK_SIZE, len(ids))
     return rejudged
 
 
@@ -41,17 +45,37 @@ def rescore_problem(self, problem_id):
     submissions = Submission.objects.filter(problem_id=problem_id)
 
     with Progress(self, submissions.count(), stage=_('Modifying submissions')) as p:
-        rescored = 0
-        for submission in submissions.iterator():
-            submission.points = round(submission.case_points / submission.case_total * problem.points
-                                      if submission.case_total else 0, 1)
-            if not problem.partial and submission.points < problem.points:
-                submission.points = 0
-            submission.save(update_fields=['points'])
-            submission.update_contest()
-            rescored += 1
-            if rescored % 10 == 0:
-                p.done = rescored
+        points = []
+        for id, case_points, case_total in submissions.values_list('id', 'case_points', 'case_total').iterator():
+            submission_points = round(case_points / case_total * problem.points if case_total else 0, 1)
+            if not problem.partial and submission_points < problem.points:
+                submission_points = 0
+            points.append((id, submission_points))
+        for start in range(0, len(points), RESCORE_CHUNK_SIZE):
+            chunk = points[start:start + RESCORE_CHUNK_SIZE]
+            bulk_update_values(Submission, ['points'], chunk)
+            p.did(len(chunk))
+    rescored = len(points)
+
+    # Like Submission.update_contest, for every contest submission at once.
+    contest_submissions = ContestSubmission.objects.filter(submission__problem_id=problem_id)
+    points = []
+    for id, case_points, case_total, problem_points, partial in contest_submissions.values_list(
+            'id', 'submission__case_points', 'submission__case_total', 'problem__points', 'problem__partial',
+    ).iterator():
+        contest_points = round(case_points / case_total * problem_points if case_total > 0 else 0, 3)
+        if not partial and contest_points != problem_points:
+            contest_points = 0
+        points.append((id, contest_points))
+    bulk_update_values(ContestSubmission, ['points'], points)
+
+    participations = ContestParticipation.objects.filter(id__in=contest_submissions.values('participation_id'))
+    with Progress(self, participations.count(), stage=_('Recalculating contest results')) as p:
+        for participation in participations.select_related('contest').iterator():
+            participation.recompute_results()
+            p.did(1)
+
+    UserProblemPoints.rebuild(problem_id=problem_id)
 
     with Progress(self, submissions.values('user_id').distinct().count(), stage=_('Recalculating user points')) as p:
         users = 0
@@ -65,3 +89,22 @@ def rescore_problem(self, problem_id):
             if users % 10 == 0:
                 p.done = users
     return rescored
+
+
+@shared_task(bind=True)
+def reconcile_points(self):
+    """Rebuild the best result table, problem statistics and user points from the submissions themselves."""
+    problems = Problem.objects.all()
+    with Progress(self, problems.count(), stage=_('Recalculating problem statistics')) as p:
+        for problem in problems.iterator():
+            UserProblemPoints.rebuild(problem_id=problem.id)
+            problem._updating_stats_only = True
+            problem.update_stats()
+            p.did(1)
+
+    profiles = Profile.objects.filter(id__in=Submission.objects.values('user_id'))
+    with Progress(self, profiles.count(), stage=_('Recalculating user points')) as p:
+        for profile in profiles.iterator():
+            profile._updating_stats_only = True
+            profile.calculate_points()
+            p.did(1)
@@ -0,0 +1,13 @@
+import random
+
+
+def random_contest(size, seed):
+    rng = random.Random(seed)
+    # Many contestants are unrated, and ties are ranked at the average of their places.
+    old_rating = [1200 if rng.random() < 0.3 else rng.randint(500, 3500) for _ in range(size)]
+    old_volatility = [535 if rating == 1200 else rng.randint(80, 600) for rating in old_rating]
+    times_rated = [0 if rating == 1200 else rng.randint(1, 60) for rating in old_rating]
+    places = sorted(rng.randrange(size) for _ in range(size))
+    ranking = [(places.index(place) + 1 + len(places) - places[::-1].index(place)) / 2 for place in places]
+    rng.shuffle(ranking)
+    return old_rating, old_volatility, ranking, times_rated
@@ -94,3 +94,48 @@ def use_straight_join(queryset):
     except AttributeError:
         cloner = queryset.query.clone
     queryset.query = cloner(straight_join_cache[type(queryset.query)])
+
+
+def bulk_update_values(model, fields, rows, using='default', batch_size=1000):
+    """
+    Updates rows of `model` to values that differ per row, with one UPDATE ... CASE statement for each batch of rows,
+    which works with any database, and unlike Model.objects.bulk_update, needs no model instances.
+
+    :param fields: Names of the fields to update.
+    :param rows: Tuples of the primary key of a row followed by its new value for each field.
+    :return: The number of rows updated.
+    """
+    connection = connections[using]
+    opts = model._meta
+    fields = [opts.get_field(name) for name in fields]
+    pk_column = connection.ops.quote_name(opts.pk.column)
+    # Every row uses two parameters for each field in the CASE expressions, and one for the WHERE clause.
+    max_params = connection.features.max_query_params
+    if max_params:
+        batch_size = min(batch_size, max_params // (2 * len(fields) + 1))
+
+    rows = list(rows)
+    updated = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            assignments = []
+            params = []
+            for index, field in enumerate(fields, 1):
+                value_sql = '%s'
+                if connection.features.requires_casted_case_in_updates:
+                    value_sql = 'CAST(%%s AS %s)' % field.db_type(connection)
+                column = connection.ops.quote_name(field.column)
+                assignments.append('%s = CASE %s %s ELSE %s END' % (
+                    column, pk_column, ' '.join(['WHEN %%s THEN %s' % value_sql] * len(batch)), column,
+                ))
+                for row in batch:
+                    params.append(opts.pk.get_db_prep_value(row[0], connection))
+                    params.append(field.get_db_prep_save(row[index], connection))
+            params.extend(opts.pk.get_db_prep_value(row[0], connection) for row in batch)
+            cursor.execute('UPDATE %s SET %s WHERE %s IN (%s)' % (
+                connection.ops.quote_name(opts.db_table), ', '.join(assignments), pk_column,
+                ', '.join(['%s'] * len(batch)),
+            ), params)
+            updated += cursor.rowcount
+    return updated
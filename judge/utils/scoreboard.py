@@ -0,0 +1,444 @@
+import pickle
+import time
+import zlib
+from bisect import bisect_left
+from collections import namedtuple
+from operator import attrgetter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F, OuterRef, Subquery
+from django.utils.safestring import mark_safe
+
+from judge import event_poster as event
+from judge.models import ContestParticipation, Organization, Rating
+from judge.utils.ranker import ranker
+
+__all__ = ['ContestRankingProfile', 'ScoreboardSnapshot', 'make_contest_ranking_profile', 'get_scoreboard',
+           'get_scoreboard_snapshot', 'get_frozen_scoreboard', 'get_frozen_scoreboard_snapshot', 'deltas_since',
+           'scoreboard_row_data', 'scoreboard_version', 'frozen_scoreboard_version', 'update_scoreboard',
+           'invalidate_scoreboard', 'export_scoreboard', 'scoreboard_rank', 'set_frozen_results']
+
+ContestRankingProfile = namedtuple(
+    'ContestRankingProfile',
+    'id user css_class username points cumtime tiebreaker organization participation '
+    'participation_rating problem_cells result_cell',
+)
+
+ScoreboardSnapshot = namedtuple('ScoreboardSnapshot', 'version rows deltas')
+
+# Number of recent changes kept with a snapshot, from which clients can catch up without refetching it.
+DELTA_LOG_SIZE = 100
+
+# Number of participations fetched by each query of export_scoreboard.
+EXPORT_CHUNK_SIZE = 1000
+
+
+def make_contest_ranking_profile(contest, participation, contest_problems):
+    def display_user_problem(contest_problem):
+        # When the contest format is changed, `format_data` might be invalid.
+        # This will cause `display_user_problem` to error, so we display '???' instead.
+        try:
+            return contest.format.display_user_problem(participation, contest_problem)
+        except (KeyError, TypeError, ValueError):
+            return mark_safe('<td>???</td>')
+
+    user = participation.user
+    return ContestRankingProfile(
+        id=user.id,
+        user=user.user,
+        css_class=user.css_class,
+        username=user.username,
+        points=participation.score,
+        cumtime=participation.cumtime,
+        tiebreaker=participation.tiebreaker,
+        organization=user.organization,
+        participation_rating=participation.rating.rating if hasattr(participation, 'rating') else None,
+        problem_cells=[display_user_problem(contest_problem) for contest_problem in contest_problems],
+        result_cell=contest.format.display_participation_result(participation),
+        participation=participation,
+    )
+
+
+# The scoreboard of a contest is cached as a snapshot of its ranking rows, with every cell already rendered, and is
+# kept up to date by updating the row of each participation whose results are recomputed. Every change to a
+# contest's participations also increments its scoreboard version, which is stored separately. A snapshot is only
+# used if it was taken at the current version, so that updates racing with each other, or with a snapshot being
+# rebuilt, cause a rebuild rather than a stale scoreboard. The version also serves as an ETag.
+#
+# Every change is also described by a delta, which is posted to the contest's event channel and kept in a short log
+# with the snapshot. A delta holds the version it brings the scoreboard to, and for a live participation, its new
+# row with only the problem cells that changed, along with its rank before and after. Deltas of other
+# participations, which are not on the scoreboard, only hold the version.
+#
+# While a contest's scoreboard is frozen, everyone who may not see the live scoreboard is shown a second snapshot,
+# whose rows only count submissions made up to the freeze time, without any deltas. It has a version of its own,
+# which only changes when a row of the frozen scoreboard does, so that activity since the freeze neither shows in its
+# ETag nor causes it to be rebuilt. Its rows are always ranked from the submissions themselves, never taken from the
+# live snapshot, so that results after the freeze cannot leak into it however changes race. Nothing is posted to the
+# contest's event channel, which anyone can listen to, as even the timing of updates would give away activity.
+
+def _snapshot_key(contest_id):
+    return 'contest_scoreboard:%d' % contest_id
+
+
+def _version_key(contest_id):
+    return 'contest_scoreboard_version:%d' % contest_id
+
+
+def _frozen_key(contest_id):
+    return 'contest_scoreboard_frozen:%d' % contest_id
+
+
+def _frozen_version_key(contest_id):
+    return 'contest_scoreboard_frozen_version:%d' % contest_id
+
+
+def _rank_order(row):
+    return row.participation.is_disqualified, -row.points, row.cumtime, row.tiebreaker
+
+
+def _row_order(row):
+    return _rank_order(row) + (row.participation.id,)
+
+
+def _fingerprint(contest, problems):
+    # Cells depend on the contest format and its problems, so changes to these make the snapshot unusable.
+    return (contest.format_name, contest.format_config,
+            [(problem.id, problem.problem_id, problem.points, problem.partial, problem.is_pretested)
+             for problem in problems])
+
+
+def _detach(row):
+    # Only keep the fields the scoreboard shows of the models in a row, as the snapshot holds thousands of rows.
+    participation, organization = row.participation, row.organization
+    return row._replace(
+        user=User(id=row.user.id, username=row.user.username),
+        organization=organization and Organization(id=organization.id, slug=organization.slug,
+                                                   short_name=organization.short_name),
+        participation=ContestParticipation(
+            id=participation.id, contest_id=participation.contest_id, user_id=participation.user_id,
+            real_start=participation.real_start, score=participation.score, cumtime=participation.cumtime,
+            is_disqualified=participation.is_disqualified, tiebreaker=participation.tiebreaker,
+            virtual=participation.virtual,
+        ),
+    )
+
+
+def _dump(version, fingerprint, rows, deltas):
+    # Pre-rendered cells are repetitive HTML, so compressing keeps large scoreboards within cache item size limits.
+    return version, zlib.compress(pickle.dumps((fingerprint, rows, deltas), pickle.HIGHEST_PROTOCOL))
+
+
+def _load(data):
+    version, payload = data
+    fingerprint, rows, deltas = pickle.loads(zlib.decompress(payload))
+    return version, fingerprint, rows, deltas
+
+
+def _ranks(rows):
+    return {row.participation.id: rank for rank, row in ranker(rows, key=attrgetter('points', 'cumtime', 'tiebreaker'))}
+
+
+def scoreboard_row_data(rank, row, cells=None):
+    """Return a ranking row as JSON data, with all its problem cells keyed by index, or only those in `cells`."""
+    return {
+        'participation': row.participation.id,
+        'user': row.username,
+        'css_class': row.css_class,
+        'rank': rank,
+        'points': row.points,
+        'cumtime': row.cumtime,
+        'tiebreaker': row.tiebreaker,
+        'disqualified': row.participation.is_disqualified,
+        'cells': {index: str(cell) for index, cell in enumerate(row.problem_cells) if cells is None or index in cells},
+        'result': str(row.result_cell),
+    }
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # Start from the time rather than 0, so that a version lost from the cache is never reused.
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def _next_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        _version(key)
+        return cache.incr(key)
+
+
+def scoreboard_version(contest_id):
+    return _version(_version_key(contest_id))
+
+
+def frozen_scoreboard_version(contest_id):
+    return _version(_frozen_version_key(contest_id))
+
+
+def _ranking_participations(queryset):
+    return (queryset.select_related('user__user', 'rating').prefetch_related('user__organizations')
+                    .defer('user__about', 'user__organizations__about'))
+
+
+def _ranking_rows(contest, problems, queryset):
+    return [_detach(make_contest_ranking_profile(contest, participation, problems))
+            for participation in _ranking_participations(queryset)]
+
+
+def set_frozen_results(contest, participations):
+    """
+    Set the results of a list of participations of `contest` to what they were at its freeze time, without saving
+    them, as its frozen scoreboard shows them.
+    """
+    contest.format.set_participation_results(participations, until=contest.frozen_time)
+    for participation in participations:
+        if participation.is_disqualified:
+            participation.score = -9999
+
+
+def _frozen_ranking_rows(contest, problems, queryset):
+    participations = list(_ranking_participations(queryset))
+    set_frozen_results(contest, participations)
+    return [_detach(make_contest_ranking_profile(contest, participation, problems))
+            for participation in participations]
+
+
+def get_scoreboard_snapshot(contest, problems):
+    """Return the current snapshot of the scoreboard of `contest`, with its ranking rows in order."""
+    fingerprint = _fingerprint(contest, problems)
+    data = cache.get(_snapshot_key(contest.id))
+    version = scoreboard_version(contest.id)
+    rows = None
+    if data is not None:
+        snapshot_version, snapshot_fingerprint, rows, deltas = _load(data)
+        if snapshot_version != version or snapshot_fingerprint != fingerprint:
+            rows = None
+
+    if rows is None:
+        rows = _ranking_rows(contest, problems, contest.users.filter(virtual=ContestParticipation.LIVE,
+                                                                     user__is_unlisted=False))
+        rows.sort(key=_row_order)
+        deltas = []
+        cache.set(_snapshot_key(contest.id), _dump(version, fingerprint, rows, deltas),
+                  settings.DMOJ_SCOREBOARD_CACHE_TTL)
+
+    for row in rows:
+        row.participation.contest = contest
+    return ScoreboardSnapshot(version, rows, deltas)
+
+
+def get_scoreboard(contest, problems):
+    """Return the ranking rows of the live, listed participations of `contest`, in order, from the snapshot."""
+    return get_scoreboard_snapshot(contest, problems).rows
+
+
+def get_frozen_scoreboard_snapshot(contest, problems):
+    """
+    Return the current snapshot of the scoreboard of `contest` as frozen, with its ranking rows in order, and without
+    deltas. Only submissions made up to the freeze time count, however many were made since.
+    """
+    fingerprint = _fingerprint(contest, problems)
+    data = cache.get(_frozen_key(contest.id))
+    version = frozen_scoreboard_version(contest.id)
+    rows = None
+    if data is not None:
+        snapshot_version, snapshot_fingerprint, rows, deltas = _load(data)
+        if snapshot_version != version or snapshot_fingerprint != fingerprint:
+            rows = None
+
+    if rows is None:
+        rows = _frozen_ranking_rows(contest, problems, contest.users.filter(virtual=ContestParticipation.LIVE,
+                                                                            user__is_unlisted=False))
+        rows.sort(key=_row_order)
+        cache.set(_frozen_key(contest.id), _dump(version, fingerprint, rows, []), settings.DMOJ_SCOREBOARD_CACHE_TTL)
+
+    for row in rows:
+        row.participation.contest = contest
+    return ScoreboardSnapshot(version, rows, [])
+
+
+def get_frozen_scoreboard(contest, problems):
+    """Return the ranking rows of the frozen scoreboard of `contest`, in order."""
+    return get_frozen_scoreboard_snapshot(contest, problems).rows
+
+
+class _RankOrders:
+    # The orders of ranking rows as a sequence, for bisect, which only takes a key function since Python 3.10.
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        return _rank_order(self.rows[index])
+
+
+def scoreboard_rank(rows, row):
+    """
+    Return the rank `row` would have among the ranking rows of a snapshot, which it is not part of, like that of a
+    virtual participation, in logarithmic time.
+    """
+    return bisect_left(_RankOrders(rows), _rank_order(row)) + 1
+
+
+def _row_delta(version, participation_id, old_rows, new_rows):
+    old_row = next((row for row in old_rows if row.participation.id == participation_id), None)
+    new_row = next((row for row in new_rows if row.participation.id == participation_id), None)
+    if new_row is None:
+        return {'version': version, 'participation': participation_id, 'removed': True}
+
+    changed = {index for index, cell in enumerate(new_row.problem_cells)
+               if old_row is None or index >= len(old_row.problem_cells) or old_row.problem_cells[index] != cell}
+    delta = scoreboard_row_data(_ranks(new_rows)[participation_id], new_row, changed)
+    delta['version'] = version
+    delta['old_rank'] = _ranks(old_rows).get(participation_id)
+    return delta
+
+
+def _scoreboard_problems(contest):
+    return list(contest.contest_problems.select_related('problem').defer('problem__description').order_by('order'))
+
+
+def _update_frozen_scoreboard(participation):
+    # Like the live snapshot, but the row is ranked from the submissions made up to the freeze time, so that a
+    # pre-freeze submission graded after the freeze still shows, and the version is only incremented if it changed.
+    if participation.virtual != ContestParticipation.LIVE:
+        return
+    contest = participation.contest
+    version_key = _frozen_version_key(contest.id)
+    data = cache.get(_frozen_key(contest.id))
+    if data is None:
+        # There is nothing to compare with, and the snapshot will be built when next needed.
+        _next_version(version_key)
+        return
+    snapshot_version, fingerprint, rows, deltas = _load(data)
+    problems = _scoreboard_problems(contest)
+    if snapshot_version != _version(version_key) or _fingerprint(contest, problems) != fingerprint:
+        _next_version(version_key)
+        return
+
+    old_rows = [row for row in rows if row.participation.id == participation.id]
+    new_rows = _frozen_ranking_rows(contest, problems, contest.users.filter(id=participation.id,
+                                                                            user__is_unlisted=False))
+    if [scoreboard_row_data(None, row) for row in old_rows] == [scoreboard_row_data(None, row) for row in new_rows]:
+        # Only results since the freeze changed, which the frozen scoreboard does not show.
+        return
+
+    version = _next_version(version_key)
+    if snapshot_version != version - 1:
+        return
+    rows = [row for row in rows if row.participation.id != participation.id] + new_rows
+    rows.sort(key=_row_order)
+    cache.set(_frozen_key(contest.id), _dump(version, fingerprint, rows, []), settings.DMOJ_SCOREBOARD_CACHE_TTL)
+
+
+def _post_update(contest, version, delta=None):
+    if contest.is_frozen:
+        return
+    message = {'type': 'update', 'version': version}
+    if delta is not None:
+        message['delta'] = delta
+    event.post('contest_%d' % contest.id, message)
+
+
+def update_scoreboard(participation):
+    """
+    Update the row of `participation` in the snapshots of its contest, after its results were recomputed, and tell
+    the contest's viewers about the change, unless its scoreboard is frozen.
+    """
+    contest = participation.contest
+    version = _next_version(_version_key(contest.id))
+    if contest.is_frozen:
+        _update_frozen_scoreboard(participation)
+    data = cache.get(_snapshot_key(contest.id))
+    if data is None:
+        _post_update(contest, version)
+        return
+    snapshot_version, fingerprint, rows, deltas = _load(data)
+    if snapshot_version != version - 1:
+        # Another change was made in the meantime, and the snapshot will be rebuilt when next needed.
+        _post_update(contest, version)
+        return
+
+    if participation.virtual == ContestParticipation.LIVE:
+        problems = _scoreboard_problems(contest)
+        if _fingerprint(contest, problems) != fingerprint:
+            _post_update(contest, version)
+            return
+        new_rows = [row for row in rows if row.participation.id != participation.id]
+        new_rows.extend(_ranking_rows(contest, problems, contest.users.filter(id=participation.id,
+                                                                              user__is_unlisted=False)))
+        new_rows.sort(key=_row_order)
+        delta = _row_delta(version, participation.id, rows, new_rows)
+        rows = new_rows
+    else:
+        # Virtual participations are not in the snapshot, but still change the version, as they are shown to
+        # their user.
+        delta = {'version': version}
+
+    deltas = (deltas + [delta])[-DELTA_LOG_SIZE:]
+    cache.set(_snapshot_key(contest.id), _dump(version, fingerprint, rows, deltas), settings.DMOJ_SCOREBOARD_CACHE_TTL)
+    _post_update(contest, version, delta)
+
+
+def deltas_since(snapshot, version):
+    """Return the deltas that bring a scoreboard from `version` to the snapshot, or None if they are not all kept."""
+    if version == snapshot.version:
+        return []
+    deltas = [delta for delta in snapshot.deltas if delta['version'] > version]
+    if not deltas or deltas[0]['version'] != version + 1 or deltas[-1]['version'] != snapshot.version:
+        return None
+    return deltas
+
+
+def invalidate_scoreboard(contest_id):
+    _next_version(_version_key(contest_id))
+    _next_version(_frozen_version_key(contest_id))
+    cache.delete_many([_snapshot_key(contest_id), _frozen_key(contest_id)])
+
+
+def export_scoreboard(contest, problems):
+    """
+    Yield the full ranking of `contest` as JSON data, one row at a time, with the breakdown of `problems` and the
+    ratings of each participation.
+
+    Only the ids of the participations are fetched up front, in ranking order, and the rows themselves a chunk at a
+    time, so that exporting the largest contests does not hold all their rows in memory, whatever the database.
+    """
+    participations = contest.users.filter(virtual=ContestParticipation.LIVE, user__is_unlisted=False)
+    ids = list(participations.order_by('is_disqualified', '-score', 'cumtime', 'tiebreaker', 'id')
+               .values_list('id', flat=True))
+    old_rating = Rating.objects.filter(user=OuterRef('user_id'), contest__end_time__lt=contest.end_time) \
+                               .order_by('-contest__end_time').values('rating')[:1]
+    new_rating = Rating.objects.filter(participation=OuterRef('pk')).values('rating')[:1]
+
+    def rows():
+        for start in range(0, len(ids), EXPORT_CHUNK_SIZE):
+            chunk = ids[start:start + EXPORT_CHUNK_SIZE]
+            fetched = participations.filter(id__in=chunk).annotate(
+                username=F('user__user__username'), old_rating=Subquery(old_rating), new_rating=Subquery(new_rating),
+            ).only('id', 'score', 'cumtime', 'tiebreaker', 'is_disqualified', 'format_data').in_bulk(chunk)
+            for id in chunk:
+                if id in fetched:
+                    yield fetched[id]
+
+    for rank, participation in ranker(rows(), key=attrgetter('score', 'cumtime', 'tiebreaker')):
+        yield {
+            'rank': rank,
+            'user': participation.username,
+            'score': participation.score,
+            'cumulative_time': participation.cumtime,
+            'tiebreaker': participation.tiebreaker,
+            'is_disqualified': participation.is_disqualified,
+            'old_rating': participation.old_rating,
+            'new_rating': participation.new_rating,
+            'solutions': contest.format.get_problem_breakdown(participation, problems),
+        }
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from judge.event_poster_async import AsyncEventPoster
+
+
+class FakeEventPoster:
+    def __init__(self, batches, gate=None, fail=False):
+        self.batches = batches
+        self.gate = gate
+        self.fail = fail
+
+    def post_many(self, events):
+        if self.gate is not None:
+            self.gate.wait()
+        if self.fail:
+            raise ConnectionError()
+        self.batches.append(events)
+
+
+class AsyncEventPosterTestCase(SimpleTestCase):
+    def test_batches(self):
+        batches = []
+        gate = threading.Event()
+        poster = AsyncEventPoster(lambda: FakeEventPoster(batches, gate), max_queue=4, batch_size=2)
+        # The first event is picked up on its own, and held while the others queue up behind it.
+        poster.post('a', 0)
+        for _ in range(100):
+            if poster.stats()['queued'] == 1 and not poster._queue:
+                break
+            time.sleep(0.01)
+        for message in range(1, 7):
+            self.assertEqual(poster.post('a', message), 0)
+        gate.set()
+        self.assertTrue(poster.flush(5))
+
+        self.assertEqual(batches, [[('a', 0)], [('a', 3), ('a', 4)], [('a', 5), ('a', 6)]])
+        self.assertEqual(poster.stats(), {'posted': 7, 'sent': 5, 'dropped': 2, 'failed': 0, 'batches': 3,
+                                          'coalesced': 0, 'queued': 0})
+
+    def test_failure(self):
+        batches = []
+        posters = iter([FakeEventPoster(batches, fail=True), FakeEventPoster(batches)])
+        poster = AsyncEventPoster(lambda: next(posters), retry_interval=0)
+        with self.assertLogs('judge.event_poster'):
+            poster.post('a', 1)
+            self.assertTrue(poster.flush(5))
+        poster.post('a', 2)
+        self.assertTrue(poster.flush(5))
+        self.assertEqual(batches, [[('a', 2)]])
+        self.assertEqual((poster.stats()['failed'], poster.stats()['sent']), (1, 1))
+
+    def test_coalesce(self):
+        batches = []
+        poster = AsyncEventPoster(lambda: FakeEventPoster(batches), coalesce=['submissions'], coalesce_window=60)
+        poster.post('submissions', {'type': 'update-submission', 'id': 1, 'state': 'processing'})
+        poster.post('submissions', {'type': 'update-submission', 'id': 2, 'state': 'processing'})
+        poster.post('sub_1', {'type': 'processing'})
+        poster.post('submissions', {'type': 'done-submission', 'id': 1})
+        self.assertTrue(poster.flush(5))
+
+        self.assertEqual(sum(batches, []), [
+            ('sub_1', {'type': 'processing'}),
+            ('submissions', {'type': 'batch', 'messages': [
+                {'type': 'update-submission', 'id': 2, 'state': 'processing'}, {'type': 'done-submission', 'id': 1},
+            ]}),
+        ])
+        self.assertEqual((poster.stats()['coalesced'], poster.stats()['queued']), (1, 0))
+
+    def test_coalesce_window(self):
+        batches = []
+        poster = AsyncEventPoster(lambda: FakeEventPoster(batches), coalesce=['submissions'], coalesce_window=0.05)
+        poster.post('submissions', {'id': 1})
+        for _ in range(100):
+            if batches:
+                break
+            time.sleep(0.01)
+        self.assertEqual(batches, [[('submissions', {'type': 'batch', 'messages': [{'id': 1}]})]])
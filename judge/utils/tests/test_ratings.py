@@ -0,0 +1,29 @@
+import math
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from judge import ratings
+from judge.utils.rating_samples import random_contest
+
+
+class RecalculateRatingsTestCase(SimpleTestCase):
+    def test_erf(self):
+        for x in [i / 997 for i in range(-8000, 8000)] + [-50, 1e-300, 50]:
+            self.assertAlmostEqual(float(ratings.erf_numpy(ratings.np.array(x))), math.erf(x), places=15)
+
+    def test_matches_python(self):
+        for size, seed in ((2, 0), (3, 1), (10, 2), (100, 3), (500, 4)):
+            with self.subTest(size=size):
+                contest = random_contest(size, seed)
+                self.assertEqual(ratings.recalculate_ratings_numpy(*contest),
+                                 ratings.recalculate_ratings_python(*contest))
+
+    def test_blocks(self):
+        contest = random_contest(300, 5)
+        expected = ratings.recalculate_ratings_numpy(*contest)
+        with mock.patch('judge.ratings.WP_BLOCK_SIZE', 1000):
+            self.assertEqual(ratings.recalculate_ratings_numpy(*contest), expected)
+
+    def test_single(self):
+        self.assertEqual(ratings.recalculate_ratings_numpy([1500], [300], [1], [4]), ([1500], [300]))
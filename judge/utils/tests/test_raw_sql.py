@@ -0,0 +1,33 @@
+from django.test import TestCase
+
+from judge.models import ContestParticipation, Profile
+from judge.models.tests.util import create_contest_participation, create_user
+from judge.utils.raw_sql import bulk_update_values
+
+
+class BulkUpdateValuesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.profiles = [create_user('bulk_update_%d' % i).profile for i in range(5)]
+
+    def ratings(self):
+        return list(Profile.objects.filter(id__in=[profile.id for profile in self.profiles]).order_by('id')
+                    .values_list('rating', 'points'))
+
+    def test_update(self):
+        rows = [(profile.id, 1000 + i, i / 2) for i, profile in enumerate(self.profiles[:4])]
+        rows[1] = (rows[1][0], None, 5)
+        # Two batches, the last smaller, leaving the last profile alone.
+        with self.assertNumQueries(2):
+            self.assertEqual(bulk_update_values(Profile, ['rating', 'points'], rows, batch_size=3), 4)
+        self.assertEqual(self.ratings(), [(1000, 0), (None, 5), (1002, 1), (1003, 1.5), (None, 0)])
+
+    def test_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(bulk_update_values(Profile, ['rating'], []), 0)
+
+    def test_json(self):
+        participation = create_contest_participation(contest='bulk_update', user='bulk_update_0')
+        bulk_update_values(ContestParticipation, ['format_data'], [(participation.id, {'1': {'points': 2}})])
+        participation.refresh_from_db()
+        self.assertEqual(participation.format_data, {'1': {'points': 2}})
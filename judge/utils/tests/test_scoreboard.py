@@ -0,0 +1,264 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from judge.models import Contest, ContestParticipation, ContestSubmission, Language, Problem, Submission, \
+    SubmissionTestCase
+from judge.models.tests.util import create_contest, create_contest_participation, create_contest_problem, \
+    create_user
+from judge.utils.scoreboard import deltas_since, export_scoreboard, frozen_scoreboard_version, get_frozen_scoreboard, \
+    get_scoreboard, get_scoreboard_snapshot, invalidate_scoreboard, make_contest_ranking_profile, scoreboard_rank, \
+    scoreboard_version, update_scoreboard
+
+
+class ScoreboardTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.contest = create_contest(key='scoreboard')
+        create_contest_problem(contest=self.contest, problem='scoreboard_a')
+        self.participations = {
+            username: create_contest_participation(contest=self.contest, user=username, score=score, cumtime=cumtime)
+            for username, score, cumtime in (('first', 100, 50), ('second', 100, 70), ('third', 20, 10))
+        }
+        unlisted = create_user('unlisted').profile
+        unlisted.is_unlisted = True
+        unlisted.save()
+        create_contest_participation(contest=self.contest, user=unlisted)
+        ContestParticipation.objects.create(contest=self.contest, user=self.participations['first'].user, virtual=1,
+                                            score=500)
+
+    def setUp(self):
+        cache.clear()
+
+    def scoreboard(self, problems=None):
+        return [row.username for row in get_scoreboard(self.contest, problems or self.problems())]
+
+    def problems(self):
+        return list(self.contest.contest_problems.order_by('order'))
+
+    def set_score(self, username, score, virtual=ContestParticipation.LIVE):
+        participation = ContestParticipation.objects.get(contest=self.contest.id, user__user__username=username,
+                                                         virtual=virtual)
+        ContestParticipation.objects.filter(id=participation.id).update(score=score)
+        update_scoreboard(participation)
+
+    def test_snapshot(self):
+        self.assertEqual(self.scoreboard(), ['first', 'second', 'third'])
+        problems = self.problems()
+        with self.assertNumQueries(0):
+            rows = get_scoreboard(self.contest, problems)
+        self.assertEqual(rows[0].problem_cells, get_scoreboard(self.contest, problems)[0].problem_cells)
+        self.assertFalse(rows[0].participation.ended)
+
+    def test_update(self):
+        self.scoreboard()
+        version = scoreboard_version(self.contest.id)
+        self.set_score('third', 200)
+        self.assertEqual(scoreboard_version(self.contest.id), version + 1)
+        problems = self.problems()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scoreboard(problems), ['third', 'first', 'second'])
+        self.assertEqual(get_scoreboard(self.contest, problems)[0].points, 200)
+
+    def test_virtual_update(self):
+        self.scoreboard()
+        version = scoreboard_version(self.contest.id)
+        self.set_score('first', 0, virtual=1)
+        self.assertEqual(scoreboard_version(self.contest.id), version + 1)
+        problems = self.problems()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scoreboard(problems), ['first', 'second', 'third'])
+
+    def test_stale_snapshot(self):
+        self.scoreboard()
+        # An update that finds no snapshot, like one racing with a rebuild, leaves later snapshots unusable.
+        cache.delete('contest_scoreboard:%d' % self.contest.id)
+        self.set_score('third', 200)
+        invalidate_scoreboard(self.contest.id)
+        self.set_score('second', 300)
+        self.assertEqual(self.scoreboard(), ['second', 'third', 'first'])
+
+    def test_join_and_leave(self):
+        self.scoreboard()
+        participation = ContestParticipation.objects.create(contest=self.contest, user=create_user('joined').profile,
+                                                            score=50)
+        self.assertEqual(self.scoreboard(), ['first', 'second', 'joined', 'third'])
+        participation.delete()
+        self.assertEqual(self.scoreboard(), ['first', 'second', 'third'])
+
+    def test_problems_changed(self):
+        self.scoreboard()
+        create_contest_problem(contest=self.contest, problem='scoreboard_b', order=2)
+        rows = get_scoreboard(self.contest, self.problems())
+        self.assertEqual(len(rows[0].problem_cells), 2)
+
+    @mock.patch('judge.utils.scoreboard.event.post')
+    def test_deltas(self, post):
+        version = get_scoreboard_snapshot(self.contest, self.problems()).version
+        self.set_score('third', 200)
+        delta = post.call_args[0][1]['delta']
+        self.assertEqual(post.call_args[0][0], 'contest_%d' % self.contest.id)
+        self.assertEqual((delta['version'], delta['user'], delta['points']), (version + 1, 'third', 200))
+        self.assertEqual((delta['old_rank'], delta['rank']), (3, 1))
+        self.assertEqual(delta['cells'], {})
+        self.set_score('first', 0, virtual=1)
+
+        snapshot = get_scoreboard_snapshot(self.contest, self.problems())
+        self.assertEqual(deltas_since(snapshot, version), [delta, {'version': version + 2}])
+        self.assertEqual(deltas_since(snapshot, version + 2), [])
+        self.assertIsNone(deltas_since(snapshot, version - 1))
+
+    @mock.patch('judge.utils.scoreboard.event.post')
+    def test_delta_without_snapshot(self, post):
+        self.set_score('third', 200)
+        post.assert_called_once_with('contest_%d' % self.contest.id,
+                                     {'type': 'update', 'version': scoreboard_version(self.contest.id)})
+        self.assertIsNone(deltas_since(get_scoreboard_snapshot(self.contest, self.problems()), 0))
+
+    @mock.patch('judge.utils.scoreboard.EXPORT_CHUNK_SIZE', 2)
+    def test_export(self):
+        ContestParticipation.objects.filter(id=self.participations['second'].id).update(
+            cumtime=50, format_data={str(self.problems()[0].id): {'time': 50, 'points': 100}},
+        )
+        rows = list(export_scoreboard(self.contest, self.problems()))
+        self.assertEqual([(row['rank'], row['user'], row['score']) for row in rows],
+                         [(1, 'first', 100), (1, 'second', 100), (3, 'third', 20)])
+        self.assertEqual([row['solutions'] for row in rows], [[None], [{'time': 50, 'points': 100}], [None]])
+        self.assertEqual((rows[0]['old_rating'], rows[0]['new_rating'], rows[0]['is_disqualified']),
+                         (None, None, False))
+
+    def test_rank(self):
+        problems = self.problems()
+        rows = get_scoreboard(self.contest, problems)
+        virtual = self.contest.users.get(virtual=1)
+        for score, cumtime, rank in ((500, 0, 1), (100, 50, 1), (100, 60, 2), (100, 70, 2), (20, 0, 3), (0, 0, 4)):
+            virtual.score, virtual.cumtime = score, cumtime
+            with self.subTest(score=score, cumtime=cumtime):
+                self.assertEqual(scoreboard_rank(rows, make_contest_ranking_profile(self.contest, virtual, problems)),
+                                 rank)
+
+    def freeze(self):
+        Contest.objects.filter(id=self.contest.id).update(frozen_last_minutes=200 * 24 * 60)
+        return Contest.objects.get(id=self.contest.id)
+
+    def test_frozen_permissions(self):
+        self.assertFalse(self.contest.is_frozen)
+        contest = self.freeze()
+        self.assertTrue(contest.is_frozen)
+        viewer = create_user('frozen_viewer')
+        admin = create_user('frozen_admin', is_superuser=True)
+        self.assertTrue(contest.can_see_full_scoreboard(viewer))
+        self.assertFalse(contest.can_see_live_scoreboard(viewer))
+        self.assertTrue(contest.can_see_live_scoreboard(admin))
+        self.assertTrue(self.contest.can_see_live_scoreboard(viewer))
+
+
+class FrozenScoreboardTestCase(TestCase):
+    fixtures = ['language_all.json']
+
+    @classmethod
+    def setUpTestData(self):
+        # Frozen for the last 150 of its 200 days, which started 50 days ago.
+        self.contest = create_contest(key='frozen_scoreboard', frozen_last_minutes=150 * 24 * 60)
+        self.contest_problem = create_contest_problem(contest=self.contest, problem='frozen_scoreboard_a')
+        self.participations = {username: create_contest_participation(contest=self.contest, user=username)
+                               for username in ('first', 'second', 'third')}
+        self.submit('first', 100, days_ago=60)
+        self.submit('second', 50, days_ago=70)
+
+    def setUp(self):
+        cache.clear()
+        self.contest = Contest.objects.get(id=self.contest.id)
+        self.problems = list(self.contest.contest_problems.order_by('order'))
+
+    @classmethod
+    def submit(cls, username, points, days_ago):
+        participation = cls.participations[username]
+        submission = Submission.objects.create(user=participation.user, problem=cls.contest_problem.problem,
+                                               language=Language.get_python3(), status='D', result='AC',
+                                               points=points, case_points=points, case_total=100)
+        Submission.objects.filter(id=submission.id).update(date=timezone.now() - timedelta(days=days_ago))
+        SubmissionTestCase.objects.create(submission=submission, case=1, status='AC', points=points, total=100)
+        ContestSubmission.objects.create(submission=submission, problem=cls.contest_problem,
+                                         participation=participation, points=points)
+        participation = ContestParticipation.objects.get(id=participation.id)
+        participation.contest.format.update_participation(participation)
+        update_scoreboard(participation)
+
+    def live(self):
+        return [(row.username, row.points) for row in get_scoreboard(self.contest, self.problems)]
+
+    def frozen(self):
+        return [(row.username, row.points) for row in get_frozen_scoreboard(self.contest, self.problems)]
+
+    @mock.patch('judge.utils.scoreboard.event.post')
+    def test_frozen(self, post):
+        self.assertTrue(self.contest.is_frozen)
+        self.assertEqual(self.frozen(), [('first', 100), ('second', 50), ('third', 0)])
+        self.live()
+        version = frozen_scoreboard_version(self.contest.id)
+        self.submit('third', 100, days_ago=10)
+        post.assert_not_called()
+        self.assertEqual(frozen_scoreboard_version(self.contest.id), version)
+        self.assertEqual(self.live(), [('first', 100), ('third', 100), ('second', 50)])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.frozen(), [('first', 100), ('second', 50), ('third', 0)])
+
+    def test_graded_after_freeze(self):
+        self.frozen()
+        version = frozen_scoreboard_version(self.contest.id)
+        # A submission made before the freeze, but graded after, still counts.
+        self.submit('third', 80, days_ago=55)
+        self.assertEqual(frozen_scoreboard_version(self.contest.id), version + 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.frozen(), [('first', 100), ('third', 80), ('second', 50)])
+
+    def test_frozen_invalidate(self):
+        self.frozen()
+        version = frozen_scoreboard_version(self.contest.id)
+        invalidate_scoreboard(self.contest.id)
+        self.assertEqual(frozen_scoreboard_version(self.contest.id), version + 1)
+
+    def test_never_live(self):
+        # Changes after the freeze that find no snapshot, and views that rebuild it, never show them.
+        self.submit('third', 100, days_ago=10)
+        self.assertEqual(self.frozen(), [('first', 100), ('second', 50), ('third', 0)])
+        self.submit('second', 100, days_ago=5)
+        self.assertEqual(self.frozen(), [('first', 100), ('second', 50), ('third', 0)])
+        cache.clear()
+        self.assertEqual(self.frozen(), [('first', 100), ('second', 50), ('third', 0)])
+
+    def test_api_frozen(self):
+        Contest.objects.filter(id=self.contest.id).update(is_visible=True)
+        self.submit('third', 100, days_ago=10)
+        frozen = [('first', 100), ('second', 50), ('third', 0)]
+        live = [('first', 100), ('third', 100), ('second', 50)]
+
+        rankings = self.client.get('/api/contest/info/frozen_scoreboard').json()['rankings']
+        self.assertEqual([(row['user'], row['points']) for row in rankings], frozen)
+        rankings = self.client.get('/api/v2/contest/frozen_scoreboard').json()['data']['object']['rankings']
+        self.assertEqual([(row['user'], row['score']) for row in rankings], frozen)
+
+        self.client.force_login(create_user('frozen_api_admin', is_superuser=True))
+        rankings = self.client.get('/api/v2/contest/frozen_scoreboard').json()['data']['object']['rankings']
+        self.assertEqual([(row['user'], row['score']) for row in rankings], live)
+
+    def test_submissions_frozen(self):
+        Contest.objects.filter(id=self.contest.id).update(is_visible=True)
+        Problem.objects.filter(id=self.contest_problem.problem_id).update(is_public=True)
+        self.submit('third', 100, days_ago=10)
+
+        def total(url):
+            return self.client.get(url, {'results': '', 'status': 'AC'}).json()['total']
+
+        self.client.force_login(create_user('frozen_submissions_viewer'))
+        self.assertEqual(total('/submissions/'), 2)
+        self.assertEqual(total('/contest/frozen_scoreboard/submissions/third/'), 0)
+        self.assertEqual(total('/contest/frozen_scoreboard/submissions/second/'), 1)
+
+        self.client.force_login(create_user('frozen_submissions_admin', is_superuser=True))
+        self.assertEqual(total('/submissions/'), 3)
+        self.assertEqual(total('/contest/frozen_scoreboard/submissions/third/'), 1)
@@ -7,6 +7,7 @@ from django.shortcuts import get_object_or_404
 
 from dmoj import settings
 from judge.models import Contest, ContestParticipation, ContestTag, Problem, Profile, Rating, Submission
+from judge.utils.scoreboard import set_frozen_results
 
 
 def sane_time_repr(delta):
@@ -51,6 +52,12 @@ def api_v1_contest_detail(request, contest):
                       .prefetch_related('user__organizations')
                       .annotate(username=F('user__user__username'))
                       .order_by('-score', 'cumtime', 'tiebreaker') if can_see_rankings else [])
+    if can_see_rankings and not contest.can_see_live_scoreboard(request.user):
+        # The rankings are frozen for this user, so only results from before the freeze are shown.
+        participations = list(participations)
+        set_frozen_results(contest, participations)
+        participations.sort(key=lambda participation: (-participation.score, participation.cumtime,
+                                                       participation.tiebreaker))
     can_see_problems = (in_contest or contest.ended or contest.is_editable_by(request.user))
 
     return JsonResponse({
@@ -14,6 +14,7 @@ from judge.models import (
     Submission,
 )
 from judge.utils.raw_sql import join_sql_subquery, use_straight_join
+from judge.utils.scoreboard import set_frozen_results
 from judge.views.submission import group_test_cases
 
 
@@ -207,6 +208,12 @@ class APIContestDetail(APIDetailView):
             )
             .order_by('-score', 'cumtime', 'tiebreaker')
         )
+        if can_see_rankings and not contest.can_see_live_scoreboard(self.request.user):
+            # The rankings are frozen for this user, so only results from before the freeze are shown.
+            participations = list(participations)
+            set_frozen_results(contest, participations)
+            participations.sort(key=lambda participation: (-participation.score, participation.cumtime,
+                                                           participation.tiebreaker))
 
         return {
             'key': contest.key,
@@ -1,3 +1,4 @@
+import csv
 import json
 from calendar import Calendar, SUNDAY
 from collections import defaultdict, namedtuple
@@ -14,11 +15,13 @@ from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
 from django.db import IntegrityError
 from django.db.models import Case, Count, F, FloatField, IntegerField, Max, Min, Q, Sum, Value, When
 from django.db.models.expressions import CombinedExpression
-from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, \
+    StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.template.defaultfilters import date as date_filter
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
@@ -37,12 +40,16 @@ from judge.utils.celery import redirect_to_task_status
 from judge.utils.opengraph import generate_opengraph
 from judge.utils.problems import _get_result_data
 from judge.utils.ranker import ranker
+from judge.utils.scoreboard import deltas_since, export_scoreboard, frozen_scoreboard_version, \
+    get_frozen_scoreboard, get_frozen_scoreboard_snapshot, get_scoreboard, get_scoreboard_snapshot, \
+    make_contest_ranking_profile, scoreboard_rank, scoreboard_row_data, scoreboard_version
 from judge.utils.stats import get_bar_chart, get_pie_chart
 from judge.utils.views import DiggPaginatorMixin, QueryStringSortMixin, SingleObjectFormView, TitleMixin, \
     generic_message
 
 __all__ = ['ContestList', 'ContestDetail', 'ContestRanking', 'ContestJoin', 'ContestLeave', 'ContestCalendar',
            'ContestClone', 'ContestStats', 'ContestMossView', 'ContestMossDelete', 'contest_ranking_ajax',
+           'contest_ranking_json', 'contest_ranking_export',
            'ContestParticipationList', 'ContestParticipationDisqualify', 'get_contest_ranking_list',
            'base_contest_ranking_list']
 
@@ -549,57 +556,32 @@ class ContestStats(TitleMixin, ContestMixin, DetailView):
         return context
 
 
-ContestRankingProfile = namedtuple(
-    'ContestRankingProfile',
-    'id user css_class username points cumtime tiebreaker organization participation '
-    'participation_rating problem_cells result_cell',
-)
-
 BestSolutionData = namedtuple('BestSolutionData', 'code points time state is_pretested')
 
 
-def make_contest_ranking_profile(contest, participation, contest_problems):
-    def display_user_problem(contest_problem):
-        # When the contest format is changed, `format_data` might be invalid.
-        # This will cause `display_user_problem` to error, so we display '???' instead.
-        try:
-            return contest.format.display_user_problem(participation, contest_problem)
-        except (KeyError, TypeError, ValueError):
-            return mark_safe('<td>???</td>')
-
-    user = participation.user
-    return ContestRankingProfile(
-        id=user.id,
-        user=user.user,
-        css_class=user.css_class,
-        username=user.username,
-        points=participation.score,
-        cumtime=participation.cumtime,
-        tiebreaker=participation.tiebreaker,
-        organization=user.organization,
-        participation_rating=participation.rating.rating if hasattr(participation, 'rating') else None,
-        problem_cells=[display_user_problem(contest_problem) for contest_problem in contest_problems],
-        result_cell=contest.format.display_participation_result(participation),
-        participation=participation,
-    )
-
-
 def base_contest_ranking_list(contest, problems, queryset):
     return [make_contest_ranking_profile(contest, participation, problems) for participation in
             queryset.select_related('user__user', 'rating').defer('user__about', 'user__organizations__about')]
 
 
 def contest_ranking_list(contest, problems):
-    return base_contest_ranking_list(contest, problems, contest.users.filter(virtual=0, user__is_unlisted=False)
-                                     .prefetch_related('user__organizations')
-                                     .order_by('is_disqualified', '-score', 'cumtime', 'tiebreaker'))
+    return get_scoreboard(contest, problems)
+
+
+def frozen_contest_ranking_list(contest, problems):
+    return get_frozen_scoreboard(contest, problems)
+
+
+def _is_frozen_for(contest, user):
+    return contest.can_see_full_scoreboard(user) and not contest.can_see_live_scoreboard(user)
 
 
 def get_contest_ranking_list(request, contest, participation=None, ranking_list=contest_ranking_list,
                              show_current_virtual=True, ranker=ranker):
     problems = list(contest.contest_problems.select_related('problem').defer('problem__description').order_by('order'))
 
-    users = ranker(ranking_list(contest, problems), key=attrgetter('points', 'cumtime', 'tiebreaker'))
+    rows = ranking_list(contest, problems)
+    users = ranker(rows, key=attrgetter('points', 'cumtime', 'tiebreaker'))
 
     if show_current_virtual:
         if participation is None and request.user.is_authenticated:
@@ -607,7 +589,14 @@ def get_contest_ranking_list(request, contest, participation=None, ranking_list=
             if participation is None or participation.contest_id != contest.id:
                 participation = None
         if participation is not None and participation.virtual:
-            users = chain([('-', make_contest_ranking_profile(contest, participation, problems))], users)
+            # The live scoreboard is shared by everyone, and only the virtual participation's own row is built, along
+            # with the rank it would have among the live participations.
+            row = make_contest_ranking_profile(contest, participation, problems)
+            rank = '-'
+            if ranking_list in (contest_ranking_list, frozen_contest_ranking_list):
+                rank = format_html('<span title="{0}">({1})</span>', _('Rank among live participants'),
+                                   scoreboard_rank(rows, row))
+            users = chain([(rank, row)], users)
     return users, problems
 
 
@@ -619,13 +608,110 @@ def contest_ranking_ajax(request, contest, participation=None):
     if not contest.can_see_full_scoreboard(request.user):
         raise Http404()
 
-    users, problems = get_contest_ranking_list(request, contest, participation)
-    return render(request, 'contest/ranking-table.html', {
+    # The table only changes with the scoreboard version, except for who is viewing it and, while the contest is
+    # running, which participations have ended, and whether it is frozen for them.
+    frozen = _is_frozen_for(contest, request.user)
+    version = frozen_scoreboard_version(contest.id) if frozen else scoreboard_version(contest.id)
+    etag = '"%s%d-%d-%s"' % ('frozen-' if frozen else '', version, request.user.id or 0,
+                             'ended' if contest.ended else int(timezone.now().timestamp() // 60))
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    users, problems = get_contest_ranking_list(request, contest, participation,
+                                               ranking_list=frozen_contest_ranking_list if frozen else
+                                               contest_ranking_list)
+    response = render(request, 'contest/ranking-table.html', {
         'users': users,
         'problems': problems,
         'contest': contest,
         'has_rating': contest.ratings.exists(),
     })
+    response['ETag'] = etag
+    return response
+
+
+def contest_ranking_json(request, contest):
+    contest, exists = _find_contest(request, contest)
+    if not exists:
+        return HttpResponseBadRequest('Invalid contest', content_type='text/plain')
+
+    if not contest.can_see_full_scoreboard(request.user):
+        raise Http404()
+
+    # Viewers of a frozen scoreboard always get it whole, as it has no deltas.
+    frozen = _is_frozen_for(contest, request.user)
+    etag_format = '"frozen-%d"' if frozen else '"%d"'
+    version = frozen_scoreboard_version(contest.id) if frozen else scoreboard_version(contest.id)
+    response = get_conditional_response(request, etag=etag_format % version)
+    if response is not None:
+        return response
+
+    problems = list(contest.contest_problems.select_related('problem').defer('problem__description').order_by('order'))
+    snapshot = (get_frozen_scoreboard_snapshot if frozen else get_scoreboard_snapshot)(contest, problems)
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        deltas = None
+    else:
+        deltas = deltas_since(snapshot, since)
+
+    # Clients that know the scoreboard at a recent version only get the changes since, and everyone else gets the
+    # whole scoreboard, from which they can follow the deltas posted to the contest's event channel.
+    if deltas is not None:
+        data = {'version': snapshot.version, 'since': since, 'deltas': deltas}
+    else:
+        data = {
+            'version': snapshot.version,
+            'problems': [{'code': problem.problem.code, 'label': contest.get_label_for_problem(index),
+                          'points': problem.points} for index, problem in enumerate(problems)],
+            'rows': [scoreboard_row_data(rank, row) for rank, row in
+                     ranker(snapshot.rows, key=attrgetter('points', 'cumtime', 'tiebreaker'))],
+        }
+    response = JsonResponse(data)
+    response['ETag'] = etag_format % snapshot.version
+    return response
+
+
+class _Echo:
+    # The csv module writes to a file, while a streaming response wants each line returned.
+    def write(self, value):
+        return value
+
+
+def _ranking_csv(contest, problems, rows):
+    writer = csv.writer(_Echo())
+    header = ['rank', 'user', 'score', 'cumulative_time', 'tiebreaker', 'is_disqualified', 'old_rating', 'new_rating']
+    for index in range(len(problems)):
+        label = contest.get_label_for_problem(index)
+        header += ['%s points' % label, '%s time' % label]
+    yield writer.writerow(header)
+
+    # Each format has its own breakdown, but every one has points and time. The rest is only in the NDJSON export.
+    for row in rows:
+        line = [row['rank'], row['user'], row['score'], row['cumulative_time'], row['tiebreaker'],
+                row['is_disqualified'], row['old_rating'], row['new_rating']]
+        for solution in row['solutions']:
+            line += [solution.get('points'), solution.get('time')] if solution else [None, None]
+        yield writer.writerow(line)
+
+
+def contest_ranking_export(request, contest, format):
+    contest, exists = _find_contest(request, contest)
+    if not exists:
+        return HttpResponseBadRequest('Invalid contest', content_type='text/plain')
+
+    if not contest.can_see_live_scoreboard(request.user):
+        raise Http404()
+
+    problems = list(contest.contest_problems.select_related('problem').defer('problem__description').order_by('order'))
+    rows = export_scoreboard(contest, problems)
+    if format == 'csv':
+        response = StreamingHttpResponse(_ranking_csv(contest, problems, rows), content_type='text/csv')
+    else:
+        response = StreamingHttpResponse((json.dumps(row) + '\n' for row in rows), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="%s-ranking.%s"' % (contest.key, format)
+    return response
 
 
 class ContestRankingBase(ContestMixin, TitleMixin, DetailView):
@@ -670,11 +756,14 @@ class ContestRanking(ContestRankingBase):
                 ranker=lambda users, key: ((_('???'), user) for user in users),
             )
 
+        if _is_frozen_for(self.object, self.request.user):
+            return get_contest_ranking_list(self.request, self.object, ranking_list=frozen_contest_ranking_list)
         return get_contest_ranking_list(self.request, self.object)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['has_rating'] = self.object.ratings.exists()
+        context['is_frozen'] = _is_frozen_for(self.object, self.request.user)
         return context
 
 
@@ -687,7 +776,7 @@ class ContestParticipationList(LoginRequiredMixin, ContestRankingBase):
         return _("%s's participation in %s") % (self.profile.username, self.object.name)
 
     def get_ranking_list(self):
-        if not self.object.can_see_full_scoreboard(self.request.user) and self.profile != self.request.profile:
+        if not self.object.can_see_live_scoreboard(self.request.user) and self.profile != self.request.profile:
             raise Http404()
 
         queryset = self.object.users.filter(user=self.profile, virtual__gte=0).order_by('-virtual')
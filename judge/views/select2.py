@@ -107,8 +107,11 @@ class ContestUserSearchSelect2View(UserSearchSelect2View):
         if not contest.is_accessible_by(self.request.user) or not contest.can_see_full_scoreboard(self.request.user):
             raise Http404()
 
-        return Profile.objects.filter(contest_history__contest=contest,
-                                      user__username__icontains=self.term).distinct()
+        participations = Q(contest_history__contest=contest)
+        if not contest.can_see_live_scoreboard(self.request.user):
+            # Joining the contest since the freeze is activity the frozen scoreboard does not give away.
+            participations &= Q(contest_history__real_start__lt=contest.frozen_time)
+        return Profile.objects.filter(participations, user__username__icontains=self.term).distinct()
 
 
 class TicketUserSelect2View(UserSearchSelect2View):
@@ -236,6 +236,9 @@ class SubmissionsListBase(DiggPaginatorMixin, TitleMixin, ListView):
             queryset = queryset.filter(contest_object=self.contest)
             if not self.contest.can_see_full_scoreboard(self.request.user):
                 queryset = queryset.filter(user=self.request.profile)
+            elif not self.contest.can_see_live_scoreboard(self.request.user):
+                # Other users' submissions since the freeze would give away the frozen scoreboard.
+                queryset = queryset.filter(Q(user=self.request.profile) | Q(date__lt=self.contest.frozen_time))
         else:
             queryset = queryset.select_related('contest_object').defer('contest_object__description')
 
@@ -248,6 +251,14 @@ class SubmissionsListBase(DiggPaginatorMixin, TitleMixin, ListView):
                                            Q(contest_object__in=contest_queryset) |
                                            Q(contest_object__isnull=True))
 
+                # Hide other users' submissions since the freeze to contests whose scoreboard is frozen for you.
+                now = timezone.now()
+                for contest in Contest.objects.filter(frozen_last_minutes__gt=0, start_time__lte=now,
+                                                      end_time__gt=now):
+                    if contest.is_frozen and not contest.can_see_live_scoreboard(self.request.user):
+                        queryset = queryset.exclude(~Q(user=self.request.profile), contest_object=contest,
+                                                    date__gte=contest.frozen_time)
+
         if self.selected_languages:
             queryset = queryset.filter(language__in=Language.objects.filter(key__in=self.selected_languages))
         if self.selected_statuses:
@@ -476,6 +487,43 @@ def single_submission(request):
     })
 
 
+def multiple_submissions(request):
+    """
+    Render the rows of several submissions at once, for live updates of submission lists.
+
+    Submissions that do not exist, or whose problems the user cannot see, are left out.
+    """
+    request.no_profile_update = True
+    ids = request.GET.getlist('id')
+    if not ids or len(ids) > SubmissionsListBase.paginate_by or not all(id.isdigit() for id in ids):
+        return HttpResponseBadRequest()
+    try:
+        show_problem = int(request.GET.get('show_problem', '1'))
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    queryset = submission_related(Submission.objects.filter(id__in=ids).order_by('-id'))
+    if show_problem:
+        queryset = queryset.prefetch_related(Prefetch('problem__translations',
+                                                      queryset=ProblemTranslation.objects.filter(
+                                                          language=request.LANGUAGE_CODE), to_attr='_trans'))
+    submissions = list(queryset)
+    accessible = {}
+    for submission in submissions:
+        if submission.problem_id not in accessible:
+            accessible[submission.problem_id] = submission.problem.is_accessible_by(request.user)
+
+    authenticated = request.user.is_authenticated
+    return render(request, 'submission/rows.html', {
+        'submissions': [submission for submission in submissions if accessible[submission.problem_id]],
+        'completed_problem_ids': user_completed_ids(request.profile) if authenticated else [],
+        'editable_problem_ids': user_editable_ids(request.profile) if authenticated else [],
+        'tester_problem_ids': user_tester_ids(request.profile) if authenticated else [],
+        'show_problem': show_problem,
+        'profile_id': request.profile.id if authenticated else 0,
+    })
+
+
 class AllSubmissions(InfinitePaginationMixin, SubmissionsListBase):
     stats_update_interval = 3600
 
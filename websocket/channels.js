@@ -0,0 +1,112 @@
+// Index of which clients listen to which channels, and of the recent messages of every channel, so that posting a
+// message costs in proportion to the listeners of its channel, and catching up in proportion to the messages a
+// client missed, however many clients and channels there are.
+
+function Ring(size) {
+    this.items = new Array(size);
+    this.start = 0;
+    this.length = 0;
+}
+
+Ring.prototype.push = function (item) {
+    if (this.length < this.items.length)
+        this.items[(this.start + this.length++) % this.items.length] = item;
+    else {
+        this.items[this.start] = item;
+        this.start = (this.start + 1) % this.items.length;
+    }
+};
+
+Ring.prototype.forEach = function (callback) {
+    for (var i = 0; i < this.length; ++i)
+        callback(this.items[(this.start + i) % this.items.length]);
+};
+
+Ring.prototype.tail = function () {
+    return this.length ? this.items[(this.start + this.length - 1) % this.items.length] : undefined;
+};
+
+// A client is any object with a got_message(message) method. Clients are told of every message posted to the
+// channels they subscribe to, in order.
+function ChannelIndex(options) {
+    options = options || {};
+    // Number of recent messages kept for every channel.
+    this.history_size = options.history_size || 50;
+    // Number of channels whose recent messages are kept, the least recently posted to being forgotten first.
+    this.max_channels = options.max_channels || 10000;
+    this.last_id = options.start_id || Date.now();
+    // channel -> Set of clients
+    this.subscribers = new Map();
+    // channel -> Ring of recent messages, in order of last post
+    this.history = new Map();
+}
+
+ChannelIndex.prototype.subscribe = function (client, channels) {
+    this.unsubscribe(client);
+    client.channels = channels;
+    channels.forEach(function (channel) {
+        var clients = this.subscribers.get(channel);
+        if (clients === undefined)
+            this.subscribers.set(channel, clients = new Set());
+        clients.add(client);
+    }, this);
+};
+
+ChannelIndex.prototype.unsubscribe = function (client) {
+    if (!client.channels)
+        return;
+    client.channels.forEach(function (channel) {
+        var clients = this.subscribers.get(channel);
+        if (clients !== undefined) {
+            clients.delete(client);
+            if (!clients.size)
+                this.subscribers.delete(channel);
+        }
+    }, this);
+    client.channels = null;
+};
+
+ChannelIndex.prototype.post = function (channel, message) {
+    message = {
+        id: ++this.last_id,
+        channel: channel,
+        message: message
+    };
+
+    var history = this.history.get(channel);
+    if (history === undefined)
+        history = new Ring(this.history_size);
+    else
+        this.history.delete(channel);
+    history.push(message);
+    this.history.set(channel, history);
+    if (this.history.size > this.max_channels)
+        this.history.delete(this.history.keys().next().value);
+
+    var clients = this.subscribers.get(channel);
+    if (clients !== undefined)
+        // Clients may unsubscribe when told, so the set cannot be walked as it is.
+        Array.from(clients).forEach(function (client) {
+            client.got_message(message);
+        });
+    return message;
+};
+
+// Return the messages kept of `channels` that are newer than `last_id`, in order.
+ChannelIndex.prototype.since = function (channels, last_id) {
+    var missed = [];
+    channels.forEach(function (channel) {
+        var history = this.history.get(channel);
+        if (history !== undefined && history.tail().id > last_id)
+            history.forEach(function (message) {
+                if (message.id > last_id)
+                    missed.push(message);
+            });
+    }, this);
+    return missed.sort(function (a, b) {
+        return a.id - b.id;
+    });
+};
+
+module.exports = ChannelIndex;
+module.exports.Ring = Ring;
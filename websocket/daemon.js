@@ -1,15 +1,15 @@
 var config = require('./config');
-var set = require('simplesets').Set;
-var queue = require('qu');
+var ChannelIndex = require('./channels');
 var WebSocketServer = require('ws').Server;
 var wss_receiver = new WebSocketServer({host: config.get_host, port: config.get_port});
 var wss_sender = new WebSocketServer({host: config.post_host, port: config.post_port});
-var messages = new queue();
-var followers = new set();
-var pollers = new set();
-var max_queue = config.max_queue || 50;
 var long_poll_timeout = config.long_poll_timeout || 60000;
-var message_id = Date.now();
+// Followers and pollers are indexed by the channels they listen to, and the last max_queue messages of each of the
+// last max_channels channels posted to are kept for clients to catch up on.
+var messages = new ChannelIndex({
+    history_size: config.max_queue || 50,
+    max_channels: config.max_channels || 10000
+});
 
 if (typeof String.prototype.startsWith != 'function') {
     String.prototype.startsWith = function (str){
@@ -18,32 +18,9 @@ if (typeof String.prototype.startsWith != 'function') {
 }
 
 messages.catch_up = function (client) {
-    this.each(function (message) {
-        if (message.id > client.last_msg)
-            client.got_message(message);
-    });
-};
-
-messages.post = function (channel, message) {
-    message = {
-        id: ++message_id,
-        channel: channel,
-        message: message
-    };
-    this.push(message);
-    if (this.length > max_queue)
-        this.shift();
-    followers.each(function (client) {
+    this.since(client.channels, client.last_msg).forEach(function (message) {
         client.got_message(message);
     });
-    pollers.each(function (request) {
-        request.got_message(message);
-    });
-    return message.id;
-};
-
-messages.last = function () {
-    return this.tail().id;
 };
 
 wss_receiver.on('connection', function (socket) {
@@ -64,7 +41,7 @@ wss_receiver.on('connection', function (socket) {
                     return true;
             })) {
                 socket.filter = filter;
-                followers.add(socket);
+                messages.subscribe(socket, Object.keys(filter));
                 messages.catch_up(socket);
             } else {
                 socket.send(JSON.stringify({
@@ -76,9 +53,9 @@ wss_receiver.on('connection', function (socket) {
         },
     };
 
+    // Only messages of the channels in the socket's filter reach it.
     socket.got_message = function (message) {
-        if (message.channel in socket.filter)
-            socket.send(JSON.stringify(message));
+        socket.send(JSON.stringify(message));
         socket.last_msg = message.id;
     };
 
@@ -105,7 +82,7 @@ wss_receiver.on('connection', function (socket) {
     });
 
     socket.on('close', function(code, message) {
-        followers.remove(socket);
+        messages.unsubscribe(socket);
     });
 });
 
@@ -119,13 +96,28 @@ wss_sender.on('connection', function (socket) {
                 };
             return {
                 status: 'success',
-                id: messages.post(request.channel, request.message)
+                id: messages.post(request.channel, request.message).id
+            };
+        },
+        post_many: function (request) {
+            if (!Array.isArray(request.messages) || !request.messages.every(function (item) {
+                return item && typeof item.channel == 'string';
+            }))
+                return {
+                    status: 'error',
+                    code: 'invalid-channel'
+                };
+            return {
+                status: 'success',
+                ids: request.messages.map(function (item) {
+                    return messages.post(item.channel, item.message).id;
+                })
             };
         },
         last_msg: function (request) {
             return {
                 status: 'success',
-                id: message_id,
+                id: messages.last_id,
             };
         }
     };
@@ -169,36 +161,25 @@ require('http').createServer(function (req, res) {
         return;
     }
 
-    req.channels = {};
-    req.last_msg = parseInt(parts.query.last);
-    if (isNaN(req.last_msg)) req.last_msg = 0;
-
-    channels.forEach(function (channel) {
-        req.channels[channel] = true;
-    });
+    var last_msg = parseInt(parts.query.last);
+    if (isNaN(last_msg)) last_msg = 0;
 
     req.on('close', function () {
-        pollers.remove(req);
+        messages.unsubscribe(req);
     });
 
     req.got_message = function (message) {
-        if (message.channel in req.channels) {
-            res.writeHead(200, {'Content-Type': 'application/json'});
-            res.end(JSON.stringify(message));
-            pollers.remove(req);
-            return true;
-        }
-        return false;
+        res.writeHead(200, {'Content-Type': 'application/json'});
+        res.end(JSON.stringify(message));
+        messages.unsubscribe(req);
     };
-    var got = false;
-    messages.each(function (message) {
-        if (!got && message.id > req.last_msg)
-            got = req.got_message(message);
-    });
-    if (!got) {
-        pollers.add(req);
+    var missed = messages.since(channels, last_msg);
+    if (missed.length)
+        req.got_message(missed[0]);
+    else {
+        messages.subscribe(req, channels);
         res.setTimeout(long_poll_timeout, function () {
-            pollers.remove(req);
+            messages.unsubscribe(req);
             res.writeHead(504, {'Content-Type': 'application/json'});
             res.end('{"error": "timeout"}');
         });
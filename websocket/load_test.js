@@ -0,0 +1,88 @@
+#!/usr/bin/env node
+
+// Measures the cost of posting and catching up with many subscribers, without any sockets: every subscriber is an
+// object counting the messages it is told of. Like the site, most subscribers watch a submission channel of their
+// own, some the submission list, and some a contest.
+//
+// Usage: node load_test.js [subscribers] [posts]
+
+var ChannelIndex = require('./channels');
+
+var subscribers = parseInt(process.argv[2]) || 50000;
+var posts = parseInt(process.argv[3]) || 20000;
+var submissions = Math.floor(subscribers * 0.8);
+var contests = 20;
+
+function Client() {
+    this.received = 0;
+    this.last_msg = 0;
+}
+
+Client.prototype.got_message = function (message) {
+    this.received++;
+    this.last_msg = message.id;
+};
+
+function channels_of(i) {
+    if (i < submissions)
+        return ['sub_' + i];
+    if (i % 2)
+        return ['submissions'];
+    return ['contest_' + (i % contests)];
+}
+
+function channel_of_post(i) {
+    if (i % 4 == 0)
+        return 'submissions';
+    if (i % 4 == 1)
+        return 'contest_' + (i % contests);
+    return 'sub_' + (i * 7919 % submissions);
+}
+
+function elapsed(start) {
+    var time = process.hrtime(start);
+    return time[0] * 1e3 + time[1] / 1e6;
+}
+
+var index = new ChannelIndex({history_size: 50, max_channels: 10000});
+var clients = [];
+var start = process.hrtime();
+for (var i = 0; i < subscribers; ++i) {
+    var client = new Client();
+    index.subscribe(client, channels_of(i));
+    clients.push(client);
+}
+console.log('%d subscribers registered in %s ms', subscribers, elapsed(start).toFixed(1));
+
+start = process.hrtime();
+for (i = 0; i < posts; ++i)
+    index.post(channel_of_post(i), {type: 'update', id: i});
+var indexed = elapsed(start);
+console.log('indexed: %d posts in %s ms, %s us per post', posts, indexed.toFixed(1), (indexed * 1e3 / posts).toFixed(2));
+
+// What every post used to cost: a look at every subscriber.
+var naive_posts = Math.min(posts, 500);
+start = process.hrtime();
+for (i = 0; i < naive_posts; ++i) {
+    var channel = channel_of_post(i);
+    for (var j = 0; j < clients.length; ++j)
+        if (clients[j].channels.indexOf(channel) >= 0)
+            clients[j].got_message({id: 0, channel: channel});
+}
+var naive = elapsed(start);
+console.log('scan:    %d posts in %s ms, %s us per post', naive_posts, naive.toFixed(1),
+            (naive * 1e3 / naive_posts).toFixed(2));
+
+start = process.hrtime();
+var caught_up = 0;
+for (i = 0; i < subscribers; i += 10)
+    caught_up += index.since(clients[i].channels, index.last_id - posts / 2).length;
+console.log('catch up: %d subscribers got %d messages in %s ms', Math.ceil(subscribers / 10), caught_up,
+            elapsed(start).toFixed(1));
+
+start = process.hrtime();
+clients.forEach(function (client) {
+    index.unsubscribe(client);
+});
+console.log('%d subscribers removed in %s ms, %d channels left', subscribers, elapsed(start).toFixed(1),
+            index.subscribers.size);